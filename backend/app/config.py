@@ -1,3 +1,4 @@
+from pydantic import AliasChoices, Field
 from pydantic_settings import BaseSettings
 from functools import lru_cache
 
@@ -15,18 +16,68 @@ class Settings(BaseSettings):
     SMTP_USER: str = ""  # Gmail address
     SMTP_PASSWORD: str = ""  # Gmail App Password
     SMTP_FROM: str = ""  # Same as SMTP_USER usually
+    SMTP_STARTTLS: bool = True  # Disable only for a local stand-in server
+    SMTP_POOL_SIZE: int = 4  # Authenticated sessions kept open (match OUTBOX_EMAIL_CONCURRENCY)
+    SMTP_MAX_MESSAGES_PER_SESSION: int = 100  # Reconnect after this many messages
+    SMTP_MAX_IDLE_SECONDS: float = 60.0  # Drop sessions unused for longer than this
+    SMTP_TIMEOUT: float = 30.0  # Seconds per SMTP operation
     
     # Web Push Notifications (VAPID keys)
     VAPID_PRIVATE_KEY: str = "yUOPEFAijliQeSus_vSnnW7REZRk06Z1zuYWyTYNeGQ="
     VAPID_PUBLIC_KEY: str = "BEJpKLwgDm7pKcIEA85xbHS9mKskZFU0Lujcm1fvcioxm7olRQydUIQ_I5hUYErA9kwHO6wnGKE_7XlGhvu8Cn0="
-    VAPID_EMAIL: str = "mailto:admin@iitj.ac.in"
+    # VAPID_CLAIMS_EMAIL is the name older deployments set
+    VAPID_EMAIL: str = Field("mailto:admin@iitj.ac.in", validation_alias=AliasChoices("VAPID_EMAIL", "VAPID_CLAIMS_EMAIL"))
     
     # Firebase Configuration
     FIREBASE_CREDENTIALS_PATH: str = "./firebase-service-account.json"  # Path to firebase-service-account.json
+    FCM_MAX_WORKERS: int = 64  # Max FCM sends in flight during a multicast
+    FCM_REQUEST_TIMEOUT: float = 10.0  # Seconds per FCM HTTP request
+    FCM_TOPIC_MODE: bool = False  # Keep per-doctor FCM topics and send one topic message per doctor event
+    FCM_TOPIC_SYNC_MINUTES: int = 360  # Re-add every doctor subscription to its topic (topic mode safety net)
+    FCM_API_URL: str = "https://fcm.googleapis.com"  # FCM HTTP v1 API (point at a stand-in to test offline)
+    FCM_IID_URL: str = "https://iid.googleapis.com"  # Instance ID API used for topic membership
     
     # Scheduler Settings
     SCRAPER_INTERVAL_HOURS: int = 3
-    NOTIFICATION_INTERVAL_MINUTES: int = 1
+    SCRAPER_INTERVAL_MINUTES: int = 0  # Scrape every N minutes instead (0 = use SCRAPER_INTERVAL_HOURS)
+    NOTIFICATION_INTERVAL_MINUTES: int = 1  # Polling interval when the planner is disabled
+    NOTIFICATION_PLANNER: bool = True  # Fire notifications at planned times instead of polling
+    NOTIFICATION_LEAD_MINUTES: int = 60  # How long before a doctor starts to notify
+    RECIPIENT_INDEX_REFRESH_MINUTES: int = 15  # Reload the in-memory recipient index from the database
+    
+    # Notification Outbox Settings
+    OUTBOX_POLL_SECONDS: float = 60.0  # Longest idle wait between queue checks (enqueues wake workers at once)
+    OUTBOX_SWEEP_MINUTES: int = 5  # Dead-letter expired messages and release abandoned claims
+    OUTBOX_EMAIL_CONCURRENCY: int = 4  # Max emails in flight
+    OUTBOX_WEBPUSH_CONCURRENCY: int = 16  # Max web pushes in flight
+    OUTBOX_FCM_CONCURRENCY: int = 64  # Max FCM sends in flight (keep <= FCM_MAX_WORKERS, the connection pool size)
+    OUTBOX_MAX_ATTEMPTS: int = 5  # Attempts before a message is dead-lettered
+    OUTBOX_RETRY_BASE_SECONDS: float = 15.0  # First retry delay, doubled on every further failure
+    OUTBOX_RETRY_MAX_SECONDS: float = 600.0  # Cap on the retry delay
+    
+    # Outbound Rate Limits (sustained sends per second and burst size per channel, 0 = unlimited)
+    RATE_LIMIT_EMAIL_PER_SECOND: float = 1.0
+    RATE_LIMIT_EMAIL_BURST: int = 10
+    RATE_LIMIT_WEBPUSH_PER_SECOND: float = 50.0
+    RATE_LIMIT_WEBPUSH_BURST: int = 100
+    RATE_LIMIT_FCM_PER_SECOND: float = 500.0
+    RATE_LIMIT_FCM_BURST: int = 1000
+    SMTP_THROTTLE_PAUSE_SECONDS: float = 60.0  # Pause email sends after an SMTP 421/45x throttling reply
+    
+    # Scraper HTTP Settings
+    SCRAPER_PAGE_URL: str = "https://iitj.ac.in/health-center/en/doctors-schedule"  # Page embedding the published sheet
+    SCRAPER_MAX_WORKERS: int = 8  # Max sheets fetched concurrently
+    SCRAPER_REQUEST_TIMEOUT: float = 15.0  # Seconds per HTTP request
+    SCRAPER_SHEET_CACHE: bool = True  # Skip re-parsing sheets that have not changed
+    SCRAPER_SOURCE: str = "html"  # "html" (published HTML page) or "csv" (sheet CSV export, HTML when it looks wrong)
+    SCRAPER_PARSER: str = "lxml"  # HTML parser: "lxml" (lxml DOM row walker) or "pandas" (legacy read_html)
+    
+    # Schedule Sync Settings
+    SCHEDULE_CHANGE_RETENTION_DAYS: int = 14  # Change log kept for /schedules/changes; older clients resync in full
+    
+    # Live Events (SSE) Settings
+    EVENTS_HEARTBEAT_SECONDS: float = 15.0  # Keep-alive comment interval on idle /events streams
+    EVENTS_CLIENT_QUEUE_SIZE: int = 100  # Events buffered per client before a stalled client is dropped
     
     # App Settings
     APP_NAME: str = "IITJ Doctor Schedule API"
@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Text, Boolean
+from sqlalchemy import create_engine, inspect, text, Column, Integer, String, Date, DateTime, Text, Boolean, Index, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
@@ -15,6 +15,10 @@ engine = create_engine(
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Rows or ids per statement in batched writes and IN (...) lookups,
+# below SQLite's bound-parameter limit
+SQL_BATCH_SIZE = 500
+
 # Base class for models
 Base = declarative_base()
 
@@ -28,8 +32,18 @@ class Schedule(Base):
     timing = Column(String)
     category = Column(String)  # "Regular/Dentist" or "Visiting Specialist"
     room = Column(String, nullable=True)
+    # Normalized from date/timing at ingestion so lookups don't parse strings
+    schedule_date = Column(Date, nullable=True)
+    start_minute = Column(Integer, nullable=True)  # Minutes after midnight
+    end_minute = Column(Integer, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        Index("ix_schedules_schedule_date_start_minute", "schedule_date", "start_minute"),
+        # Keyset pagination order for /schedules
+        Index("ix_schedules_schedule_date_id", "schedule_date", "id"),
+    )
 
 class Subscription(Base):
     __tablename__ = "subscriptions"
@@ -58,9 +72,67 @@ class DoctorSubscription(Base):
     doctor_name = Column(String, index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+class ScheduleChange(Base):
+    __tablename__ = "schedule_changes"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    version = Column(Integer, index=True)  # Schedule version: one per scrape that changed the table
+    op = Column(String)  # "upsert", "delete" or "reset" (full reload: clients must resync)
+    schedule_id = Column(Integer, nullable=True)
+    data = Column(Text, nullable=True)  # Upserts: JSON of the row as /schedules returns it
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class NotificationDelivery(Base):
+    """One message to one recipient for one doctor event: the outbox row and its delivery record."""
+    __tablename__ = "notification_deliveries"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    event_key = Column(String)  # Doctor start event, see notification_service.doctor_event_key
+    channel = Column(String)  # "email", "webpush", "fcm", "fcm_topic" or "fcm_membership"
+    recipient = Column(String)  # Email address, subscription id, device id, topic or FCM token
+    status = Column(String, default="pending")  # "pending", "sending" (claimed by a worker), "sent" or "dead"
+    payload = Column(Text, nullable=True)  # JSON the channel's sender needs
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=True)  # Undelivered after this (the doctor has started): dead
+    last_error = Column(Text, nullable=True)
+    claim_token = Column(String, nullable=True)
+    claimed_at = Column(DateTime, nullable=True)
+    sent_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        UniqueConstraint("event_key", "channel", "recipient", name="uq_notification_deliveries_event_channel_recipient"),
+        # Workers poll for due rows per channel
+        Index("ix_notification_deliveries_channel_status_next_attempt", "channel", "status", "next_attempt_at"),
+    )
+
+def _upgrade_schema():
+    """
+    Add columns and indexes introduced after a table was first created.
+    create_all() only creates missing tables, so existing databases need this.
+    """
+    inspector = inspect(engine)
+    existing_tables = inspector.get_table_names()
+    
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        
+        existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+        with engine.begin() as conn:
+            for column in table.columns:
+                if column.name not in existing_columns:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+        
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
 # Create all tables
 def init_db():
     Base.metadata.create_all(bind=engine)
+    _upgrade_schema()
 
 # Dependency to get database session
 def get_db():
@@ -0,0 +1,17 @@
+"""Shared factory for the keep-alive HTTP sessions used by the scraper and the senders."""
+import requests
+from requests.adapters import HTTPAdapter
+
+def create_session(pool_size: int, pool_connections: int = None) -> requests.Session:
+    """
+    Create a keep-alive HTTP session whose connection pool fits its worker pool.
+
+    Args:
+        pool_size: Connections kept open per host (the number of concurrent requests)
+        pool_connections: Hosts to keep pools for (defaults to pool_size)
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_connections or pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
@@ -4,7 +4,9 @@ from contextlib import asynccontextmanager
 from app.config import get_settings
 from app.database import init_db
 from app.scheduler import start_scheduler, stop_scheduler
-from app.routes import schedule, notifications
+from app.routes import schedule, notifications, events
+from app.services.event_stream import event_broker
+import asyncio
 import logging
 
 # Configure logging
@@ -27,6 +29,7 @@ async def lifespan(app: FastAPI):
     from app.services.fcm_service import initialize_firebase
     initialize_firebase()
     
+    event_broker.attach(asyncio.get_running_loop())  # Live /events stream
     start_scheduler()  # Start background scheduler
     logger.info("Application started successfully")
     
@@ -35,6 +38,7 @@ async def lifespan(app: FastAPI):
     # Shutdown
     logger.info("Shutting down application...")
     stop_scheduler()
+    event_broker.close()
     logger.info("Application shut down")
 
 # Create FastAPI app
@@ -57,6 +61,7 @@ app.add_middleware(
 # Include routers
 app.include_router(schedule.router, tags=["Schedule"])
 app.include_router(notifications.router, tags=["Notifications"])
+app.include_router(events.router, tags=["Events"])
 
 # Import and include FCM router
 from app.routes import fcm
@@ -72,4 +77,5 @@ async def full_health():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # Open /events streams never finish on their own: cut them off on shutdown
+    uvicorn.run(app, host="0.0.0.0", port=8000, timeout_graceful_shutdown=10)
@@ -0,0 +1,52 @@
+from fastapi import APIRouter, Header, Query
+from fastapi.responses import StreamingResponse
+from app.services.event_stream import event_broker
+from typing import List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+# Client reconnect delay (ms) sent at the start of every stream
+RETRY_MS = 5000
+
+async def _event_source(doctors, last_event_id):
+    # Registered here, so the finally below always pairs with it
+    subscriber = event_broker.subscribe(doctors, last_event_id)
+    try:
+        yield f"retry: {RETRY_MS}\n\n".encode("utf-8")
+        while True:
+            payload = await subscriber.queue.get()
+            if payload is None:  # Dropped or shutting down
+                break
+            yield payload
+    finally:
+        event_broker.unsubscribe(subscriber)
+
+@router.get("/events")
+async def stream_events(
+    doctor: Optional[List[str]] = Query(None, description="Only alerts for these doctors (repeatable)"),
+    last_event_id: Optional[str] = Header(None)
+):
+    """
+    Server-Sent Events stream of live updates.
+
+    Events: "schedules" ({"version"}) when a scrape changed the schedule (fetch
+    /schedules/changes?since=<your version>), and "alert" when a doctor is about
+    to start, for every doctor or only those given with ?doctor=. Reconnecting
+    clients send Last-Event-ID (browsers do this automatically) to receive
+    recent events they missed.
+    """
+    try:
+        last_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_id = None
+
+    return StreamingResponse(
+        _event_source(doctor or (), last_id),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # Stop nginx-style proxies buffering the stream
+        }
+    )
@@ -1,12 +1,16 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from app.database import get_db, FCMToken, DoctorSubscription
+from app.services.recipient_index import recipient_index
+from app.services.fcm_topics import add_device_to_topics, move_token_topics, remove_device_from_topic
+from app.config import get_settings
 from pydantic import BaseModel
 from typing import Optional
 import logging
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
+settings = get_settings()
 
 class RegisterTokenRequest(BaseModel):
     device_id: str
@@ -31,8 +35,19 @@ def register_fcm_token(request: RegisterTokenRequest, db: Session = Depends(get_
         
         if existing:
             # Update existing token
+            old_token = existing.fcm_token
             existing.fcm_token = request.fcm_token
             db.commit()
+            recipient_index.set_fcm_token(request.device_id, request.fcm_token)
+            
+            if settings.FCM_TOPIC_MODE and old_token != request.fcm_token:
+                # Topic membership belongs to the token, so carry it over to the new one
+                doctor_names = [
+                    row.doctor_name for row in db.query(DoctorSubscription.doctor_name).filter(
+                        DoctorSubscription.device_id == request.device_id
+                    ).all()
+                ]
+                move_token_topics(db, request.device_id, old_token, doctor_names)
             
             return {
                 "status": "success",
@@ -48,6 +63,17 @@ def register_fcm_token(request: RegisterTokenRequest, db: Session = Depends(get_
             db.add(new_token)
             db.commit()
             db.refresh(new_token)
+            recipient_index.set_fcm_token(request.device_id, request.fcm_token)
+            
+            if settings.FCM_TOPIC_MODE:
+                # Doctors subscribed to before the device had a token
+                doctor_names = [
+                    row.doctor_name for row in db.query(DoctorSubscription.doctor_name).filter(
+                        DoctorSubscription.device_id == request.device_id
+                    ).all()
+                ]
+                if doctor_names:
+                    add_device_to_topics(db, request.device_id, doctor_names)
             
             return {
                 "status": "success",
@@ -85,6 +111,10 @@ def subscribe_doctor(request: SubscribeDoctorRequest, db: Session = Depends(get_
         )
         db.add(subscription)
         db.commit()
+        recipient_index.add_doctor_subscription(request.device_id, request.doctor_name)
+        
+        if settings.FCM_TOPIC_MODE:
+            add_device_to_topics(db, request.device_id, [request.doctor_name])
         
         return {
             "status": "success",
@@ -112,6 +142,10 @@ def unsubscribe_doctor(request: UnsubscribeDoctorRequest, db: Session = Depends(
         
         db.delete(subscription)
         db.commit()
+        recipient_index.remove_doctor_subscription(request.device_id, request.doctor_name)
+        
+        if settings.FCM_TOPIC_MODE:
+            remove_device_from_topic(db, request.device_id, request.doctor_name)
         
         return {
             "status": "success",
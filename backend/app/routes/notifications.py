@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from app.database import get_db, Subscription
+from app.services.recipient_index import recipient_index
 from pydantic import BaseModel, EmailStr
 from typing import Optional
 import json
@@ -41,6 +42,7 @@ def subscribe(request: SubscribeRequest, db: Session = Depends(get_db)):
                 existing.push_subscription = json.dumps(request.push_subscription)
             existing.is_active = True
             db.commit()
+            recipient_index.set_subscriber(existing)
             
             return {
                 "status": "success",
@@ -57,6 +59,7 @@ def subscribe(request: SubscribeRequest, db: Session = Depends(get_db)):
             db.add(new_sub)
             db.commit()
             db.refresh(new_sub)
+            recipient_index.set_subscriber(new_sub)
             
             return {
                 "status": "success",
@@ -91,6 +94,7 @@ def unsubscribe(request: UnsubscribeRequest, db: Session = Depends(get_db)):
         
         subscription.is_active = False
         db.commit()
+        recipient_index.set_subscriber(subscription)
         
         return {
             "status": "success",
@@ -125,6 +129,18 @@ def get_subscriptions(db: Session = Depends(get_db)):
         "data": results
     }
 
+@router.get("/notification-queue")
+def notification_queue(db: Session = Depends(get_db)):
+    """
+    Outbox metrics: queue depth, age of the oldest waiting message,
+    per-channel counts of pending, sending, sent and dead (dead-lettered) messages,
+    and how long sends have waited on each channel's rate limiter.
+    """
+    from app.services.delivery_ledger import queue_metrics
+    from app.services.rate_limit import rate_limit_stats
+    
+    return {**queue_metrics(db), "rate_limits": rate_limit_stats()}
+
 @router.post("/test-notification")
 def send_test_notification(
     doctor_name: Optional[str] = None,
@@ -143,6 +159,7 @@ def send_test_notification(
     try:
         from app.database import FCMToken, DoctorSubscription
         from app.services.fcm_rest import send_fcm_multicast_rest
+        from app.services.fcm_tokens import prune_fcm_tokens
         
         fcm_tokens = []
         
@@ -190,6 +207,7 @@ def send_test_notification(
         }
         
         result = send_fcm_multicast_rest(fcm_tokens, title, body, data)
+        pruned = prune_fcm_tokens(db, result['invalid_tokens'])
         
         logger.info(f"Test notification sent: {result['success']} success, {result['failure']} failed")
         
@@ -199,6 +217,7 @@ def send_test_notification(
             "tokens_sent": len(fcm_tokens),
             "success_count": result['success'],
             "failure_count": result['failure'],
+            "pruned_tokens": pruned['tokens'],
             "doctor_name": doctor_name if doctor_name else "N/A"
         }
         
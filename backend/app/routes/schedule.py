@@ -1,7 +1,13 @@
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
-from app.database import get_db, Schedule
+from app.database import get_db
 from app.services.scraper_service import scrape_and_save
+from app.services.fcm_tokens import pruned_totals
+from app.services.schedule_snapshot import schedule_snapshot, etag_matches
+from app.services.schedule_changes import changes_since
+from app.services.schedule_query import MAX_PAGE_SIZE, parse_date_param, parse_fields, query_schedules
+from app.scraper.notification_logic import parse_schedule_date
 from typing import Optional
 import logging
 
@@ -13,52 +19,105 @@ def health_check():
     """Health check endpoint for monitoring."""
     return {
         "status": "healthy",
-        "service": "IITJ Doctor Schedule API"
+        "service": "IITJ Doctor Schedule API",
+        "pruned_fcm_tokens": pruned_totals["tokens"]
     }
 
 @router.get("/schedules")
 def get_schedules(
     date: Optional[str] = Query(None, description="Filter by date (format: DD/MM/YYYY)"),
+    date_from: Optional[str] = Query(None, alias="from", description="First date, inclusive (DD/MM/YYYY or YYYY-MM-DD)"),
+    date_to: Optional[str] = Query(None, alias="to", description="Last date, inclusive (DD/MM/YYYY or YYYY-MM-DD)"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Rows per page"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return, e.g. name,timing,date"),
+    if_none_match: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None),
     db: Session = Depends(get_db)
 ):
     """
     Get all doctor schedules, optionally filtered by date.
-    """
-    query = db.query(Schedule)
+    Served from the in-memory snapshot as pre-serialized JSON with a strong ETag;
+    a matching If-None-Match gets 304 Not Modified. The body is sent gzip or
+    brotli compressed when Accept-Encoding allows, from the stored variants.
     
-    if date:
-        # Filter by date (partial match since our date includes day name)
-        query = query.filter(Schedule.date.contains(date))
+    With from/to, limit, cursor or fields, rows come from a keyset-paged query
+    instead, in date order, at most MAX_PAGE_SIZE per page, with next_cursor
+    pointing at the next page.
+    """
+    snapshot = schedule_snapshot.get(db)
     
-    schedules = query.all()
+    if any(param is not None for param in (date_from, date_to, limit, cursor, fields)):
+        try:
+            first = parse_date_param(date_from) if date_from else None
+            last = parse_date_param(date_to) if date_to else None
+            date_fragment = None
+            if date:
+                schedule_date = parse_schedule_date(date)
+                if schedule_date:
+                    first = last = schedule_date
+                else:
+                    date_fragment = date
+            page = query_schedules(
+                db,
+                date_from=first,
+                date_to=last,
+                date_fragment=date_fragment,
+                cursor=cursor,
+                limit=limit,
+                **({"fields": parse_fields(fields)} if fields else {})
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return JSONResponse(page, headers={"X-Schedule-Version": str(snapshot.version)})
     
-    # Convert to dict
-    results = []
-    for s in schedules:
-        results.append({
-            "id": s.id,
-            "date": s.date,
-            "name": s.name,
-            "timing": s.timing,
-            "category": s.category,
-            "room": s.room,
-            "created_at": s.created_at.isoformat() if s.created_at else None,
-            "updated_at": s.updated_at.isoformat() if s.updated_at else None
-        })
+    if date:
+        schedule_date = parse_schedule_date(date)
+        if schedule_date:
+            result = snapshot.for_date(schedule_date)
+        else:
+            # Not a full DD/MM/YYYY date: partial match since our date includes day name
+            result = snapshot.matching(date)
+    else:
+        result = snapshot.full
     
-    return {
-        "count": len(results),
-        "data": results
+    # Stored pre-compressed: choosing an encoding costs nothing per request
+    encoding, body, etag = result.variant(accept_encoding)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "no-cache",  # Cache, but revalidate every time
+        "Vary": "Accept-Encoding",
+        "X-Schedule-Version": str(snapshot.version)
     }
+    if any(etag_matches(if_none_match, variant_etag) for variant_etag in result.etags()):
+        return Response(status_code=304, headers=headers)
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@router.get("/schedules/changes")
+def get_schedule_changes(
+    since: int = Query(..., description="Schedule version of the client's last sync (X-Schedule-Version / version)"),
+    db: Session = Depends(get_db)
+):
+    """
+    Delta sync: schedules upserted and ids deleted after version `since`.
+    With full_resync set, the change log cannot bring the client up to date
+    and it should fetch /schedules again.
+    """
+    return changes_since(db, since)
 
 @router.post("/ingest-scraped-data")
-def ingest_data(db: Session = Depends(get_db)):
+def ingest_data(
+    full_reload: bool = Query(False, description="Replace all schedules instead of applying a diff"),
+    db: Session = Depends(get_db)
+):
     """
     Manually trigger the scraper and save data to database.
     Useful for GitHub Actions or manual refreshes.
     """
     logger.info("Manual scrape triggered via API")
-    result = scrape_and_save(db)
+    result = scrape_and_save(db, full_reload=full_reload)
     return result
 
 @router.get("/")
@@ -69,6 +128,8 @@ def root():
         "version": "1.0.0",
         "endpoints": {
             "schedules": "/schedules?date=DD/MM/YYYY",
+            "changes": "/schedules/changes?since=VERSION",
+            "events": "/events?doctor=NAME (Server-Sent Events)",
             "ingest": "/ingest-scraped-data (POST)",
             "subscribe": "/subscribe (POST)",
             "health": "/health"
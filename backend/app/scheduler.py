@@ -2,8 +2,18 @@ from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.interval import IntervalTrigger
 from app.config import get_settings
 from app.database import SessionLocal
-from app.services.scraper_service import scrape_and_save
+from app.services.scraper_service import scrape_and_save, add_schedule_listener
 from app.services.notification_service import check_and_notify
+from app.services.notification_planner import planner
+from app.services.schedule_snapshot import schedule_snapshot
+from app.services.event_stream import publish_schedule_version
+from app.services.delivery_ledger import purge_deliveries, sweep_deliveries
+from app.services.schedule_changes import compact_changes
+from app.services.recipient_index import recipient_index
+from app.services.fcm_topics import sync_topic_subscriptions
+from app.services.outbox import outbox
+from app.services.smtp_pool import close_smtp_pool
+from datetime import datetime, timedelta
 import logging
 
 logger = logging.getLogger(__name__)
@@ -18,6 +28,12 @@ def run_scraper_job():
     try:
         result = scrape_and_save(db)
         logger.info(f"Scraper job completed: {result}")
+        purged = purge_deliveries(db)
+        if purged:
+            logger.info(f"Purged {purged} old notification delivery records")
+        compacted = compact_changes(db, timedelta(days=settings.SCHEDULE_CHANGE_RETENTION_DAYS))
+        if compacted:
+            logger.info(f"Compacted {compacted} old schedule change log entries")
     except Exception as e:
         logger.error(f"Scraper job failed: {str(e)}")
     finally:
@@ -34,32 +50,124 @@ def run_notification_job():
     finally:
         db.close()
 
+def run_recipient_index_job():
+    """Job to reload the recipient index, picking up other processes' subscription writes."""
+    db = SessionLocal()
+    try:
+        recipient_index.load(db)
+    except Exception as e:
+        logger.error(f"Recipient index refresh failed: {str(e)}")
+    finally:
+        db.close()
+
+def run_outbox_sweep_job():
+    """Job to dead-letter expired outbox messages and release abandoned claims."""
+    db = SessionLocal()
+    try:
+        swept = sweep_deliveries(db)
+        if swept["expired"] or swept["reclaimed"]:
+            logger.info(f"Outbox sweep: {swept['expired']} expired, {swept['reclaimed']} reclaimed")
+        if swept["reclaimed"]:
+            outbox.wake()
+    except Exception as e:
+        logger.error(f"Outbox sweep failed: {str(e)}")
+    finally:
+        db.close()
+
+def run_topic_sync_job():
+    """Job to put existing doctor subscriptions into their FCM topics."""
+    db = SessionLocal()
+    try:
+        sync_topic_subscriptions(db)
+    except Exception as e:
+        logger.error(f"FCM topic sync failed: {str(e)}")
+    finally:
+        db.close()
+
 def start_scheduler():
     """Initialize and start the scheduler."""
     logger.info("Starting APScheduler...")
     
-    # Add scraper job - runs every N hours
+    # Add scraper job - runs every N minutes if set, otherwise every N hours
+    # (unchanged sheets are skipped cheaply, so short intervals are fine)
+    if settings.SCRAPER_INTERVAL_MINUTES > 0:
+        scraper_trigger = IntervalTrigger(minutes=settings.SCRAPER_INTERVAL_MINUTES)
+    else:
+        scraper_trigger = IntervalTrigger(hours=settings.SCRAPER_INTERVAL_HOURS)
     scheduler.add_job(
         run_scraper_job,
-        trigger=IntervalTrigger(hours=settings.SCRAPER_INTERVAL_HOURS),
+        trigger=scraper_trigger,
         id="scraper_job",
         name="Scrape doctor schedules",
         replace_existing=True
     )
     
-    # Add notification job - runs every N minutes
+    # Publish a new /schedules snapshot whenever a scrape changes the schedule,
+    # then tell /events clients about the new version
+    add_schedule_listener(schedule_snapshot.on_schedules_changed)
+    add_schedule_listener(publish_schedule_version)
+    
+    if settings.NOTIFICATION_PLANNER:
+        # Notifications fire at planned times; the timeline is rebuilt whenever a scrape changes the schedule
+        add_schedule_listener(planner.on_schedules_changed)
+    else:
+        # Add notification job - runs every N minutes
+        scheduler.add_job(
+            run_notification_job,
+            trigger=IntervalTrigger(minutes=settings.NOTIFICATION_INTERVAL_MINUTES),
+            id="notification_job",
+            name="Check upcoming doctors and notify",
+            replace_existing=True
+        )
+    
+    # Keep the in-memory recipient index in sync with the database
     scheduler.add_job(
-        run_notification_job,
-        trigger=IntervalTrigger(minutes=settings.NOTIFICATION_INTERVAL_MINUTES),
-        id="notification_job",
-        name="Check upcoming doctors and notify",
+        run_recipient_index_job,
+        trigger=IntervalTrigger(minutes=settings.RECIPIENT_INDEX_REFRESH_MINUTES),
+        id="recipient_index_job",
+        name="Reload notification recipient index",
         replace_existing=True
     )
     
+    if settings.FCM_TOPIC_MODE:
+        # In the background now (subscriptions made before topic mode was enabled),
+        # then periodically for memberships whose retries were dead-lettered
+        scheduler.add_job(
+            run_topic_sync_job,
+            trigger=IntervalTrigger(minutes=settings.FCM_TOPIC_SYNC_MINUTES),
+            next_run_time=datetime.now(),
+            id="fcm_topic_sync_job",
+            name="Sync doctor subscriptions to FCM topics",
+            replace_existing=True
+        )
+    
     # Run scraper immediately on startup
     run_scraper_job()
+    run_recipient_index_job()
+    
+    # One-off, in the background: build (and compress) the /schedules snapshot before the first request
+    scheduler.add_job(
+        schedule_snapshot.get,
+        id="schedule_snapshot_job",
+        name="Build /schedules snapshot",
+        replace_existing=True
+    )
+    
+    # Deliver queued notifications (including any left over from before a restart)
+    outbox.start()
+    scheduler.add_job(
+        run_outbox_sweep_job,
+        trigger=IntervalTrigger(minutes=settings.OUTBOX_SWEEP_MINUTES),
+        id="outbox_sweep_job",
+        name="Sweep expired and abandoned outbox messages",
+        replace_existing=True
+    )
     
     scheduler.start()
+    
+    if settings.NOTIFICATION_PLANNER:
+        planner.start(scheduler)
+    
     logger.info("Scheduler started successfully")
 
 def stop_scheduler():
@@ -67,3 +175,5 @@ def stop_scheduler():
     if scheduler.running:
         scheduler.shutdown()
         logger.info("Scheduler stopped")
+    outbox.stop()
+    close_smtp_pool()
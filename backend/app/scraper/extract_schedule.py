@@ -1,18 +1,289 @@
 import requests
 from bs4 import BeautifulSoup
-import pandas as pd
 import html
 import re
 from io import StringIO
 from urllib.parse import urlparse, parse_qs, urlencode, urlunparse
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
 import json
+import threading
+from app.config import get_settings
+from app.http_client import create_session
+from app.scraper.sheet_parser import csv_matches_layout, iter_csv_records, iter_sheet_records, row_to_records
 
-def extract_schedule():
-    url = "https://iitj.ac.in/health-center/en/doctors-schedule"
+settings = get_settings()
+
+# Per-sheet cache of the last successful extraction, keyed by gid (or page URL).
+# Holds the HTTP validators and a body hash so unchanged sheets skip parsing.
+_sheet_cache = {}
+_sheet_cache_lock = threading.Lock()
+
+class CSVExportMismatch(ValueError):
+    """A CSV export arrived but cannot be trusted; the sheet is read from its HTML page instead."""
+
+def sheet_cache_key(page_url: str, gid: str) -> str:
+    """Sheets are identified by gid when the JS router provides one, else by URL."""
+    return gid or page_url
+
+def sheet_csv_url(pub_url: str, gid: str):
+    """
+    Build the CSV export URL for one sheet of a published spreadsheet.
+    
+    .../spreadsheets/d/e/<id>/pubhtml?gid=0 -> .../spreadsheets/d/e/<id>/pub?gid=<gid>&single=true&output=csv
+    
+    Returns:
+        str: Export URL, or None if `pub_url` is not a published sheet URL
+    """
+    parsed = urlparse(pub_url)
+    path = re.sub(r"/pubhtml(/.*)?$", "/pub", parsed.path)
+    if path == parsed.path or not gid:
+        return None
+    query = urlencode({"gid": gid, "single": "true", "output": "csv"})
+    return urlunparse((parsed.scheme, parsed.netloc, path, "", query, ""))
+
+def fetch_sheet(session: requests.Session, name: str, page_url: str, timeout: float, cached: dict = None):
+    """
+    Fetch a single sheet page, conditionally if we have validators from a previous scrape.
+    
+    Returns:
+        dict: {"not_modified": True} on 304, otherwise the body with its
+              ETag, Last-Modified and content hash. None if the request failed.
+    """
+    headers = {}
+    if cached:
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+    
+    try:
+        resp = session.get(page_url, timeout=timeout, headers=headers)
+        if resp.status_code == 304:
+            return {"not_modified": True}
+        resp.raise_for_status()
+        if "charset" not in resp.headers.get("Content-Type", ""):
+            # Google omits the charset on CSV exports; requests would assume Latin-1
+            resp.encoding = "utf-8"
+        return {
+            "not_modified": False,
+            "text": resp.text,
+            "etag": resp.headers.get("ETag"),
+            "last_modified": resp.headers.get("Last-Modified"),
+            "content_hash": hashlib.sha256(resp.content).hexdigest(),
+        }
+    except Exception as e:
+        print(f"  -> Failed to fetch sheet {name}: {e}")
+        return None
+
+def fetch_sheet_source(session: requests.Session, sheet: tuple, timeout: float, cached: dict = None, csv_base: str = None):
+    """
+    Fetch one sheet, preferring its CSV export and falling back to the published HTML
+    if the export cannot be fetched (see _process_sheet for exports that cannot be parsed).
+    
+    Validators from `cached` are only sent to the source they were recorded for.
+    
+    Returns:
+        dict: fetch_sheet() result with a "source" of "csv" or "html", or None
+    """
+    name, page_url, gid = sheet
+    csv_url = sheet_csv_url(csv_base, gid) if csv_base else None
+    
+    if csv_url:
+        fetched = fetch_sheet(session, name, csv_url, timeout, cached if cached and cached["source"] == "csv" else None)
+        if fetched is not None:
+            fetched["source"] = "csv"
+            return fetched
+        print(f"  -> CSV export failed for {name}, falling back to HTML")
+    
+    fetched = fetch_sheet(session, name, page_url, timeout, cached if cached and cached["source"] == "html" else None)
+    if fetched is not None:
+        fetched["source"] = "html"
+    return fetched
+
+def fetch_sheets(session: requests.Session, sheets: list, max_workers: int, timeout: float, cache: dict = None, csv_base: str = None) -> list:
+    """
+    Fetch all sheets concurrently over a shared session.
+    
+    Args:
+        session: Pooled HTTP session
+        sheets: List of (name, page_url, gid) tuples
+        max_workers: Maximum number of sheets in flight at once
+        timeout: Per-request timeout in seconds
+        cache: Optional {sheet_cache_key: entry} used for conditional requests
+        csv_base: Published spreadsheet URL; when set, sheets are fetched as CSV exports
+    
+    Returns:
+        list: fetch_sheet_source() result for each sheet, in the same order as `sheets`
+    """
+    cache = cache or {}
+    if not sheets:
+        return []
+    
+    workers = max(1, min(max_workers, len(sheets)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sheet-fetch") as executor:
+        # map() yields results in submission order regardless of completion order
+        return list(executor.map(
+            lambda sheet: fetch_sheet_source(
+                session, sheet, timeout,
+                cache.get(sheet_cache_key(sheet[1], sheet[2])),
+                csv_base
+            ),
+            sheets
+        ))
+
+def frame_to_records(df) -> list:
+    """
+    Transform a parsed sheet DataFrame into clean doctor records for the App.
+    
+    Returns:
+        list: Dicts with date, name, timing, category and room
+    """
+    # Replace NaN with None for valid JSON
+    import numpy as np
+    df = df.replace({np.nan: None})
+    
+    clean_records = []
+    for row in df.to_dict(orient='records'):
+        sheet_name = row.get("Sheet Name")
+        if not sheet_name:
+            continue
+        clean_records.extend(row_to_records(row, sheet_name))
+    return clean_records
+
+def parse_sheet(name: str, sheet_html: str, parser: str):
+    """
+    Parse one sheet page into clean doctor records.
+    
+    Args:
+        name: Sheet title (the schedule date)
+        sheet_html: Published sheet HTML, or its CSV export when parser is "csv"
+        parser: "lxml" for the lxml DOM row walker, "pandas" for read_html,
+                "csv" for a CSV export
+    
+    Returns:
+        tuple: (records, DataFrame or None), or None if the page has no table
+    
+    Raises:
+        CSVExportMismatch: The CSV export has unexpected columns or no records
+    """
+    if parser == "csv":
+        if not csv_matches_layout(sheet_html):
+            raise CSVExportMismatch("CSV export columns do not match the sheet layout")
+        records = list(iter_csv_records(name, sheet_html))
+        if not records:
+            raise CSVExportMismatch("CSV export has no doctor records")
+        return records, None
+    
+    if parser == "pandas":
+        # pandas is only imported when the legacy path is selected
+        import pandas as pd
+        
+        # header=1 usually effectively captures the column names in these sheets
+        sheet_dfs = pd.read_html(StringIO(sheet_html), header=1)
+        if not sheet_dfs:
+            return None
+        df = sheet_dfs[0]
+        df['Sheet Name'] = name # Add Date/Sheet name as a column
+        # Clean up empty rows if any
+        df.dropna(how='all', inplace=True)
+        return frame_to_records(df), df
+    
+    records = list(iter_sheet_records(name, sheet_html))
+    return records, None
+
+def _process_sheet(session: requests.Session, sheet: tuple, fetched: dict, previous_cache: dict, timeout: float):
+    """
+    Turn one fetched sheet into its cache entry (records, frame and validators).
+    
+    Unchanged sheets reuse the previous entry without parsing. A CSV export that
+    parses into the wrong columns or no records is replaced by the sheet's HTML page.
+    
+    Returns:
+        tuple: (entry, reused), or (None, False) if the sheet could not be read
+    """
+    name, page_url, gid = sheet
+    if fetched is None:
+        return None, False
+    
+    parser = "csv" if fetched.get("source") == "csv" else settings.SCRAPER_PARSER
+    cached = previous_cache.get(sheet_cache_key(page_url, gid))
+    if cached and (cached["source"] != fetched["source"] or cached["parser"] != parser):
+        cached = None
+    
+    # Reuse the previous extraction if the server says nothing changed
+    # or the body hashes to the same content as last time
+    if cached and (fetched.get("not_modified") or fetched.get("content_hash") == cached["content_hash"]):
+        print(f"Sheet unchanged, reusing {len(cached['records'])} records: {name}")
+        entry = dict(cached)
+        if not fetched.get("not_modified"):
+            entry["etag"] = fetched.get("etag") or cached["etag"]
+            entry["last_modified"] = fetched.get("last_modified") or cached["last_modified"]
+        return entry, True
+    
+    if fetched.get("not_modified"):
+        # 304 without anything cached to reuse (e.g. cache was cleared meanwhile)
+        print(f"  -> Sheet {name} not modified but not cached, skipping")
+        return None, False
+    
+    print(f"Parsing sheet: {name}")
+    try:
+        parsed_sheet = parse_sheet(name, fetched["text"], parser)
+    except CSVExportMismatch as e:
+        print(f"  -> {e}, falling back to HTML")
+        html_cached = previous_cache.get(sheet_cache_key(page_url, gid))
+        html_fetched = fetch_sheet(
+            session, name, page_url, timeout,
+            html_cached if html_cached and html_cached["source"] == "html" else None
+        )
+        if html_fetched is not None:
+            html_fetched["source"] = "html"
+        return _process_sheet(session, sheet, html_fetched, previous_cache, timeout)
+    except Exception as e:
+        print(f"  -> Failed to parse: {e}")
+        return None, False
+    
+    if not parsed_sheet:
+        print("  -> No table found in this sheet")
+        return None, False
+    
+    records, df = parsed_sheet
+    print(f"  -> Extracted {len(records)} doctors")
+    return {
+        "source": fetched["source"],
+        "parser": parser,
+        "etag": fetched.get("etag"),
+        "last_modified": fetched.get("last_modified"),
+        "content_hash": fetched["content_hash"],
+        "frame": df,
+        "records": records,
+    }, False
+
+def extract_schedule(failed_sheets: set = None):
+    """
+    Scrape every sheet of the published schedule.
+    
+    Args:
+        failed_sheets: Optional set that receives the names of sheets that could
+                       not be read and had no cached records to stand in for them.
+                       Their dates are missing from the result, not emptied.
+    
+    Returns:
+        list: Clean doctor records, or None if the page or its iframe failed
+    """
+    url = settings.SCRAPER_PAGE_URL
     print(f"Fetching {url}...")
     
+    timeout = settings.SCRAPER_REQUEST_TIMEOUT
+    session = create_session(settings.SCRAPER_MAX_WORKERS)
     try:
-        response = requests.get(url, verify=False)
+        return _extract_schedule(session, url, timeout, failed_sheets)
+    finally:
+        session.close()
+
+def _extract_schedule(session: requests.Session, url: str, timeout: float, failed_sheets: set = None):
+    try:
+        response = session.get(url, verify=False, timeout=timeout)
         response.raise_for_status()
     except requests.exceptions.RequestException as e:
         print(f"Error fetching page: {e}")
@@ -50,7 +321,7 @@ def extract_schedule():
 
     # 3. Fetch the iframe content (Google Sheets published HTML)
     try:
-        iframe_resp = requests.get(clean_src)
+        iframe_resp = session.get(clean_src, timeout=timeout)
         iframe_resp.raise_for_status()
     except Exception as e:
         print(f"Error fetching iframe: {e}")
@@ -66,93 +337,79 @@ def extract_schedule():
         print("No sheet items found in the JS. The format might have changed.")
         return
 
-    all_schedules = []
-
+    sheets = []
     for name, page_url, gid in matches:
         # Clean up the extracted strings (JS escaping)
         name = name.replace(r'\/', '/')
         page_url = page_url.replace(r'\/', '/')
         page_url = page_url.replace(r'\x3d', '=')
-        
-        print(f"Fetching sheet: {name}")
-        
-        try:
-            sheet_resp = requests.get(page_url)
-            sheet_resp.raise_for_status()
-            
-            # Parse the table in the sheet
-            # header=1 usually effectively captures the column names in these sheets
-            sheet_dfs = pd.read_html(StringIO(sheet_resp.text), header=1)
-            
-            if sheet_dfs:
-                df = sheet_dfs[0]
-                df['Sheet Name'] = name # Add Date/Sheet name as a column
-                all_schedules.append(df)
-                print(f"  -> Extracted {len(df)} rows")
-            else:
-                print("  -> No table found in this sheet")
-                
-        except Exception as e:
-            print(f"  -> Failed to fetch/parse: {e}")
+        sheets.append((name, page_url, gid))
 
-    # 5. Combine and Save
-    # 5. Combine and Save
-    if all_schedules:
-        final_df = pd.concat(all_schedules, ignore_index=True)
+    previous_cache = {}
+    if settings.SCRAPER_SHEET_CACHE:
+        with _sheet_cache_lock:
+            previous_cache = dict(_sheet_cache)
+
+    # CSV exports are a fraction of the size of the published HTML pages
+    csv_base = clean_src if settings.SCRAPER_SOURCE == "csv" else None
+
+    print(f"Fetching {len(sheets)} sheets as {settings.SCRAPER_SOURCE} (up to {settings.SCRAPER_MAX_WORKERS} at a time)...")
+    sheet_pages = fetch_sheets(session, sheets, settings.SCRAPER_MAX_WORKERS, timeout, previous_cache, csv_base)
+
+    all_schedules = []
+    clean_records = []
+    parsed = 0
+    reused = 0
+    stale = 0
+    next_cache = {}
+
+    for sheet, fetched in zip(sheets, sheet_pages):
+        entry, reused_sheet = _process_sheet(session, sheet, fetched, previous_cache, timeout)
+        key = sheet_cache_key(sheet[1], sheet[2])
+        if entry is None:
+            # A sheet that failed this time is not an empty day: keep serving
+            # its last good records, or report it so its rows are not deleted
+            entry = previous_cache.get(key)
+            if entry is None:
+                if failed_sheets is not None:
+                    failed_sheets.add(sheet[0])
+                continue
+            print(f"  -> Keeping {len(entry['records'])} records from the last scrape of {sheet[0]}")
+            reused_sheet = True
+            stale += 1
         
-        # Clean up empty rows if any
-        final_df.dropna(how='all', inplace=True)
+        next_cache[key] = entry
+        if entry["frame"] is not None:
+            all_schedules.append(entry["frame"])
+        clean_records.extend(entry["records"])
+        if reused_sheet:
+            reused += 1
+        else:
+            parsed += 1
+
+    if settings.SCRAPER_SHEET_CACHE:
+        # Sheets that disappeared from the workbook drop out of the cache
+        with _sheet_cache_lock:
+            _sheet_cache.clear()
+            _sheet_cache.update(next_cache)
 
-        print(f"\nExtracted {len(final_df)} total records.")
+    # 5. Combine and Save
+    if clean_records:
+        print(
+            f"\nExtracted {len(clean_records)} total doctors "
+            f"({reused} of {parsed + reused} sheets unchanged, {stale} kept from the last scrape)."
+        )
         
         # Determine output file path
         outfile_csv = "doctors_schedule.csv"
         outfile_json = "schedule.json"
         
-        # Save CSV for legacy/debugging
-        final_df.to_csv(outfile_csv, index=False)
-        print(f"Saved schedule to {outfile_csv}")
-        
-        # Replace NaN with None for valid JSON
-        import numpy as np
-        final_df = final_df.replace({np.nan: None})
-        
-        # Transform into a clean list for the App
-        records = final_df.to_dict(orient='records')
-        clean_records = []
-        for row in records:
-            sheet_name = row.get("Sheet Name")
-            if not sheet_name:
-                continue
-                
-            # Helper to extract and clean doctor info
-            def add_doctor(name_key, time_key, category):
-                name = row.get(name_key)
-                timing = row.get(time_key)
-                
-                # Filter out header rows or empty rows that pandas might have caught as partials
-                if not name or not isinstance(name, str) or name.upper() in ["DOCTOR'S NAME", "S.NO"]:
-                    return
-                if not timing or not isinstance(timing, str) or timing.upper() == "TIMING":
-                    return
-                    
-                clean_records.append({
-                    "date": sheet_name,
-                    "name": name,
-                    "timing": timing,
-                    "category": category,
-                    "room": row.get(name_key.replace(".1", ".2"), ""), # Best guess mapping
-                    # Add raw timestamp for sorting if needed, but string date is okay for now
-                })
-
-            # Map the columns correctly based on inspection
-            # REGULAR DOCTORS/ DENTIST.1 -> Name
-            # REGULAR DOCTORS/ DENTIST.3 -> Timing
-            add_doctor("REGULAR DOCTORS/ DENTIST.1", "REGULAR DOCTORS/ DENTIST.3", "Regular/Dentist")
-            
-            # VISITING SPECIALISTS DOCTORS.1 -> Name
-            # VISITING SPECIALISTS DOCTORS.4 -> Timing
-            add_doctor("VISITING SPECIALISTS DOCTORS.1", "VISITING SPECIALISTS DOCTORS.4", "Visiting Specialist")
+        if all_schedules:
+            # Save CSV for legacy/debugging (pandas parser only)
+            import pandas as pd
+            final_df = pd.concat(all_schedules, ignore_index=True)
+            final_df.to_csv(outfile_csv, index=False)
+            print(f"Saved schedule to {outfile_csv}")
 
         # Save Clean JSON for Web App
         with open(outfile_json, 'w') as f:
@@ -1,5 +1,5 @@
 import re
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 
 def parse_time_range(time_str):
     """
@@ -39,6 +39,24 @@ def parse_time_range(time_str):
         return start_time, end_time
     return None
 
+def parse_schedule_date(date_str):
+    """
+    Parses sheet dates like "31/01/2026 SATURDAY".
+    Returns a datetime.date, or None.
+    """
+    if not isinstance(date_str, str):
+        return None
+    
+    match = re.search(r"(\d{1,2})/(\d{1,2})/(\d{4})", date_str)
+    if not match:
+        return None
+    
+    day, month, year = (int(part) for part in match.groups())
+    try:
+        return date(year, month, day)
+    except ValueError:
+        return None
+
 def check_upcoming_doctors(schedule_data, current_dt=None):
     """
     Checks schedule_data for doctors starting within the next hour.
@@ -0,0 +1,215 @@
+"""
+Lightweight Google Sheets table parser built directly on lxml.
+
+Parses a published sheet into an lxml tree once, then walks its table rows
+and yields clean doctor records without going through pandas (the whole
+document is held in memory; only the records are produced lazily). Column naming, colspan/rowspan expansion, whitespace
+clean-up and NA handling follow pd.read_html(..., header=1) so both paths
+produce the same records. The CSV export of a sheet is parsed into the same
+column names, so it can stand in for the published HTML.
+"""
+import csv
+import re
+from io import StringIO
+from lxml import html as lxml_html
+
+# Header row index, same meaning as read_html(header=1)
+HEADER_ROW = 1
+
+# (name column, timing column, category) - see extract_schedule for the mapping
+DOCTOR_COLUMNS = [
+    ("REGULAR DOCTORS/ DENTIST.1", "REGULAR DOCTORS/ DENTIST.3", "Regular/Dentist"),
+    ("VISITING SPECIALISTS DOCTORS.1", "VISITING SPECIALISTS DOCTORS.4", "Visiting Specialist"),
+]
+
+# Strings pandas reads as NaN by default
+NA_VALUES = {
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan",
+    "1.#IND", "1.#QNAN", "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a",
+    "nan", "null",
+}
+
+_RE_WHITESPACE = re.compile(r"[\r\n]+|\s{2,}")
+
+def row_to_records(row: dict, sheet_name: str) -> list:
+    """
+    Extract doctor records from one sheet row.
+
+    Args:
+        row: Column name -> cell value (None for empty cells)
+        sheet_name: Sheet title, used as the record date
+
+    Returns:
+        list: Zero, one or two records (regular and visiting doctor)
+    """
+    records = []
+    for name_key, time_key, category in DOCTOR_COLUMNS:
+        name = row.get(name_key)
+        timing = row.get(time_key)
+
+        # Filter out header rows or empty rows that were caught as partials
+        if not name or not isinstance(name, str) or name.upper() in ["DOCTOR'S NAME", "S.NO"]:
+            continue
+        if not timing or not isinstance(timing, str) or timing.upper() == "TIMING":
+            continue
+
+        records.append({
+            "date": sheet_name,
+            "name": name,
+            "timing": timing,
+            "category": category,
+            "room": row.get(name_key.replace(".1", ".2"), ""), # Best guess mapping
+        })
+    return records
+
+def _cell_text(cell) -> str:
+    return _RE_WHITESPACE.sub(" ", cell.text_content().strip())
+
+def _find_table(doc):
+    """First visible table with any text, with hidden elements dropped."""
+    for table in doc.iter("table"):
+        if "display:none" in table.get("style", "").replace(" ", ""):
+            continue
+        for elem in table.xpath(".//style"):
+            elem.drop_tree()
+        for elem in table.xpath(".//*[@style]"):
+            if "display:none" in elem.get("style", "").replace(" ", ""):
+                elem.drop_tree()
+        if table.text_content().strip():
+            return table
+    return None
+
+def _iter_table_rows(table):
+    """Yield each <tr> as a list of cell texts with colspan/rowspan expanded."""
+    trs = table.xpath(".//thead/tr") + table.xpath(".//tbody//tr|./tr") + table.xpath(".//tfoot/tr")
+    remainder = []  # (column index, text, rows left) carried over by rowspan
+
+    for tr in trs:
+        texts = []
+        next_remainder = []
+        index = 0
+        for td in tr.xpath("./td|./th"):
+            while remainder and remainder[0][0] <= index:
+                prev_i, prev_text, prev_rowspan = remainder.pop(0)
+                texts.append(prev_text)
+                if prev_rowspan > 1:
+                    next_remainder.append((prev_i, prev_text, prev_rowspan - 1))
+                index += 1
+
+            text = _cell_text(td)
+            rowspan = int(td.get("rowspan") or 1)
+            colspan = int(td.get("colspan") or 1)
+            for _ in range(colspan):
+                texts.append(text)
+                if rowspan > 1:
+                    next_remainder.append((index, text, rowspan - 1))
+                index += 1
+
+        for prev_i, prev_text, prev_rowspan in remainder:
+            texts.append(prev_text)
+            if prev_rowspan > 1:
+                next_remainder.append((prev_i, prev_text, prev_rowspan - 1))
+
+        yield texts
+        remainder = next_remainder
+
+def _column_names(header: list) -> list:
+    """Name columns like pandas: blanks become 'Unnamed: i', duplicates get .1, .2, ..."""
+    names = []
+    counts = {}
+    for i, text in enumerate(header):
+        name = text if text else f"Unnamed: {i}"
+        count = counts.get(name, 0)
+        while count > 0:
+            counts[name] = count + 1
+            name = f"{name}.{count}"
+            count = counts.get(name, 0)
+        counts[name] = count + 1
+        names.append(name)
+    return names
+
+def iter_sheet_rows(sheet_html: str):
+    """
+    Yield the data rows of a published sheet as dicts keyed by column name.
+
+    Empty and NA-like cells are returned as None.
+    """
+    doc = lxml_html.fromstring(sheet_html)
+    for br in doc.iter("br"):
+        br.tail = "\n" + (br.tail or "")
+
+    table = _find_table(doc)
+    if table is None:
+        return
+
+    columns = None
+    for i, texts in enumerate(_iter_table_rows(table)):
+        if i < HEADER_ROW:
+            continue
+        if i == HEADER_ROW:
+            columns = _column_names(texts)
+            continue
+        if not texts:
+            continue
+        yield {
+            column: (None if value in NA_VALUES else value)
+            for column, value in zip(columns, texts)
+        }
+
+def iter_sheet_records(sheet_name: str, sheet_html: str):
+    """Yield clean {date, name, timing, category, room} records for one sheet."""
+    for row in iter_sheet_rows(sheet_html):
+        yield from row_to_records(row, sheet_name)
+
+def iter_csv_rows(sheet_csv: str):
+    """
+    Yield the data rows of a sheet's CSV export as dicts keyed by column name.
+
+    The CSV has no column-letter row, so its first row is the header. Merged
+    title cells only carry their text in the first column; the blank cells
+    after a title inherit it so the names line up with the HTML table
+    (e.g. "REGULAR DOCTORS/ DENTIST.1" .. ".3").
+    """
+    reader = csv.reader(StringIO(sheet_csv))
+    header = next(reader, None)
+    if header is None:
+        return
+
+    filled = []
+    title = ""
+    for cell in header:
+        text = _RE_WHITESPACE.sub(" ", cell.strip())
+        if text:
+            title = text
+        filled.append(text or title)
+    columns = _column_names(filled)
+
+    for cells in reader:
+        if not cells:
+            continue
+        yield {
+            column: (None if value in NA_VALUES else value)
+            for column, value in zip(columns, (_RE_WHITESPACE.sub(" ", cell.strip()) for cell in cells))
+        }
+
+def csv_matches_layout(sheet_csv: str) -> bool:
+    """
+    Whether a CSV export has the column layout the record mapping expects.
+
+    The first data row holds the sub-headers, so each doctor block's name and
+    timing columns must read "DOCTOR'S NAME" and "TIMING". Hidden or inserted
+    columns shift them, and the export is then not trusted.
+    """
+    first_row = next(iter_csv_rows(sheet_csv), None)
+    if first_row is None:
+        return False
+    return all(
+        (first_row.get(name_key) or "").upper() == "DOCTOR'S NAME"
+        and (first_row.get(time_key) or "").upper() == "TIMING"
+        for name_key, time_key, _ in DOCTOR_COLUMNS
+    )
+
+def iter_csv_records(sheet_name: str, sheet_csv: str):
+    """Yield clean {date, name, timing, category, room} records from a CSV export."""
+    for row in iter_csv_rows(sheet_csv):
+        yield from row_to_records(row, sheet_name)
@@ -0,0 +1,243 @@
+"""
+Persistent delivery ledger, doubling as the outbound notification queue (outbox).
+
+Every message is a notification_deliveries row, unique per (event_key, channel,
+recipient), so each doctor-start event reaches each recipient once per channel:
+  1. enqueue_deliveries()     - insert "pending" rows; rows already queued for the
+                                event are left alone
+  2. claim_due_deliveries()   - a worker moves due rows to "sending" under its own
+                                claim token, so no two workers send the same row
+  3. update_deliveries()      - record the outcome: "sent", back to "pending" with a
+                                later next_attempt_at, or "dead"
+Rows past expires_at are never claimed. sweep_deliveries(), run periodically,
+marks them "dead" and releases claims left behind by a worker that died
+mid-send (after CLAIM_TIMEOUT), so idle workers only ever read.
+"""
+from sqlalchemy import case, delete, func, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.database import NotificationDelivery, SQL_BATCH_SIZE
+from datetime import datetime, timedelta
+import json
+import logging
+import uuid
+
+logger = logging.getLogger(__name__)
+
+CLAIM_TIMEOUT = timedelta(minutes=10)
+
+def _pending_filter(channel: str, now: datetime) -> tuple:
+    """Conditions for a pending row of `channel` that is still worth sending at `now`."""
+    return (
+        NotificationDelivery.channel == channel,
+        NotificationDelivery.status == "pending",
+        # Too late to be useful once the doctor has started; sweep_deliveries marks these dead
+        or_(NotificationDelivery.expires_at.is_(None), NotificationDelivery.expires_at >= now)
+    )
+
+def _due_filter(channel: str, now: datetime) -> tuple:
+    """Conditions for a pending row of `channel` that may be sent at `now`."""
+    return _pending_filter(channel, now) + (NotificationDelivery.next_attempt_at <= now,)
+
+def _insert_ignoring_conflicts(db: Session, rows: list):
+    """INSERT rows, silently skipping ones that violate the unique constraint."""
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        dialect_insert = None
+
+    if dialect_insert is not None:
+        db.execute(dialect_insert(NotificationDelivery).on_conflict_do_nothing(), rows)
+        return
+
+    # Generic fallback: one savepoint per row
+    for row in rows:
+        try:
+            with db.begin_nested():
+                db.execute(insert(NotificationDelivery), [row])
+        except IntegrityError:
+            pass
+
+def enqueue_deliveries(db: Session, event_key: str, channel: str, payloads: dict, expires_at: datetime = None):
+    """
+    Queue one message per recipient unless it was already queued for this event.
+
+    Args:
+        db: Database session (committed by this call)
+        event_key: Doctor start event
+        channel: "email", "webpush", "fcm", "fcm_topic" or "fcm_membership"
+        payloads: Recipient identifier -> JSON-serializable payload for the channel's sender
+        expires_at: When the message stops being worth sending (UTC)
+    """
+    now = datetime.utcnow()
+    rows = [
+        {
+            "event_key": event_key,
+            "channel": channel,
+            "recipient": recipient,
+            "status": "pending",
+            "payload": json.dumps(payload),
+            "attempts": 0,
+            "next_attempt_at": now,
+            "expires_at": expires_at,
+            "created_at": now
+        }
+        for recipient, payload in payloads.items()
+        if recipient
+    ]
+    for i in range(0, len(rows), SQL_BATCH_SIZE):
+        _insert_ignoring_conflicts(db, rows[i:i + SQL_BATCH_SIZE])
+    db.commit()
+
+def claim_due_deliveries(db: Session, channel: str, limit: int, by_recipient: bool = False) -> list:
+    """
+    Claim up to `limit` pending rows of a channel whose next attempt is due.
+
+    Args:
+        db: Database session (committed by this call)
+        channel: Channel to claim from
+        limit: Max rows to claim, or with by_recipient, max recipients
+        by_recipient: Claim every due row of each recipient taken, so all their
+                      messages can be coalesced into one
+
+    Returns:
+        list: Claimed rows as dicts with id, event_key, recipient, payload (parsed) and attempts
+    """
+    now = datetime.utcnow()
+
+    due = select(NotificationDelivery.id).where(*_due_filter(channel, now))
+    if by_recipient:
+        recipients = select(NotificationDelivery.recipient).where(
+            *_due_filter(channel, now)
+        ).group_by(NotificationDelivery.recipient).order_by(
+            func.min(NotificationDelivery.next_attempt_at)
+        ).limit(limit)
+        due = due.where(NotificationDelivery.recipient.in_(recipients))
+    else:
+        due = due.order_by(NotificationDelivery.next_attempt_at).limit(limit)
+    due_ids = list(db.execute(due).scalars())
+    if not due_ids:
+        # Nothing written, so nothing to commit (and no write lock taken)
+        db.rollback()
+        return []
+
+    # Only rows still pending are taken, so concurrent workers never share a row
+    token = uuid.uuid4().hex
+    db.execute(
+        update(NotificationDelivery).where(
+            NotificationDelivery.id.in_(due_ids),
+            NotificationDelivery.status == "pending"
+        ).values(status="sending", claim_token=token, claimed_at=now)
+    )
+    rows = db.execute(
+        select(
+            NotificationDelivery.id, NotificationDelivery.event_key, NotificationDelivery.recipient,
+            NotificationDelivery.payload, NotificationDelivery.attempts
+        ).where(NotificationDelivery.claim_token == token)
+    ).all()
+    db.commit()
+
+    return [
+        {
+            "id": row.id,
+            "event_key": row.event_key,
+            "recipient": row.recipient,
+            "payload": json.loads(row.payload) if row.payload else {},
+            "attempts": row.attempts or 0
+        }
+        for row in rows
+    ]
+
+def next_due_at(db: Session, channel: str):
+    """When the earliest sendable pending row of a channel is due (None if the channel is empty)."""
+    return db.execute(
+        select(func.min(NotificationDelivery.next_attempt_at)).where(*_pending_filter(channel, datetime.utcnow()))
+    ).scalar()
+
+def sweep_deliveries(db: Session) -> dict:
+    """
+    Dead-letter expired rows and release abandoned claims, for every channel (committed by this call).
+
+    Returns:
+        dict: Number of rows "expired" and "reclaimed"
+    """
+    now = datetime.utcnow()
+    # Too late to be useful: the doctor has already started
+    expired = db.execute(
+        update(NotificationDelivery).where(
+            NotificationDelivery.status.in_(("pending", "sending")),
+            NotificationDelivery.expires_at < now
+        ).values(status="dead", last_error="expired", claim_token=None)
+    )
+    # Abandoned claims (worker crashed mid-send) become claimable again
+    reclaimed = db.execute(
+        update(NotificationDelivery).where(
+            NotificationDelivery.status == "sending",
+            NotificationDelivery.claimed_at < now - CLAIM_TIMEOUT
+        ).values(status="pending", claim_token=None)
+    )
+    db.commit()
+    return {"expired": expired.rowcount, "reclaimed": reclaimed.rowcount}
+
+def update_deliveries(db: Session, updates: list):
+    """
+    Write outcomes for claimed rows (committed by this call).
+
+    Args:
+        db: Database session
+        updates: Dicts with "id" plus the columns to set (status, attempts, next_attempt_at, ...)
+    """
+    for i in range(0, len(updates), SQL_BATCH_SIZE):
+        # ORM bulk UPDATE by primary key: one executemany per batch
+        db.execute(update(NotificationDelivery), updates[i:i + SQL_BATCH_SIZE])
+    db.commit()
+
+def queue_metrics(db: Session) -> dict:
+    """
+    Outbox depth and age per channel.
+
+    Returns:
+        dict: Per channel, the row count by status and the age in seconds of the
+              oldest message still waiting, plus the total depth (pending + sending)
+    """
+    now = datetime.utcnow()
+    waiting = NotificationDelivery.status.in_(("pending", "sending"))
+    rows = db.execute(
+        select(
+            NotificationDelivery.channel,
+            NotificationDelivery.status,
+            func.count(),
+            func.min(case((waiting, NotificationDelivery.created_at)))
+        ).group_by(NotificationDelivery.channel, NotificationDelivery.status)
+    ).all()
+
+    channels = {}
+    for channel, status, count, oldest in rows:
+        stats = channels.setdefault(channel, {
+            "pending": 0, "sending": 0, "sent": 0, "dead": 0, "oldest_waiting_seconds": None
+        })
+        stats[status] = count
+        if oldest is not None:
+            age = round((now - oldest).total_seconds(), 1)
+            stats["oldest_waiting_seconds"] = max(stats["oldest_waiting_seconds"] or 0, age)
+
+    ages = [s["oldest_waiting_seconds"] for s in channels.values() if s["oldest_waiting_seconds"] is not None]
+    return {
+        "depth": sum(s["pending"] + s["sending"] for s in channels.values()),
+        "oldest_waiting_seconds": max(ages) if ages else None,
+        "channels": channels
+    }
+
+def purge_deliveries(db: Session, older_than: timedelta = timedelta(days=2)) -> int:
+    """Delete ledger rows for events long past (committed by this call)."""
+    result = db.execute(
+        delete(NotificationDelivery).where(
+            func.coalesce(NotificationDelivery.created_at, NotificationDelivery.claimed_at)
+            < datetime.utcnow() - older_than
+        )
+    )
+    db.commit()
+    return result.rowcount
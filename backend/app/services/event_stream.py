@@ -0,0 +1,166 @@
+"""
+Live events for Server-Sent Events clients (GET /events).
+
+Each connected client is just a small asyncio queue on the event loop, so
+thousands of idle connections cost little. Producers run in scheduler
+threads and hand events over with call_soon_threadsafe. On the loop, each
+event is encoded to its SSE wire form once and the same bytes are queued for
+every interested client. Clients that filter by doctor are indexed by doctor
+name, so an alert only touches its own subscribers.
+
+Events:
+    schedules   {"version": N} after a scrape changed the schedule
+    alert       upcoming doctor (name, category, starts_in_minutes, time_range),
+                sent when the notification planner fires
+A short history is kept so reconnecting clients (Last-Event-ID) get what they
+missed, and one shared heartbeat keeps idle connections open through proxies.
+"""
+from app.config import get_settings
+from collections import deque
+import asyncio
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Events kept for Last-Event-ID replay
+HISTORY_SIZE = 256
+
+HEARTBEAT = b": keepalive\n\n"
+
+class Subscriber:
+    """One SSE connection: its queue of encoded events and optional doctor filter."""
+
+    __slots__ = ("queue", "doctors")
+
+    def __init__(self, doctors: frozenset, queue_size: int):
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.doctors = doctors  # Empty: every alert
+
+class EventBroker:
+    """Fans events out to SSE subscribers; all state is touched on the event loop only."""
+
+    def __init__(self, heartbeat_seconds: float, queue_size: int):
+        self.heartbeat_seconds = heartbeat_seconds
+        self.queue_size = queue_size
+        self._loop = None
+        self._heartbeat_task = None
+        self._seq = 0
+        self._history = deque(maxlen=HISTORY_SIZE)  # (id, doctor or None, bytes)
+        self._subscribers = set()
+        self._unfiltered = set()
+        self._by_doctor = {}  # doctor name -> set of Subscribers
+
+    # Lifecycle (called from the app lifespan, on the loop)
+
+    def attach(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+        self._heartbeat_task = loop.create_task(self._heartbeat())
+
+    def close(self):
+        """End every stream (so shutdown is not held up by open connections)."""
+        if self._heartbeat_task:
+            self._heartbeat_task.cancel()
+        for subscriber in list(self._subscribers):
+            self._drop(subscriber)
+        self._loop = None
+
+    # Producers (any thread)
+
+    def publish(self, event: str, data: dict, doctor: str = None):
+        """Queue an event for every interested client; a no-op before the app has started."""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            loop.call_soon_threadsafe(self._fan_out, event, data, doctor)
+        except RuntimeError:
+            pass  # Loop shut down meanwhile
+
+    # Subscribers (on the loop)
+
+    def subscribe(self, doctors=(), last_event_id: int = None) -> Subscriber:
+        """Register a client; with last_event_id, events it missed are queued first."""
+        subscriber = Subscriber(frozenset(doctors or ()), self.queue_size)
+        if last_event_id is not None:
+            for event_id, doctor, payload in self._history:
+                if event_id > last_event_id and self._wants(subscriber, doctor):
+                    self._offer(subscriber, payload)
+
+        self._subscribers.add(subscriber)
+        if subscriber.doctors:
+            for doctor in subscriber.doctors:
+                self._by_doctor.setdefault(doctor, set()).add(subscriber)
+        else:
+            self._unfiltered.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self._subscribers.discard(subscriber)
+        self._unfiltered.discard(subscriber)
+        for doctor in subscriber.doctors:
+            members = self._by_doctor.get(doctor)
+            if members is not None:
+                members.discard(subscriber)
+                if not members:
+                    del self._by_doctor[doctor]
+
+    def stats(self) -> dict:
+        return {"clients": len(self._subscribers), "last_event_id": self._seq}
+
+    # Internals (on the loop)
+
+    @staticmethod
+    def _wants(subscriber: Subscriber, doctor: str) -> bool:
+        return doctor is None or not subscriber.doctors or doctor in subscriber.doctors
+
+    def _fan_out(self, event: str, data: dict, doctor: str):
+        self._seq += 1
+        # Encoded once, shared by every client
+        payload = f"id: {self._seq}\nevent: {event}\ndata: {json.dumps(data)}\n\n".encode("utf-8")
+        self._history.append((self._seq, doctor, payload))
+
+        if doctor is None:
+            targets = list(self._subscribers)
+        else:
+            targets = list(self._unfiltered) + list(self._by_doctor.get(doctor, ()))
+        for subscriber in targets:
+            self._offer(subscriber, payload)
+
+    def _offer(self, subscriber: Subscriber, payload: bytes):
+        try:
+            subscriber.queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            # Client is not reading: cut it loose; it reconnects with Last-Event-ID
+            logger.info("Dropping SSE client that fell behind")
+            self._drop(subscriber)
+
+    def _drop(self, subscriber: Subscriber):
+        self.unsubscribe(subscriber)
+        # Make room for the end-of-stream marker
+        while not subscriber.queue.empty():
+            subscriber.queue.get_nowait()
+        subscriber.queue.put_nowait(None)
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_seconds)
+            for subscriber in list(self._subscribers):
+                self._offer(subscriber, HEARTBEAT)
+
+event_broker = EventBroker(settings.EVENTS_HEARTBEAT_SECONDS, settings.EVENTS_CLIENT_QUEUE_SIZE)
+
+def publish_schedule_version(result: dict):
+    """scrape_and_save listener: tell clients a new schedule version is available."""
+    event_broker.publish("schedules", {"version": result.get("version")})
+
+def publish_doctor_alerts(upcoming: list):
+    """Notification planner hook: one alert per upcoming doctor, to clients following that doctor."""
+    for doctor in upcoming:
+        event_broker.publish("alert", {
+            "name": doctor["name"],
+            "category": doctor["category"],
+            "starts_in_minutes": doctor["starts_in_minutes"],
+            "time_range": doctor["time_range"]
+        }, doctor=doctor["name"])
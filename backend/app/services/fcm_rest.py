@@ -2,119 +2,292 @@
 Direct FCM HTTP v1 API implementation to bypass Firebase Admin SDK issues.
 """
 import requests
+from concurrent.futures import ThreadPoolExecutor
 import json
 import logging
 from google.oauth2 import service_account
 from google.auth.transport.requests import Request
 from app.config import get_settings
+from app.http_client import create_session
+from app.services.outcomes import SENT, INVALID_TOKEN, RETRYABLE, FAILED
+from app.services.rate_limit import limiters, parse_retry_after
+from datetime import datetime, timedelta
 import os
+import threading
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
 SCOPES = ['https://www.googleapis.com/auth/firebase.messaging']
 
-def get_access_token():
-    """Get OAuth2 access token from service account credentials."""
-    try:
-        if not settings.FIREBASE_CREDENTIALS_PATH:
-            logger.error("Firebase credentials path not set")
-            return None
-            
-        if not os.path.exists(settings.FIREBASE_CREDENTIALS_PATH):
-            logger.error(f"Firebase credentials file not found at {settings.FIREBASE_CREDENTIALS_PATH}")
-            return None
-        
-        credentials = service_account.Credentials.from_service_account_file(
-            settings.FIREBASE_CREDENTIALS_PATH,
-            scopes=SCOPES
-        )
-        credentials.refresh(Request())
-        return credentials.token
-    except Exception as e:
-        logger.error(f"Failed to get access token: {str(e)}")
-        return None
+FCM_PROJECT_ID = "iitjhealthcenter"
+FCM_SEND_URL = f"{settings.FCM_API_URL.rstrip('/')}/v1/projects/{FCM_PROJECT_ID}/messages:send"
+
+# Shared keep-alive session (one host), pooled to match the multicast worker count
+_session = create_session(settings.FCM_MAX_WORKERS, pool_connections=1)
+
+def get_session() -> requests.Session:
+    """Return the process-wide FCM HTTP session."""
+    return _session
 
-def send_fcm_notification_rest(token: str, title: str, body: str, data: dict = None):
+# Refresh this long before the token actually expires
+TOKEN_REFRESH_MARGIN = timedelta(minutes=5)
+
+class AccessTokenProvider:
     """
-    Send FCM notification using HTTP v1 REST API.
+    Process-wide cache of the service account credentials and their OAuth2 token.
+
+    The credentials file is read once, and the token is only exchanged again when
+    it is about to expire. Refreshes happen under a lock, so concurrent senders
+    wait for a single refresh instead of each starting their own.
+    """
+
+    def __init__(self, credentials_path: str):
+        self.credentials_path = credentials_path
+        self._credentials = None
+        self._lock = threading.Lock()
+
+    def _is_fresh(self) -> bool:
+        credentials = self._credentials
+        if credentials is None or not credentials.token:
+            return False
+        if credentials.expiry is None:
+            return True
+        # google-auth stores expiry as naive UTC
+        return credentials.expiry - TOKEN_REFRESH_MARGIN > datetime.utcnow()
+
+    def get_token(self):
+        """Return a valid access token, refreshing it if needed (None on failure)."""
+        if self._is_fresh():
+            return self._credentials.token
+
+        with self._lock:
+            # Another thread may have refreshed while we waited for the lock
+            if self._is_fresh():
+                return self._credentials.token
+
+            try:
+                if self._credentials is None:
+                    if not self.credentials_path:
+                        logger.error("Firebase credentials path not set")
+                        return None
+
+                    if not os.path.exists(self.credentials_path):
+                        logger.error(f"Firebase credentials file not found at {self.credentials_path}")
+                        return None
+
+                    self._credentials = service_account.Credentials.from_service_account_file(
+                        self.credentials_path,
+                        scopes=SCOPES
+                    )
+                self._credentials.refresh(Request())
+                logger.info(f"Refreshed FCM access token (expires {self._credentials.expiry})")
+                return self._credentials.token
+            except Exception as e:
+                logger.error(f"Failed to get access token: {str(e)}")
+                return None
+
+    def invalidate(self):
+        """Force the next get_token() to refresh, e.g. after FCM rejects the token."""
+        with self._lock:
+            if self._credentials is not None:
+                self._credentials.token = None
+
+token_provider = AccessTokenProvider(settings.FIREBASE_CREDENTIALS_PATH)
+
+def get_access_token():
+    """Get OAuth2 access token from service account credentials (cached until near expiry)."""
+    return token_provider.get_token()
+
+def build_message(target: dict, title: str, body: str, data: dict = None) -> dict:
+    """HTTP v1 request body; `target` is {"token": ...} for one device or {"topic": ...}."""
+    return {
+        "message": {
+            **target,
+            "notification": {
+                "title": title,
+                "body": body
+            },
+            "data": data or {},
+            "android": {
+                "priority": "high",
+                "notification": {
+                    "icon": "ic_notification",
+                    "color": "#667eea",
+                    "sound": "default"
+                }
+            }
+        }
+    }
+
+# HTTP v1 error codes meaning the registration token is dead. FCM reports
+# INVALID_ARGUMENT for malformed tokens; our payload is fixed, so the token is the culprit.
+DEAD_TOKEN_ERRORS = {"UNREGISTERED", "INVALID_ARGUMENT"}
+
+def classify_response(response: requests.Response) -> str:
+    """Map an HTTP v1 send response to SENT, INVALID_TOKEN, RETRYABLE or FAILED."""
+    if response.status_code == 200:
+        return SENT
+    if response.status_code in (401, 429) or response.status_code >= 500:
+        # 401: the access token is refreshed before the next attempt
+        return RETRYABLE
     
-    Args:
-        token: FCM device token
-        title: Notification title
-        body: Notification body
-        data: Optional data payload
+    try:
+        error = response.json().get("error", {})
+    except ValueError:
+        return FAILED
     
-    Returns:
-        bool: True if sent successfully, False otherwise
-    """
+    codes = {error.get("status")}
+    for detail in error.get("details", []):
+        codes.add(detail.get("errorCode"))
+    if codes & DEAD_TOKEN_ERRORS:
+        return INVALID_TOKEN
+    return FAILED
+
+def _post_message(message: dict, target_desc: str, timeout: float = None) -> str:
+    """POST one HTTP v1 message and classify the outcome."""
     try:
         access_token = get_access_token()
         if not access_token:
             logger.error("Failed to get access token")
-            return False
-        
-        project_id = "iitjhealthcenter"
-        url = f"https://fcm.googleapis.com/v1/projects/{project_id}/messages:send"
+            return RETRYABLE
         
         headers = {
             'Authorization': f'Bearer {access_token}',
             'Content-Type': 'application/json; UTF-8',
         }
         
-        message = {
-            "message": {
-                "token": token,
-                "notification": {
-                    "title": title,
-                    "body": body
-                },
-                "data": data or {},
-                "android": {
-                    "priority": "high",
-                    "notification": {
-                        "icon": "ic_notification",
-                        "color": "#667eea",
-                        "sound": "default"
-                    }
-                }
-            }
-        }
+        limiters["fcm"].acquire()
+        response = get_session().post(
+            FCM_SEND_URL,
+            headers=headers,
+            json=message,
+            timeout=timeout or settings.FCM_REQUEST_TIMEOUT
+        )
         
-        response = requests.post(url, headers=headers, json=message)
+        if response.status_code in (429, 503) and response.headers.get("Retry-After"):
+            # FCM quota exceeded: hold every FCM sender back as long as asked
+            limiters["fcm"].pause(parse_retry_after(response.headers["Retry-After"]))
         
-        if response.status_code == 200:
-            logger.info(f"FCM notification sent successfully to token {token[:20]}...")
-            return True
+        outcome = classify_response(response)
+        if outcome == SENT:
+            logger.debug(f"FCM notification sent successfully to {target_desc}")
+        elif outcome == INVALID_TOKEN:
+            logger.info(f"FCM {target_desc} is no longer valid: {response.text}")
         else:
+            if response.status_code == 401:
+                # Token revoked or expired early: make the next send fetch a new one
+                token_provider.invalidate()
             logger.error(f"FCM send failed with status {response.status_code}: {response.text}")
-            return False
+        return outcome
             
+    except (requests.Timeout, requests.ConnectionError) as e:
+        logger.error(f"FCM send to {target_desc} failed: {str(e)}")
+        return RETRYABLE
     except Exception as e:
         logger.error(f"Failed to send FCM notification via REST: {str(e)}")
-        return False
+        return FAILED
 
-def send_fcm_multicast_rest(tokens: list, title: str, body: str, data: dict = None):
+def send_fcm_message_rest(token: str, title: str, body: str, data: dict = None, timeout: float = None) -> str:
+    """
+    Send FCM notification using HTTP v1 REST API and classify the outcome.
+    
+    Args:
+        token: FCM device token
+        title: Notification title
+        body: Notification body
+        data: Optional data payload
+        timeout: Seconds to wait for FCM (defaults to FCM_REQUEST_TIMEOUT)
+    
+    Returns:
+        str: SENT, INVALID_TOKEN, RETRYABLE or FAILED
+    """
+    return _post_message(
+        build_message({"token": token}, title, body, data),
+        f"token {token[:20]}...",
+        timeout
+    )
+
+def send_fcm_topic_rest(topic: str, title: str, body: str, data: dict = None, timeout: float = None) -> str:
+    """
+    Send one FCM notification to every device subscribed to a topic.
+    FCM does the per-device fan-out, so this is a single request however many subscribers there are.
+    
+    Returns:
+        str: SENT, RETRYABLE or FAILED
+    """
+    return _post_message(
+        build_message({"topic": topic}, title, body, data),
+        f"topic {topic}",
+        timeout
+    )
+
+def send_fcm_notification_rest(token: str, title: str, body: str, data: dict = None, timeout: float = None):
+    """
+    Send FCM notification using HTTP v1 REST API.
+    
+    Returns:
+        bool: True if sent successfully, False otherwise
+    """
+    return send_fcm_message_rest(token, title, body, data, timeout) == SENT
+
+def send_fcm_multicast_rest(tokens: list, title: str, body: str, data: dict = None,
+                            max_workers: int = None, timeout: float = None):
     """
     Send FCM notification to multiple devices using HTTP v1 REST API.
     
+    Messages are sent concurrently from a thread pool over the shared
+    keep-alive session, so fan-out time is bounded by the slowest batch of
+    `max_workers` requests rather than the sum of all of them.
+    
     Args:
         tokens: List of FCM device tokens
         title: Notification title
         body: Notification body
         data: Optional data payload
+        max_workers: Max requests in flight (defaults to FCM_MAX_WORKERS)
+        timeout: Seconds per request (defaults to FCM_REQUEST_TIMEOUT)
     
     Returns:
-        dict: Success and failure counts
+        dict: Success and failure counts, per-token outcomes in token order ("results"),
+              the tokens FCM reported dead ("invalid_tokens") and the retryable failure count
     """
-    success_count = 0
-    failure_count = 0
+    if not tokens:
+        return {"success": 0, "failure": 0, "results": [], "invalid_tokens": [], "retryable": 0}
     
-    for token in tokens:
-        if send_fcm_notification_rest(token, title, body, data):
-            success_count += 1
-        else:
-            failure_count += 1
+    # Fetch the access token once up front so workers start from a warm cache
+    if not get_access_token():
+        logger.error("Failed to get access token, FCM batch not sent")
+        return {
+            "success": 0,
+            "failure": len(tokens),
+            "results": [False] * len(tokens),
+            "invalid_tokens": [],
+            "retryable": 0
+        }
+    
+    workers = max(1, min(max_workers or settings.FCM_MAX_WORKERS, len(tokens)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fcm-send") as executor:
+        # map() yields results in submission order regardless of completion order
+        outcomes = list(executor.map(
+            lambda token: send_fcm_message_rest(token, title, body, data, timeout),
+            tokens
+        ))
+    
+    results = [outcome == SENT for outcome in outcomes]
+    invalid_tokens = [token for token, outcome in zip(tokens, outcomes) if outcome == INVALID_TOKEN]
+    retryable = outcomes.count(RETRYABLE)
+    success_count = sum(results)
+    failure_count = len(results) - success_count
     
-    logger.info(f"FCM REST batch sent: {success_count} success, {failure_count} failed")
-    return {"success": success_count, "failure": failure_count}
+    logger.info(
+        f"FCM REST batch sent: {success_count} success, {failure_count} failed "
+        f"({len(invalid_tokens)} invalid tokens, {retryable} retryable)"
+    )
+    return {
+        "success": success_count,
+        "failure": failure_count,
+        "results": results,
+        "invalid_tokens": invalid_tokens,
+        "retryable": retryable
+    }
@@ -1,5 +1,5 @@
 import firebase_admin
-from firebase_admin import credentials, messaging
+from firebase_admin import credentials, messaging, exceptions
 from app.config import get_settings
 import logging
 import os
@@ -94,7 +94,8 @@ def send_fcm_multicast(tokens: list, title: str, body: str, data: dict = None):
         data: Optional data payload
     
     Returns:
-        dict: Success and failure counts
+        dict: Success and failure counts, plus the tokens FCM reported
+              unregistered or invalid ("invalid_tokens")
     """
     try:
         if _firebase_app is None:
@@ -102,15 +103,16 @@ def send_fcm_multicast(tokens: list, title: str, body: str, data: dict = None):
         
         if _firebase_app is None:
             logger.warning("Firebase not initialized, skipping FCM notifications")
-            return {"success": 0, "failure": len(tokens)}
+            return {"success": 0, "failure": len(tokens), "invalid_tokens": []}
         
         if not tokens:
-            return {"success": 0, "failure": 0}
+            return {"success": 0, "failure": 0, "invalid_tokens": []}
         
         # Send to max 500 tokens at once (FCM limit)
         batch_size = 500
         success_count = 0
         failure_count = 0
+        invalid_tokens = []
         
         for i in range(0, len(tokens), batch_size):
             batch = tokens[i:i + batch_size]
@@ -142,12 +144,14 @@ def send_fcm_multicast(tokens: list, title: str, body: str, data: dict = None):
                     if not resp.success:
                         token = batch[idx]
                         error_msg = resp.exception if resp.exception else "Unknown error"
+                        if isinstance(resp.exception, (messaging.UnregisteredError, exceptions.InvalidArgumentError)):
+                            invalid_tokens.append(token)
                         logger.error(f"FCM send failed for token {token[:20]}...: {error_msg}")
             
             logger.info(f"FCM batch sent: {response.success_count} success, {response.failure_count} failed")
         
-        return {"success": success_count, "failure": failure_count}
+        return {"success": success_count, "failure": failure_count, "invalid_tokens": invalid_tokens}
         
     except Exception as e:
         logger.error(f"Failed to send FCM multicast: {str(e)}")
-        return {"success": 0, "failure": len(tokens)}
+        return {"success": 0, "failure": len(tokens), "invalid_tokens": []}
@@ -0,0 +1,75 @@
+"""
+Removal of FCM registration tokens that FCM reports as dead.
+
+Tokens of uninstalled apps (UNREGISTERED) or malformed tokens (INVALID_ARGUMENT)
+never succeed again, so their fcm_tokens rows and the device's doctor
+subscriptions are deleted instead of being retried on every notification.
+"""
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+from app.database import FCMToken, DoctorSubscription, SQL_BATCH_SIZE
+from app.services.recipient_index import recipient_index
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Running totals since startup
+pruned_totals = {"tokens": 0, "subscriptions": 0}
+_totals_lock = threading.Lock()
+
+def prune_fcm_tokens(db: Session, tokens: list) -> dict:
+    """
+    Delete dead FCM tokens and the doctor subscriptions of their devices.
+
+    Rows are matched on the token value, so a device that re-registered with a
+    new token in the meantime is left alone.
+
+    Args:
+        db: Database session (committed by this call)
+        tokens: Tokens FCM rejected as unregistered or invalid
+
+    Returns:
+        dict: Number of "tokens" and "subscriptions" deleted
+    """
+    tokens = list(dict.fromkeys(t for t in tokens if t))
+    pruned = {"tokens": 0, "subscriptions": 0}
+    if not tokens:
+        return pruned
+
+    try:
+        device_ids = []
+        for i in range(0, len(tokens), SQL_BATCH_SIZE):
+            batch = tokens[i:i + SQL_BATCH_SIZE]
+            batch_devices = list(db.execute(
+                select(FCMToken.device_id).where(FCMToken.fcm_token.in_(batch))
+            ).scalars())
+            if not batch_devices:
+                continue
+
+            pruned["subscriptions"] += db.execute(
+                delete(DoctorSubscription).where(DoctorSubscription.device_id.in_(batch_devices))
+            ).rowcount
+            pruned["tokens"] += db.execute(
+                delete(FCMToken).where(FCMToken.fcm_token.in_(batch))
+            ).rowcount
+            device_ids.extend(batch_devices)
+        db.commit()
+    except Exception as e:
+        logger.error(f"Failed to prune FCM tokens: {str(e)}")
+        db.rollback()
+        return {"tokens": 0, "subscriptions": 0}
+
+    for device_id in device_ids:
+        recipient_index.remove_device(device_id)
+
+    with _totals_lock:
+        pruned_totals["tokens"] += pruned["tokens"]
+        pruned_totals["subscriptions"] += pruned["subscriptions"]
+
+    if pruned["tokens"]:
+        logger.info(
+            f"Pruned {pruned['tokens']} dead FCM token(s) and "
+            f"{pruned['subscriptions']} doctor subscription(s)"
+        )
+    return pruned
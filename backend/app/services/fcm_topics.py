@@ -0,0 +1,216 @@
+"""
+Per-doctor FCM topics (enabled with FCM_TOPIC_MODE).
+
+Every doctor has a topic whose members are the FCM tokens of the devices
+subscribed to that doctor. Membership is managed in batches through the
+Instance ID batchAdd/batchRemove API, so a doctor event is announced with a
+single topic message and FCM fans it out to the devices.
+
+Membership changes that fail for a transient reason (IID 5xx, timeout, no
+access token) are queued in the outbox on the "fcm_membership" channel and
+retried with backoff; the retry re-reads the subscription, so it always
+converges on the current state. sync_topic_subscriptions also runs
+periodically as a safety net.
+"""
+from sqlalchemy.orm import Session
+from app.database import SessionLocal, FCMToken, DoctorSubscription
+from app.services.delivery_ledger import enqueue_deliveries
+from app.services.fcm_rest import get_access_token, get_session
+from app.services.outcomes import SENT, INVALID_TOKEN, RETRYABLE
+from app.services.fcm_tokens import prune_fcm_tokens
+from app.config import get_settings
+from datetime import datetime
+import hashlib
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Max registration tokens per batchAdd/batchRemove call
+IID_BATCH_SIZE = 1000
+
+# Per-token IID errors meaning the token itself is dead
+DEAD_TOKEN_ERRORS = {"NOT_FOUND", "INVALID_ARGUMENT"}
+
+def doctor_topic(doctor_name: str) -> str:
+    """
+    Topic name for a doctor.
+
+    Topic names only allow [a-zA-Z0-9-_.~%], so the name is slugified and a
+    short hash of the exact name is appended to keep distinct doctors apart.
+    """
+    slug = re.sub(r'[^a-zA-Z0-9]+', '-', doctor_name).strip('-').lower()[:64]
+    digest = hashlib.sha1(doctor_name.encode('utf-8')).hexdigest()[:8]
+    return f"doctor-{slug}-{digest}"
+
+def _batch_topic_request(action: str, topic: str, tokens: list) -> dict:
+    """
+    Call iid/v1:batchAdd or iid/v1:batchRemove for `tokens`, IID_BATCH_SIZE at a time.
+
+    Returns:
+        dict: Number of tokens updated ("success") and failed ("failure"), the
+              tokens IID reported as dead ("invalid_tokens") and the tokens that
+              failed for any other reason and may succeed later ("failed_tokens")
+    """
+    result = {"success": 0, "failure": 0, "invalid_tokens": [], "failed_tokens": []}
+    tokens = list(dict.fromkeys(t for t in tokens if t))
+    if not tokens:
+        return result
+
+    access_token = get_access_token()
+    if not access_token:
+        logger.error(f"Failed to get access token, topic {action} skipped for {topic}")
+        result["failure"] = len(tokens)
+        result["failed_tokens"] = tokens
+        return result
+
+    url = f"{settings.FCM_IID_URL.rstrip('/')}/iid/v1:{action}"
+    headers = {
+        'Authorization': f'Bearer {access_token}',
+        'access_token_auth': 'true',
+        'Content-Type': 'application/json',
+    }
+
+    for i in range(0, len(tokens), IID_BATCH_SIZE):
+        batch = tokens[i:i + IID_BATCH_SIZE]
+        try:
+            response = get_session().post(
+                url,
+                headers=headers,
+                json={"to": f"/topics/{topic}", "registration_tokens": batch},
+                timeout=settings.FCM_REQUEST_TIMEOUT
+            )
+            if response.status_code != 200:
+                logger.error(f"Topic {action} for {topic} failed with status {response.status_code}: {response.text}")
+                result["failure"] += len(batch)
+                result["failed_tokens"].extend(batch)
+                continue
+
+            for token, outcome in zip(batch, response.json().get("results", [])):
+                error = outcome.get("error")
+                if not error:
+                    result["success"] += 1
+                    continue
+                result["failure"] += 1
+                if error in DEAD_TOKEN_ERRORS:
+                    result["invalid_tokens"].append(token)
+                else:
+                    logger.error(f"Topic {action} for {topic} failed for token {token[:20]}...: {error}")
+                    result["failed_tokens"].append(token)
+        except Exception as e:
+            logger.error(f"Topic {action} for {topic} failed: {str(e)}")
+            result["failure"] += len(batch)
+            result["failed_tokens"].extend(batch)
+
+    return result
+
+def subscribe_to_topic(tokens: list, topic: str) -> dict:
+    """Add tokens to a topic (see _batch_topic_request for the result)."""
+    return _batch_topic_request("batchAdd", topic, tokens)
+
+def unsubscribe_from_topic(tokens: list, topic: str) -> dict:
+    """Remove tokens from a topic (see _batch_topic_request for the result)."""
+    return _batch_topic_request("batchRemove", topic, tokens)
+
+def sync_topic_subscriptions(db: Session) -> dict:
+    """
+    Add every existing doctor subscription to its doctor's topic.
+
+    Run when topic mode is switched on so devices that subscribed before it
+    was enabled are reached as well; batchAdd is idempotent.
+
+    Returns:
+        dict: Number of topics synced and totals over all batchAdd calls
+    """
+    rows = db.query(DoctorSubscription.doctor_name, FCMToken.fcm_token).join(
+        FCMToken, FCMToken.device_id == DoctorSubscription.device_id
+    ).all()
+
+    tokens_by_doctor = {}
+    for row in rows:
+        tokens_by_doctor.setdefault(row.doctor_name, []).append(row.fcm_token)
+
+    totals = {"topics": len(tokens_by_doctor), "success": 0, "failure": 0}
+    invalid_tokens = []
+    for doctor_name, tokens in tokens_by_doctor.items():
+        result = subscribe_to_topic(tokens, doctor_topic(doctor_name))
+        totals["success"] += result["success"]
+        totals["failure"] += result["failure"]
+        invalid_tokens.extend(result["invalid_tokens"])
+
+    prune_fcm_tokens(db, invalid_tokens)
+    logger.info(
+        f"Synced {totals['topics']} doctor topic(s): "
+        f"{totals['success']} memberships added, {totals['failure']} failed"
+    )
+    return totals
+
+def _device_token(db: Session, device_id: str):
+    row = db.query(FCMToken.fcm_token).filter(FCMToken.device_id == device_id).first()
+    return row.fcm_token if row else None
+
+def _queue_membership_retry(db: Session, device_id: str, doctor_name: str, token: str):
+    """Queue a failed membership change for the outbox to retry (see reconcile_membership)."""
+    from app.services.outbox import outbox
+    # A fresh event key per failure, so a token whose earlier retry already
+    # finished is queued again; the retries themselves are idempotent
+    event_key = f"membership|{doctor_topic(doctor_name)}|{datetime.utcnow().isoformat()}"
+    enqueue_deliveries(db, event_key, "fcm_membership", {
+        token: {"device_id": device_id, "doctor_name": doctor_name, "token": token}
+    })
+    outbox.wake("fcm_membership")
+
+def _change_membership(db: Session, action: str, device_id: str, doctor_name: str, token: str) -> list:
+    """batchAdd/batchRemove one token, queueing a retry on a transient failure. Returns dead tokens."""
+    result = _batch_topic_request(action, doctor_topic(doctor_name), [token])
+    if result["failed_tokens"]:
+        _queue_membership_retry(db, device_id, doctor_name, token)
+    return result["invalid_tokens"]
+
+def add_device_to_topics(db: Session, device_id: str, doctor_names: list):
+    """Add a device's current token to the topics of the given doctors."""
+    token = _device_token(db, device_id)
+    if not token:
+        return
+    invalid_tokens = []
+    for doctor_name in doctor_names:
+        invalid_tokens.extend(_change_membership(db, "batchAdd", device_id, doctor_name, token))
+    prune_fcm_tokens(db, invalid_tokens)
+
+def move_token_topics(db: Session, device_id: str, old_token: str, doctor_names: list):
+    """After a device re-registers, swap its old token for the current one in its doctors' topics."""
+    for doctor_name in doctor_names:
+        _change_membership(db, "batchRemove", device_id, doctor_name, old_token)
+    add_device_to_topics(db, device_id, doctor_names)
+
+def remove_device_from_topic(db: Session, device_id: str, doctor_name: str):
+    """Remove a device's current token from a doctor's topic."""
+    token = _device_token(db, device_id)
+    if token:
+        _change_membership(db, "batchRemove", device_id, doctor_name, token)
+
+def reconcile_membership(device_id: str, doctor_name: str, token: str) -> str:
+    """
+    Outbox sender for "fcm_membership" retries: bring one token's membership of a
+    doctor's topic in line with the database as it is now. The token should be in
+    the topic only if it is still the device's token and the device is still
+    subscribed to the doctor.
+
+    Returns:
+        str: SENT, INVALID_TOKEN (the token is dead) or RETRYABLE
+    """
+    db = SessionLocal()
+    try:
+        subscribed = db.query(DoctorSubscription.id).filter(
+            DoctorSubscription.device_id == device_id,
+            DoctorSubscription.doctor_name == doctor_name
+        ).first() is not None
+        wanted = subscribed and _device_token(db, device_id) == token
+    finally:
+        db.close()
+
+    result = _batch_topic_request("batchAdd" if wanted else "batchRemove", doctor_topic(doctor_name), [token])
+    if result["invalid_tokens"]:
+        return INVALID_TOKEN
+    return RETRYABLE if result["failure"] else SENT
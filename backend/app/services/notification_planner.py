@@ -0,0 +1,149 @@
+"""
+Event-driven notification timeline.
+
+After each scrape that changes the schedule, the planner computes when every
+future (doctor, start) event should be announced and keeps them in a heap
+ordered by fire time. A single APScheduler date job is armed for the earliest
+event, so the process sleeps between notifications instead of polling the
+schedules table every minute.
+"""
+from apscheduler.triggers.date import DateTrigger
+from datetime import datetime, timedelta
+from app.config import get_settings
+from app.database import SessionLocal, Schedule
+import heapq
+import itertools
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+JOB_ID = "notification_planner"
+
+class NotificationPlanner:
+    """Heap of upcoming doctor events, fired by one APScheduler date job."""
+
+    def __init__(self, lead_minutes: int):
+        self.lead = timedelta(minutes=lead_minutes)
+        self._scheduler = None
+        self._heap = []  # (fire_at, seq, event)
+        self._seq = itertools.count()
+        self._fired = set()  # Events already handed to notify_doctors by this process
+        self._lock = threading.Lock()
+
+    def start(self, scheduler):
+        """Attach to the background scheduler and build the initial timeline."""
+        self._scheduler = scheduler
+        self.rebuild()
+
+    def on_schedules_changed(self, result: dict):
+        """scrape_and_save listener: replan whenever the schedule changed."""
+        logger.info("Schedule changed, rebuilding notification timeline")
+        self.rebuild()
+
+    def rebuild(self, now: datetime = None):
+        """Recompute fire times for every doctor start that has not happened yet."""
+        now = now or datetime.now()
+        db = SessionLocal()
+        try:
+            rows = db.query(
+                Schedule.schedule_date, Schedule.start_minute,
+                Schedule.name, Schedule.category, Schedule.timing
+            ).filter(
+                Schedule.schedule_date >= now.date(),
+                Schedule.start_minute.isnot(None)
+            ).all()
+        finally:
+            db.close()
+
+        heap = []
+        for row in rows:
+            start_at = datetime.combine(row.schedule_date, datetime.min.time()) + timedelta(minutes=row.start_minute)
+            if start_at < now:
+                continue
+
+            event = {
+                "key": (row.schedule_date, row.name, row.category, row.start_minute),
+                "start_at": start_at,
+                "name": row.name,
+                "category": row.category,
+                "time_range": row.timing
+            }
+            # Events added inside the lead window (e.g. by a late scrape) fire right away
+            heap.append((max(start_at - self.lead, now), next(self._seq), event))
+
+        with self._lock:
+            # Forget announced events that can no longer come round again
+            self._fired = {key for key in self._fired if key[0] >= now.date()}
+            self._heap = [entry for entry in heap if entry[2]["key"] not in self._fired]
+            heapq.heapify(self._heap)
+            logger.info(f"Notification timeline has {len(self._heap)} upcoming event(s)")
+            self._arm()
+
+    def next_fire_time(self):
+        """When the next notification is due, or None if nothing is planned."""
+        with self._lock:
+            return self._heap[0][0] if self._heap else None
+
+    def _arm(self):
+        """Point the date job at the earliest event (call with the lock held)."""
+        if self._scheduler is None:
+            return
+
+        if not self._heap:
+            if self._scheduler.get_job(JOB_ID):
+                self._scheduler.remove_job(JOB_ID)
+            return
+
+        self._scheduler.add_job(
+            self._fire,
+            trigger=DateTrigger(run_date=self._heap[0][0]),
+            id=JOB_ID,
+            name="Send planned doctor notifications",
+            replace_existing=True,
+            misfire_grace_time=None  # Late is better than never
+        )
+
+    def _pop_due(self, now: datetime) -> list:
+        with self._lock:
+            due = []
+            while self._heap and self._heap[0][0] <= now:
+                _, _, event = heapq.heappop(self._heap)
+                if event["key"] in self._fired:
+                    continue
+                self._fired.add(event["key"])
+                due.append(event)
+            return due
+
+    def _fire(self):
+        """Send every event that is due, then re-arm for the next one."""
+        from app.services.event_stream import publish_doctor_alerts
+        from app.services.notification_service import doctor_event_key, notify_doctors
+
+        now = datetime.now()
+        due = self._pop_due(now)
+        try:
+            if due:
+                upcoming = [
+                    {
+                        "event_key": doctor_event_key(*event["key"]),
+                        "name": event["name"],
+                        "category": event["category"],
+                        "starts_in_minutes": max(0, int((event["start_at"] - now).total_seconds() / 60)),
+                        "time_range": event["time_range"]
+                    }
+                    for event in due
+                ]
+                # Live /events clients first: no queueing or rate limits in the way
+                publish_doctor_alerts(upcoming)
+                db = SessionLocal()
+                try:
+                    notify_doctors(db, upcoming)
+                finally:
+                    db.close()
+        finally:
+            with self._lock:
+                self._arm()
+
+planner = NotificationPlanner(settings.NOTIFICATION_LEAD_MINUTES)
@@ -1,232 +1,260 @@
 from sqlalchemy.orm import Session
-from app.database import Subscription
-from app.scraper.notification_logic import check_upcoming_doctors
-from datetime import datetime
+from datetime import datetime, timedelta
+from functools import lru_cache
 import logging
 import json
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from app.config import get_settings
+from app.services.outcomes import SENT, RETRYABLE, FAILED
+from app.services.rate_limit import limiters
+from app.services.smtp_pool import get_smtp_pool
+from app.services.webpush_sender import send_webpush
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
-def send_email_notification(email: str, doctors: list):
-    """Send email notification about upcoming doctors."""
+@lru_cache(maxsize=256)
+def render_email_html(doctors: tuple) -> str:
+    """
+    Render the email body for a digest.
+    Cached on the doctor list, so every recipient of the same digest shares one rendering.
+    
+    Args:
+        doctors: Tuple of (name, category, starts_in_minutes, time_range) tuples
+    """
+    html_body = f"""
+    <html>
+        <body style="font-family: Arial, sans-serif; padding: 20px; background-color: #f5f5f5;">
+            <div style="max-width: 600px; margin: 0 auto; background: white; padding: 30px; border-radius: 10px;">
+                <h2 style="color: #2563eb;">🏥 Doctors Arriving Soon</h2>
+                <p>The following doctor(s) will be available shortly:</p>
+                <ul style="list-style: none; padding: 0;">
+    """
+    
+    for name, category, starts_in_minutes, time_range in doctors:
+        html_body += f"""
+                    <li style="background: #f0f9ff; padding: 15px; margin: 10px 0; border-left: 4px solid #2563eb;">
+                        <strong>{name}</strong> ({category})<br>
+                        <span style="color: #666;">Starting in {starts_in_minutes} minutes</span><br>
+                        <span style="color: #666;">Time: {time_range}</span>
+                    </li>
+        """
+    
+    html_body += """
+                </ul>
+                <p style="color: #666; font-size: 12px; margin-top: 20px;">
+                    This is an automated notification from IITJ Health Center Schedule App.
+                </p>
+            </div>
+        </body>
+    </html>
+    """
+    return html_body
+
+def build_email_message(email: str, doctors: list) -> MIMEMultipart:
+    """Build the email about upcoming doctors."""
+    # Create message
+    msg = MIMEMultipart('alternative')
+    msg['Subject'] = f"🏥 {len(doctors)} Doctor(s) Arriving Soon - IITJ Health Center"
+    msg['From'] = settings.SMTP_FROM or settings.SMTP_USER
+    msg['To'] = email
+    
+    # Create HTML body
+    html_body = render_email_html(tuple(
+        (doc['name'], doc['category'], doc['starts_in_minutes'], doc['time_range']) for doc in doctors
+    ))
+    msg.attach(MIMEText(html_body, 'html'))
+    return msg
+
+def send_email_message(email: str, doctors: list) -> str:
+    """
+    Send an email digest about upcoming doctors.
+
+    Returns:
+        str: SENT, RETRYABLE (4xx reply, disconnect, network error) or FAILED
+             (5xx reply such as a rejected address, or SMTP not configured)
+    """
     try:
         if not settings.SMTP_USER or not settings.SMTP_PASSWORD:
             logger.warning("SMTP credentials not configured, skipping email")
-            return False
-        
-        # Create message
-        msg = MIMEMultipart('alternative')
-        msg['Subject'] = f"🏥 {len(doctors)} Doctor(s) Arriving Soon - IITJ Health Center"
-        msg['From'] = settings.SMTP_FROM or settings.SMTP_USER
-        msg['To'] = email
+            return FAILED
         
-        # Create HTML body
-        html_body = f"""
-        <html>
-            <body style="font-family: Arial, sans-serif; padding: 20px; background-color: #f5f5f5;">
-                <div style="max-width: 600px; margin: 0 auto; background: white; padding: 30px; border-radius: 10px;">
-                    <h2 style="color: #2563eb;">🏥 Doctors Arriving Soon</h2>
-                    <p>The following doctor(s) will be available shortly:</p>
-                    <ul style="list-style: none; padding: 0;">
-        """
-        
-        for doc in doctors:
-            html_body += f"""
-                        <li style="background: #f0f9ff; padding: 15px; margin: 10px 0; border-left: 4px solid #2563eb;">
-                            <strong>{doc['name']}</strong> ({doc['category']})<br>
-                            <span style="color: #666;">Starting in {doc['starts_in_minutes']} minutes</span><br>
-                            <span style="color: #666;">Time: {doc['time_range']}</span>
-                        </li>
-            """
-        
-        html_body += """
-                    </ul>
-                    <p style="color: #666; font-size: 12px; margin-top: 20px;">
-                        This is an automated notification from IITJ Health Center Schedule App.
-                    </p>
-                </div>
-            </body>
-        </html>
-        """
-        
-        msg.attach(MIMEText(html_body, 'html'))
+        msg = build_email_message(email, doctors)
         
-        # Send email
-        with smtplib.SMTP(settings.SMTP_HOST, settings.SMTP_PORT) as server:
-            server.starttls()
-            server.login(settings.SMTP_USER, settings.SMTP_PASSWORD)
-            server.send_message(msg)
+        # Send email over a pooled, already authenticated session
+        limiters["email"].acquire()
+        get_smtp_pool().send_message(msg)
         
         logger.info(f"Email sent to {email}")
-        return True
+        return SENT
         
+    except (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused) as e:
+        codes = [e.smtp_code] if isinstance(e, smtplib.SMTPResponseException) else [code for code, _ in e.recipients.values()]
+        if any(code == 421 or 450 <= code <= 452 for code in codes):
+            # Server is throttling us (e.g. Gmail's sending limits)
+            limiters["email"].pause(settings.SMTP_THROTTLE_PAUSE_SECONDS)
+        logger.error(f"Failed to send email to {email}: {str(e)}")
+        # 4xx replies are transient; 5xx (unknown mailbox, rejected sender, ...) will fail again
+        return RETRYABLE if any(code < 500 for code in codes) else FAILED
+    except (smtplib.SMTPServerDisconnected, OSError) as e:
+        # Dropped connection, timeout or unreachable server
+        logger.error(f"Failed to send email to {email}: {str(e)}")
+        return RETRYABLE
     except Exception as e:
         logger.error(f"Failed to send email to {email}: {str(e)}")
-        return False
+        return FAILED
+
+def send_email_notification(email: str, doctors: list):
+    """Send email notification about upcoming doctors."""
+    return send_email_message(email, doctors) == SENT
+
+def send_push_message(subscription_info: dict, doctors: list) -> str:
+    """
+    Send a web push digest.
+
+    Returns:
+        str: SENT, INVALID_TOKEN (subscription expired), RETRYABLE or FAILED
+    """
+    if not settings.VAPID_PRIVATE_KEY or not settings.VAPID_PUBLIC_KEY:
+        logger.warning("VAPID keys not configured, skipping push notification")
+        return FAILED
+
+    # Create notification payload
+    title = f"🏥 {len(doctors)} Doctor(s) Arriving Soon"
+    body = "\n".join([f"• {d['name']} in {d['starts_in_minutes']} min" for d in doctors[:3]])
+
+    payload = json.dumps({
+        "title": title,
+        "body": body,
+        "icon": "/logo.png",
+        "badge": "/badge.png"
+    })
+
+    return send_webpush(subscription_info, payload)
 
 def send_push_notification(subscription_info: dict, doctors: list):
     """Send web push notification."""
-    try:
-        if not settings.VAPID_PRIVATE_KEY or not settings.VAPID_PUBLIC_KEY:
-            logger.warning("VAPID keys not configured, skipping push notification")
-            return False
-        
-        from pywebpush import webpush
-        
-        # Create notification payload
-        title = f"🏥 {len(doctors)} Doctor(s) Arriving Soon"
-        body = "\n".join([f"• {d['name']} in {d['starts_in_minutes']} min" for d in doctors[:3]])
-        
-        payload = json.dumps({
-            "title": title,
-            "body": body,
-            "icon": "/logo.png",
-            "badge": "/badge.png"
-        })
-        
-        # Send push notification
-        webpush(
-            subscription_info=subscription_info,
-            data=payload,
-            vapid_private_key=settings.VAPID_PRIVATE_KEY,
-            vapid_claims={
-                "sub": settings.VAPID_CLAIMS_EMAIL
-            }
-        )
-        
-        logger.info("Push notification sent successfully")
-        return True
-        
-    except Exception as e:
-        logger.error(f"Failed to send push notification: {str(e)}")
-        return False
+    return send_push_message(subscription_info, doctors) == SENT
 
 def check_and_notify(db: Session):
     """
-    Check for upcoming doctors and send notifications to all subscribers.
-    Called by the scheduler every minute.
+    Check for upcoming doctors and queue notifications for all subscribers.
+    Called by the scheduler every minute when the notification planner is disabled.
     """
     try:
-        from app.database import Schedule, FCMToken, DoctorSubscription
-        from app.services.fcm_rest import send_fcm_multicast_rest
-        
-        # Get all schedules
-        schedules = db.query(Schedule).all()
-        
-        # Convert to list of dicts for notification_logic
-        schedule_data = []
-        for s in schedules:
-            schedule_data.append({
-                "date": s.date,
-                "name": s.name,
-                "timing": s.timing,
-                "category": s.category,
-                "room": s.room
-            })
-        
-        # Use simplified check since our data is already clean
-        upcoming = check_upcoming_from_clean_data(schedule_data)
+        upcoming = get_upcoming_doctors(db)
         
         if not upcoming:
             logger.debug("No upcoming doctors found")
             return
         
+        notify_doctors(db, upcoming)
+        
+    except Exception as e:
+        logger.error(f"Error in check_and_notify: {str(e)}")
+
+def doctor_event_key(schedule_date, name: str, category: str, start_minute: int) -> str:
+    """Identifies one doctor start (used as the delivery ledger event key)."""
+    return f"{schedule_date.isoformat()}|{start_minute}|{category}|{name}"
+
+def notify_doctors(db: Session, upcoming: list):
+    """
+    Queue notifications about upcoming doctors for their subscribers.
+    Messages go into the outbox (one row per event, channel and recipient, so
+    repeated calls for the same doctor start never send twice) and are
+    delivered by the outbox workers.
+    
+    Args:
+        db: Database session
+        upcoming: Dicts with event_key, name, category, starts_in_minutes and time_range
+    """
+    try:
+        from app.services.delivery_ledger import enqueue_deliveries
+        from app.services.fcm_topics import doctor_topic
+        from app.services.outbox import outbox
+        from app.services.recipient_index import recipient_index
+        
         logger.info(f"Found {len(upcoming)} upcoming doctor(s)")
         
-        # Send to each doctor's subscribers
+        # Recipients come from the in-memory index: no subscription queries per doctor
+        recipient_index.ensure_loaded(db)
+        subscribers = recipient_index.subscribers()
+        
+        now = datetime.utcnow()
         for doctor_info in upcoming:
             doctor_name = doctor_info['name']
+            event_key = doctor_info['event_key']
+            # Nothing is worth sending once the doctor has started
+            expires_at = now + timedelta(minutes=doctor_info['starts_in_minutes'] + 1)
             
-            # Get web/email subscriptions
-            subscriptions = db.query(Subscription).filter(Subscription.is_active == True).all()
+            # Email and web push go to every active subscriber
+            enqueue_deliveries(db, event_key, "email", {
+                sub["email"]: {"doctors": [doctor_info]}
+                for sub in subscribers if sub["email"]
+            }, expires_at)
+            enqueue_deliveries(db, event_key, "webpush", {
+                str(sub["id"]): {"subscription": sub["push_info"], "doctors": [doctor_info]}
+                for sub in subscribers if sub["push_info"]
+            }, expires_at)
             
-            for sub in subscriptions:
-                # Send email if configured
-                if sub.email:
-                    send_email_notification(sub.email, [doctor_info])
-                
-                # Send push notification if configured
-                if sub.push_subscription:
-                    try:
-                        push_info = json.loads(sub.push_subscription)
-                        send_push_notification(push_info, [doctor_info])
-                    except json.JSONDecodeError:
-                        logger.error(f"Invalid push subscription JSON for subscription {sub.id}")
-            
-            # Get FCM subscriptions for this specific doctor
-            doctor_subs = db.query(DoctorSubscription).filter(
-                DoctorSubscription.doctor_name == doctor_name
-            ).all()
+            message = {
+                "title": "🏥 Doctor Duty Started",
+                "body": f"Dr. {doctor_name} ({doctor_info['category']}) duty starts in {doctor_info['starts_in_minutes']} minutes",
+                "data": {
+                    "doctor_name": doctor_name,
+                    "category": doctor_info['category'],
+                    "time_range": doctor_info['time_range'],
+                    "starts_in_minutes": str(doctor_info['starts_in_minutes'])
+                }
+            }
             
-            if doctor_subs:
-                # Get FCM tokens for these devices
-                device_ids = [sub.device_id for sub in doctor_subs]
-                fcm_tokens_objs = db.query(FCMToken).filter(
-                    FCMToken.device_id.in_(device_ids)
-                ).all()
-                
-                fcm_tokens = [token.fcm_token for token in fcm_tokens_objs]
-                
-                if fcm_tokens:
-                    # Send FCM notifications
-                    title = "🏥 Doctor Duty Started"
-                    body = f"Dr. {doctor_name} ({doctor_info['category']}) duty starts in {doctor_info['starts_in_minutes']} minutes"
-                    data = {
-                        "doctor_name": doctor_name,
-                        "category": doctor_info['category'],
-                        "time_range": doctor_info['time_range'],
-                        "starts_in_minutes": str(doctor_info['starts_in_minutes'])
-                    }
-                    
-                    result = send_fcm_multicast_rest(fcm_tokens, title, body, data)
-                    logger.info(f"FCM sent to {result['success']} devices for {doctor_name}")
+            if settings.FCM_TOPIC_MODE:
+                # One message to the doctor's topic; FCM fans it out to the subscribed devices
+                enqueue_deliveries(db, event_key, "fcm_topic", {doctor_topic(doctor_name): message}, expires_at)
+            else:
+                # FCM devices subscribed to this specific doctor
+                enqueue_deliveries(db, event_key, "fcm", {
+                    device_id: {**message, "token": token}
+                    for device_id, token in recipient_index.fcm_recipients(doctor_name).items()
+                }, expires_at)
+        
+        outbox.wake()
         
     except Exception as e:
-        logger.error(f"Error in check_and_notify: {str(e)}")
+        logger.error(f"Error in notify_doctors: {str(e)}")
+        db.rollback()
 
-def check_upcoming_from_clean_data(schedule_data: list) -> list:
+def get_upcoming_doctors(db: Session, current_dt: datetime = None, window_minutes: int = 60) -> list:
     """
-    Simplified version of check_upcoming_doctors for our clean data format.
+    Find doctors starting within the next `window_minutes`.
+    Uses the normalized schedule_date/start_minute columns, so this is a single
+    index range scan with no timing strings parsed.
     Returns list of upcoming doctors.
     """
-    from datetime import datetime, timedelta
-    from app.scraper.notification_logic import parse_time_range
+    from app.database import Schedule
     
-    current_dt = datetime.now()
-    current_date_str = current_dt.strftime("%d/%m/%Y")
-    upcoming = []
+    if current_dt is None:
+        current_dt = datetime.now()
     
-    for row in schedule_data:
-        # Check if date matches
-        if current_date_str not in row.get("date", ""):
-            continue
-        
-        timing_str = row.get("timing")
-        if not timing_str:
-            continue
-        
-        times = parse_time_range(timing_str)
-        if not times:
-            continue
-        
-        start, end = times
-        start_dt = datetime.combine(current_dt.date(), start)
-        
-        # Check if doctor starts within next 60 minutes
-        time_diff = start_dt - current_dt
-        minutes_until = time_diff.total_seconds() / 60
-        
-        if 0 <= minutes_until <= 60:
-            upcoming.append({
-                "name": row.get("name"),
-                "category": row.get("category"),
-                "starts_in_minutes": int(minutes_until),
-                "time_range": timing_str
-            })
+    now_minute = (current_dt.hour * 3600 + current_dt.minute * 60 + current_dt.second) / 60
+    
+    rows = db.query(
+        Schedule.schedule_date, Schedule.name, Schedule.category, Schedule.timing, Schedule.start_minute
+    ).filter(
+        Schedule.schedule_date == current_dt.date(),
+        Schedule.start_minute >= now_minute,
+        Schedule.start_minute <= now_minute + window_minutes
+    ).order_by(Schedule.start_minute).all()
     
-    return upcoming
+    return [
+        {
+            "event_key": doctor_event_key(row.schedule_date, row.name, row.category, row.start_minute),
+            "name": row.name,
+            "category": row.category,
+            "starts_in_minutes": int(row.start_minute - now_minute),
+            "time_range": row.timing
+        }
+        for row in rows
+    ]
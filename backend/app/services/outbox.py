@@ -0,0 +1,250 @@
+"""
+Worker pool draining the notification outbox (see delivery_ledger).
+
+notify_doctors only enqueues rows. Each channel has its own dispatcher thread
+that claims due rows and hands them to a thread pool sized by that channel's
+concurrency limit, so a slow SMTP server never holds up FCM sends (or the
+scheduler). Failed sends are retried with exponential backoff until
+OUTBOX_MAX_ATTEMPTS, after which the row is dead-lettered; permanent
+failures (FAILED, e.g. a rejected email address) are dead-lettered at once.
+
+Idle dispatchers do not poll: enqueuing wakes them, and otherwise each one
+sleeps until its earliest pending row is due (a retry), or at most
+OUTBOX_POLL_SECONDS as a fallback for rows queued by another process.
+
+Email and web push are coalesced: all due rows of a recipient are claimed
+together and sent as one digest listing every doctor, so a recipient gets
+one message per window instead of one per doctor.
+"""
+from app.config import get_settings
+from app.database import SessionLocal
+from app.services.delivery_ledger import claim_due_deliveries, next_due_at, update_deliveries
+from app.services.outcomes import SENT, INVALID_TOKEN, FAILED
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import logging
+import random
+import threading
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+def _send_email(recipient: str, payload: dict) -> str:
+    from app.services.notification_service import send_email_message
+    return send_email_message(recipient, payload["doctors"])
+
+def _send_webpush(recipient: str, payload: dict) -> str:
+    from app.services.notification_service import send_push_message
+    return send_push_message(payload["subscription"], payload["doctors"])
+
+def _send_fcm(recipient: str, payload: dict) -> str:
+    from app.services.fcm_rest import send_fcm_message_rest
+    return send_fcm_message_rest(payload["token"], payload["title"], payload["body"], payload["data"])
+
+def _send_fcm_topic(recipient: str, payload: dict) -> str:
+    from app.services.fcm_rest import send_fcm_topic_rest
+    return send_fcm_topic_rest(recipient, payload["title"], payload["body"], payload["data"])
+
+def _send_fcm_membership(recipient: str, payload: dict) -> str:
+    from app.services.fcm_topics import reconcile_membership
+    return reconcile_membership(payload["device_id"], payload["doctor_name"], payload["token"])
+
+# channel -> sender(recipient, payload) returning SENT, INVALID_TOKEN, RETRYABLE or FAILED
+SENDERS = {
+    "email": _send_email,
+    "webpush": _send_webpush,
+    "fcm": _send_fcm,
+    "fcm_topic": _send_fcm_topic,
+    "fcm_membership": _send_fcm_membership,  # Retries of failed topic membership changes
+}
+
+# Channels whose due messages to one recipient are merged into a single digest
+COALESCED_CHANNELS = {"email", "webpush"}
+
+def merge_payloads(payloads: list) -> dict:
+    """One digest payload listing the doctors of every coalesced message, soonest first."""
+    doctors = {}
+    for payload in payloads:
+        for doctor in payload["doctors"]:
+            doctors.setdefault(doctor["event_key"], doctor)
+    return {
+        **payloads[-1],  # Newest subscription info
+        "doctors": sorted(doctors.values(), key=lambda doctor: doctor["starts_in_minutes"])
+    }
+
+def channel_concurrency() -> dict:
+    """Max sends in flight per channel, from settings."""
+    return {
+        "email": settings.OUTBOX_EMAIL_CONCURRENCY,
+        "webpush": settings.OUTBOX_WEBPUSH_CONCURRENCY,
+        "fcm": settings.OUTBOX_FCM_CONCURRENCY,
+        "fcm_topic": settings.OUTBOX_FCM_CONCURRENCY,
+        "fcm_membership": settings.OUTBOX_FCM_CONCURRENCY,
+    }
+
+def retry_delay(attempts: int) -> timedelta:
+    """Exponential backoff with jitter after the `attempts`-th failed attempt."""
+    delay = min(settings.OUTBOX_RETRY_MAX_SECONDS, settings.OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+    return timedelta(seconds=delay * random.uniform(0.5, 1.0))
+
+class ChannelWorker:
+    """Dispatcher thread plus bounded send pool for one channel."""
+
+    def __init__(self, channel: str, sender, concurrency: int, poll_seconds: float, coalesce: bool = False):
+        self.channel = channel
+        self.sender = sender
+        self.coalesce = coalesce
+        self.concurrency = max(1, concurrency)
+        self.poll_seconds = poll_seconds
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._executor = None
+
+    def start(self):
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.concurrency, thread_name_prefix=f"outbox-{self.channel}"
+        )
+        self._thread = threading.Thread(
+            target=self._run, name=f"outbox-{self.channel}-dispatch", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout: float = None):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+        if self._executor:
+            self._executor.shutdown(wait=False)
+
+    def wake(self):
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            # Clear before claiming so an enqueue during the claim still wakes us
+            self._wake.clear()
+            try:
+                if self.drain_once():
+                    continue
+                timeout = self.idle_timeout()
+            except Exception as e:
+                logger.error(f"Outbox {self.channel} worker error: {str(e)}")
+                timeout = self.poll_seconds
+            self._wake.wait(timeout)
+
+    def idle_timeout(self) -> float:
+        """Seconds until the channel's next pending row is due, capped at the fallback poll interval."""
+        db = SessionLocal()
+        try:
+            due_at = next_due_at(db, self.channel)
+        finally:
+            db.close()
+        if due_at is None:
+            return self.poll_seconds
+        return min(self.poll_seconds, max(0.0, (due_at - datetime.utcnow()).total_seconds()))
+
+    def _send(self, group: list) -> str:
+        """Send one message for a group of rows to the same recipient (a digest if several)."""
+        recipient = group[0]["recipient"]
+        payload = merge_payloads([row["payload"] for row in group]) if len(group) > 1 else group[0]["payload"]
+        try:
+            return self.sender(recipient, payload)
+        except Exception as e:
+            logger.error(f"Outbox {self.channel} send to {recipient} failed: {str(e)}")
+            return FAILED
+
+    def drain_once(self) -> int:
+        """Claim one batch of due rows, send them and record the outcomes. Returns rows handled."""
+        db = SessionLocal()
+        try:
+            # A few rounds of work per claim keeps the pool busy without hoarding rows
+            rows = claim_due_deliveries(db, self.channel, self.concurrency * 4, by_recipient=self.coalesce)
+            if not rows:
+                return 0
+
+            if self.coalesce:
+                groups = {}
+                for row in rows:
+                    groups.setdefault(row["recipient"], []).append(row)
+                groups = list(groups.values())
+            else:
+                groups = [[row] for row in rows]
+
+            # Every row in a group shares the outcome of the group's single send
+            group_outcomes = list(self._executor.map(self._send, groups))
+            rows = [row for group in groups for row in group]
+            outcomes = [outcome for group, outcome in zip(groups, group_outcomes) for _ in group]
+
+            now = datetime.utcnow()
+            updates = []
+            invalid_tokens = []
+            expired_endpoints = {}
+            for row, outcome in zip(rows, outcomes):
+                attempts = row["attempts"] + 1
+                if outcome == SENT:
+                    updates.append({"id": row["id"], "status": "sent", "attempts": attempts,
+                                    "sent_at": now, "claim_token": None, "last_error": None})
+                elif outcome == INVALID_TOKEN:
+                    updates.append({"id": row["id"], "status": "dead", "attempts": attempts,
+                                    "claim_token": None, "last_error": "invalid token"})
+                    if "token" in row["payload"]:
+                        invalid_tokens.append(row["payload"]["token"])
+                    elif "subscription" in row["payload"]:
+                        expired_endpoints[int(row["recipient"])] = row["payload"]["subscription"].get("endpoint")
+                elif outcome == FAILED or attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+                    updates.append({"id": row["id"], "status": "dead", "attempts": attempts,
+                                    "claim_token": None, "last_error": outcome})
+                else:
+                    updates.append({"id": row["id"], "status": "pending", "attempts": attempts,
+                                    "next_attempt_at": now + retry_delay(attempts),
+                                    "claim_token": None, "last_error": outcome})
+            update_deliveries(db, updates)
+
+            if invalid_tokens:
+                from app.services.fcm_tokens import prune_fcm_tokens
+                prune_fcm_tokens(db, invalid_tokens)
+            if expired_endpoints:
+                from app.services.webpush_sender import prune_push_subscriptions
+                prune_push_subscriptions(db, expired_endpoints)
+
+            sent = group_outcomes.count(SENT)
+            logger.info(
+                f"Outbox {self.channel}: {sent} of {len(groups)} message(s) sent "
+                f"for {len(rows)} claimed notification(s)"
+            )
+            return len(rows)
+        finally:
+            db.close()
+
+class OutboxWorkerPool:
+    """One ChannelWorker per channel; start()/stop() with the scheduler."""
+
+    def __init__(self):
+        self.workers = {}
+
+    def start(self):
+        if self.workers:
+            return
+        for channel, concurrency in channel_concurrency().items():
+            worker = ChannelWorker(
+                channel, SENDERS[channel], concurrency, settings.OUTBOX_POLL_SECONDS,
+                coalesce=channel in COALESCED_CHANNELS
+            )
+            worker.start()
+            self.workers[channel] = worker
+        logger.info(f"Outbox workers started: {channel_concurrency()}")
+
+    def stop(self, timeout: float = 10):
+        for worker in self.workers.values():
+            worker.stop(timeout)
+        self.workers = {}
+
+    def wake(self, channel: str = None):
+        """Tell workers new rows were queued instead of waiting for the next poll."""
+        for name, worker in self.workers.items():
+            if channel is None or name == channel:
+                worker.wake()
+
+outbox = OutboxWorkerPool()
@@ -0,0 +1,7 @@
+"""
+Outcomes of a single send, shared by the email, web push and FCM senders and the outbox.
+"""
+SENT = "sent"
+INVALID_TOKEN = "invalid_token"  # Recipient will never work again (dead FCM token, expired push subscription): prune it
+RETRYABLE = "retryable"  # Throttled, network or server-side failure: may succeed later
+FAILED = "failed"  # Permanent failure (rejected request, not configured): not retried
@@ -0,0 +1,116 @@
+"""
+Per-channel token-bucket rate limiting for outbound sends.
+
+Every sender acquires a token from its channel's bucket before talking to the
+provider, so bursts (many doctors starting at 09:00) are spread out at the
+configured sustained rate instead of tripping the provider's quota. When a
+provider pushes back (HTTP 429 with Retry-After, SMTP 421), the whole channel
+is paused for that long. Each bucket records how long callers waited.
+"""
+from app.config import get_settings
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+class TokenBucket:
+    """
+    Allows `rate` acquisitions per second on average, with bursts of up to `burst`.
+    A rate of 0 disables limiting.
+    """
+
+    def __init__(self, name: str, rate: float, burst: int):
+        self.name = name
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        self._stats = {"acquired": 0, "waited": 0, "total_wait_seconds": 0.0, "max_wait_seconds": 0.0, "pauses": 0}
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self) -> float:
+        """Block until a request may be sent. Returns the seconds spent waiting."""
+        if self.rate <= 0 and not self._paused_until:
+            return 0.0
+
+        start = time.monotonic()
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now >= self._paused_until:
+                    if self.rate <= 0:
+                        break
+                    self._refill(now)
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        break
+                    wait = (1 - self._tokens) / self.rate
+                else:
+                    wait = self._paused_until - now
+            time.sleep(wait)
+
+        waited = time.monotonic() - start
+        with self._lock:
+            self._stats["acquired"] += 1
+            if waited > 0.001:
+                self._stats["waited"] += 1
+                self._stats["total_wait_seconds"] += waited
+                self._stats["max_wait_seconds"] = max(self._stats["max_wait_seconds"], waited)
+        return waited
+
+    def pause(self, seconds: float):
+        """Hold back every sender on this channel for `seconds` (provider asked us to slow down)."""
+        if seconds <= 0:
+            return
+        with self._lock:
+            until = time.monotonic() + seconds
+            if until > self._paused_until:
+                self._paused_until = until
+                # Don't let a full bucket burst straight back into the provider
+                self._tokens = min(self._tokens, 1.0)
+            self._stats["pauses"] += 1
+        logger.warning(f"{self.name} sends paused for {seconds:.1f}s at the provider's request")
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["rate_per_second"] = self.rate
+        stats["avg_wait_seconds"] = round(stats["total_wait_seconds"] / stats["acquired"], 4) if stats["acquired"] else 0.0
+        stats["total_wait_seconds"] = round(stats["total_wait_seconds"], 3)
+        stats["max_wait_seconds"] = round(stats["max_wait_seconds"], 3)
+        return stats
+
+def parse_retry_after(value, default: float = 0.0) -> float:
+    """Seconds to wait from a Retry-After header (delta-seconds or an HTTP date)."""
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return default
+
+limiters = {
+    "email": TokenBucket("email", settings.RATE_LIMIT_EMAIL_PER_SECOND, settings.RATE_LIMIT_EMAIL_BURST),
+    "webpush": TokenBucket("webpush", settings.RATE_LIMIT_WEBPUSH_PER_SECOND, settings.RATE_LIMIT_WEBPUSH_BURST),
+    "fcm": TokenBucket("fcm", settings.RATE_LIMIT_FCM_PER_SECOND, settings.RATE_LIMIT_FCM_BURST),
+}
+
+def rate_limit_stats() -> dict:
+    """Wait statistics for every channel's bucket."""
+    return {channel: bucket.stats() for channel, bucket in limiters.items()}
@@ -0,0 +1,125 @@
+"""
+In-memory inverted index of notification recipients.
+
+Maps each doctor to the FCM tokens of the devices subscribed to them, and
+keeps the active email/web push subscribers with their push subscription
+JSON already parsed. notify_doctors resolves recipients from here instead
+of querying subscriptions, doctor subscriptions and tokens per doctor.
+
+The subscription routes update the index as they write, and it is reloaded
+from the database periodically so other worker processes' writes show up.
+"""
+from sqlalchemy.orm import Session
+from app.database import Subscription, FCMToken, DoctorSubscription
+import json
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+class RecipientIndex:
+    """Doctor -> devices -> FCM token, plus active email/push subscribers."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._token_by_device = {}  # device_id -> FCM token
+        self._devices_by_doctor = {}  # doctor_name -> set of device_ids
+        self._subscribers = {}  # subscription id -> {"id", "email", "push_info"}
+
+    def load(self, db: Session):
+        """Rebuild the whole index from the database (three queries)."""
+        token_by_device = {
+            row.device_id: row.fcm_token
+            for row in db.query(FCMToken.device_id, FCMToken.fcm_token).all()
+        }
+        devices_by_doctor = {}
+        for row in db.query(DoctorSubscription.doctor_name, DoctorSubscription.device_id).all():
+            devices_by_doctor.setdefault(row.doctor_name, set()).add(row.device_id)
+        subscribers = {}
+        for sub in db.query(Subscription).filter(Subscription.is_active == True).all():
+            entry = self._subscriber_entry(sub)
+            if entry:
+                subscribers[sub.id] = entry
+
+        with self._lock:
+            self._token_by_device = token_by_device
+            self._devices_by_doctor = devices_by_doctor
+            self._subscribers = subscribers
+            self._loaded = True
+        logger.info(
+            f"Recipient index loaded: {len(token_by_device)} devices, "
+            f"{len(devices_by_doctor)} doctors, {len(subscribers)} subscribers"
+        )
+
+    def ensure_loaded(self, db: Session):
+        if not self._loaded:
+            self.load(db)
+
+    @staticmethod
+    def _subscriber_entry(sub: Subscription):
+        push_info = None
+        if sub.push_subscription:
+            try:
+                push_info = json.loads(sub.push_subscription)
+            except json.JSONDecodeError:
+                logger.error(f"Invalid push subscription JSON for subscription {sub.id}")
+        if not sub.email and not push_info:
+            return None
+        return {"id": sub.id, "email": sub.email, "push_info": push_info}
+
+    # Incremental updates from the write paths. Before the first load() these
+    # are no-ops; load() will pick the committed rows up.
+
+    def set_fcm_token(self, device_id: str, fcm_token: str):
+        with self._lock:
+            if self._loaded:
+                self._token_by_device[device_id] = fcm_token
+
+    def remove_device(self, device_id: str):
+        """Forget a device's token and all its doctor subscriptions."""
+        with self._lock:
+            self._token_by_device.pop(device_id, None)
+            for devices in self._devices_by_doctor.values():
+                devices.discard(device_id)
+
+    def add_doctor_subscription(self, device_id: str, doctor_name: str):
+        with self._lock:
+            if self._loaded:
+                self._devices_by_doctor.setdefault(doctor_name, set()).add(device_id)
+
+    def remove_doctor_subscription(self, device_id: str, doctor_name: str):
+        with self._lock:
+            devices = self._devices_by_doctor.get(doctor_name)
+            if devices is not None:
+                devices.discard(device_id)
+                if not devices:
+                    del self._devices_by_doctor[doctor_name]
+
+    def set_subscriber(self, sub: Subscription):
+        """Add, update or (if inactive) remove an email/web push subscriber."""
+        entry = self._subscriber_entry(sub) if sub.is_active else None
+        with self._lock:
+            if entry:
+                if self._loaded:
+                    self._subscribers[sub.id] = entry
+            else:
+                self._subscribers.pop(sub.id, None)
+
+    # Lookups
+
+    def fcm_recipients(self, doctor_name: str) -> dict:
+        """device_id -> FCM token for every registered device subscribed to the doctor."""
+        with self._lock:
+            return {
+                device_id: self._token_by_device[device_id]
+                for device_id in self._devices_by_doctor.get(doctor_name, ())
+                if device_id in self._token_by_device
+            }
+
+    def subscribers(self) -> list:
+        """Active email/web push subscribers as {"id", "email", "push_info"} dicts."""
+        with self._lock:
+            return list(self._subscribers.values())
+
+recipient_index = RecipientIndex()
@@ -0,0 +1,140 @@
+"""
+Schedule change log for delta sync (GET /schedules/changes).
+
+Every scrape that changes the schedules table gets the next schedule version,
+and scrape_and_save records in the same transaction which rows it upserted
+(with their new content) and which it deleted. A client that last synced at
+version N receives only what changed after N. A full reload writes a "reset"
+entry instead, and clients from before a reset, or from before the oldest
+version still in the log after compaction, are told to resync in full.
+"""
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+from app.database import Schedule, ScheduleChange, SQL_BATCH_SIZE
+from datetime import datetime, timedelta
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+def schedule_record(s) -> dict:
+    """A schedule row as /schedules returns it."""
+    return {
+        "id": s.id,
+        "date": s.date,
+        "name": s.name,
+        "timing": s.timing,
+        "category": s.category,
+        "room": s.room,
+        "created_at": s.created_at.isoformat() if s.created_at else None,
+        "updated_at": s.updated_at.isoformat() if s.updated_at else None
+    }
+
+def current_version(db: Session) -> int:
+    """Latest schedule version (0 before the first recorded change)."""
+    return db.execute(select(func.max(ScheduleChange.version))).scalar() or 0
+
+def record_changes(db: Session, upserted_ids: list, deleted_ids: list) -> int:
+    """
+    Log one scrape's changes as a new version (caller commits, with the changes themselves).
+
+    Args:
+        db: Database session the changes were written to
+        upserted_ids: Schedule ids inserted or updated by the scrape
+        deleted_ids: Schedule ids deleted by the scrape
+
+    Returns:
+        int: The new version
+    """
+    version = current_version(db) + 1
+    now = datetime.utcnow()
+    entries = [
+        {"version": version, "op": "delete", "schedule_id": schedule_id, "data": None, "created_at": now}
+        for schedule_id in deleted_ids
+    ]
+    for i in range(0, len(upserted_ids), SQL_BATCH_SIZE):
+        # populate_existing: the diff already loaded these rows into the session, and the
+        # bulk UPDATE did not refresh their cached updated_at (set by onupdate)
+        rows = db.query(Schedule).filter(
+            Schedule.id.in_(upserted_ids[i:i + SQL_BATCH_SIZE])
+        ).execution_options(populate_existing=True).all()
+        entries.extend(
+            {"version": version, "op": "upsert", "schedule_id": row.id,
+             "data": json.dumps(schedule_record(row)), "created_at": now}
+            for row in rows
+        )
+    for i in range(0, len(entries), SQL_BATCH_SIZE):
+        db.execute(insert(ScheduleChange), entries[i:i + SQL_BATCH_SIZE])
+    return version
+
+def record_reset(db: Session) -> int:
+    """Log a full reload as a new version that every older client must resync from (caller commits)."""
+    version = current_version(db) + 1
+    db.execute(insert(ScheduleChange), [
+        {"version": version, "op": "reset", "schedule_id": None, "data": None, "created_at": datetime.utcnow()}
+    ])
+    return version
+
+def changes_since(db: Session, since: int) -> dict:
+    """
+    Net changes after version `since`.
+
+    Args:
+        db: Database session
+        since: Version the client last synced to
+
+    Returns:
+        dict: "version" (current), "full_resync" (the log cannot bring this client up
+              to date), "upserted" (records) and "deleted" (schedule ids)
+    """
+    version = current_version(db)
+    result = {"version": version, "full_resync": False, "upserted": [], "deleted": []}
+    if since == version:
+        return result
+
+    oldest = db.execute(select(func.min(ScheduleChange.version))).scalar() or 0
+    reset_after = db.execute(
+        select(func.max(ScheduleChange.version)).where(
+            ScheduleChange.op == "reset", ScheduleChange.version > since
+        )
+    ).scalar()
+    # Never synced (rows from before the log existed are not in it), unknown version
+    # (e.g. another database), compacted away, or a full reload since
+    if since <= 0 or since > version or since < oldest - 1 or reset_after is not None:
+        result["full_resync"] = True
+        return result
+
+    # Replay in order; the last change to a row wins
+    upserted = {}
+    deleted = set()
+    for op, schedule_id, data in db.execute(
+        select(ScheduleChange.op, ScheduleChange.schedule_id, ScheduleChange.data)
+        .where(ScheduleChange.version > since)
+        .order_by(ScheduleChange.id)
+    ):
+        if op == "upsert":
+            upserted[schedule_id] = data
+            deleted.discard(schedule_id)
+        elif op == "delete":
+            upserted.pop(schedule_id, None)
+            deleted.add(schedule_id)
+
+    result["upserted"] = [json.loads(data) for data in upserted.values()]
+    result["deleted"] = sorted(deleted)
+    return result
+
+def compact_changes(db: Session, older_than: timedelta) -> int:
+    """
+    Delete log entries older than `older_than`, always keeping the current version
+    (committed by this call). Clients that synced before the oldest remaining
+    version are sent a full resync.
+    """
+    version = current_version(db)
+    result = db.execute(
+        delete(ScheduleChange).where(
+            ScheduleChange.created_at < datetime.utcnow() - older_than,
+            ScheduleChange.version < version
+        )
+    )
+    db.commit()
+    return result.rowcount
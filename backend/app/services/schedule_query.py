@@ -0,0 +1,116 @@
+"""
+Paged schedule queries for /schedules with limit, cursor, from/to or fields.
+
+Rows are returned in (schedule_date, id) order and paged by keyset: the cursor
+encodes the last row's key, and the next page starts right after it with an
+index seek, so every page costs the same however much history is stored.
+Rows whose date could not be parsed (no schedule_date) are not paged; they
+only appear in the full /schedules list.
+"""
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+from app.database import Schedule
+from app.scraper.notification_logic import parse_schedule_date
+from datetime import date
+import base64
+
+# Default and maximum rows per page
+MAX_PAGE_SIZE = 1000
+
+# Fields a client may select with fields=
+SCHEDULE_FIELDS = ("id", "date", "name", "timing", "category", "room", "created_at", "updated_at")
+
+def parse_date_param(value: str):
+    """A from/to bound: DD/MM/YYYY like the date filter, or ISO YYYY-MM-DD. Raises ValueError."""
+    parsed = parse_schedule_date(value)
+    if parsed:
+        return parsed
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid date '{value}', expected DD/MM/YYYY or YYYY-MM-DD")
+
+def parse_fields(value: str) -> tuple:
+    """Validate a comma-separated fields= projection. Raises ValueError."""
+    fields = tuple(dict.fromkeys(field.strip() for field in value.split(",") if field.strip()))
+    unknown = [field for field in fields if field not in SCHEDULE_FIELDS]
+    if unknown or not fields:
+        raise ValueError(f"Unknown field(s) {', '.join(unknown) or '(none)'}; choose from {', '.join(SCHEDULE_FIELDS)}")
+    return fields
+
+def encode_cursor(schedule_date: date, schedule_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{schedule_date.isoformat()}:{schedule_id}".encode("ascii")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple:
+    """(schedule_date, id) of the last row of the previous page. Raises ValueError."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("ascii")
+        day, schedule_id = raw.split(":")
+        return date.fromisoformat(day), int(schedule_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+
+def query_schedules(
+    db: Session,
+    date_from: date = None,
+    date_to: date = None,
+    date_fragment: str = None,
+    cursor: str = None,
+    limit: int = None,
+    fields: tuple = SCHEDULE_FIELDS
+) -> dict:
+    """
+    One page of schedules.
+
+    Args:
+        db: Database session
+        date_from: First schedule date to include
+        date_to: Last schedule date to include
+        date_fragment: Substring the raw date must contain (e.g. "SATURDAY")
+        cursor: next_cursor of the previous page
+        limit: Rows per page (capped at MAX_PAGE_SIZE)
+        fields: Fields to return per row
+
+    Returns:
+        dict: "count", "data" and "next_cursor" (None on the last page)
+    """
+    limit = min(limit or MAX_PAGE_SIZE, MAX_PAGE_SIZE)
+
+    # Only the selected columns are loaded, plus the keyset columns for the cursor
+    columns = [getattr(Schedule, field) for field in fields if field != "id"]
+    query = db.query(Schedule.schedule_date, Schedule.id, *columns).filter(Schedule.schedule_date.isnot(None))
+    if date_from:
+        query = query.filter(Schedule.schedule_date >= date_from)
+    if date_to:
+        query = query.filter(Schedule.schedule_date <= date_to)
+    if date_fragment:
+        query = query.filter(Schedule.date.contains(date_fragment))
+    if cursor:
+        last_date, last_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            Schedule.schedule_date > last_date,
+            and_(Schedule.schedule_date == last_date, Schedule.id > last_id)
+        ))
+
+    # One extra row tells whether there is a next page
+    rows = query.order_by(Schedule.schedule_date, Schedule.id).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].schedule_date, rows[-1].id)
+
+    data = []
+    for row in rows:
+        record = {}
+        for field in fields:
+            value = getattr(row, field)
+            if field in ("created_at", "updated_at") and value is not None:
+                value = value.isoformat()
+            record[field] = value
+        data.append(record)
+
+    return {
+        "count": len(data),
+        "data": data,
+        "next_cursor": next_cursor
+    }
@@ -0,0 +1,198 @@
+"""
+Immutable in-memory snapshot of the schedules table for GET /schedules.
+
+The table only changes when scrape_and_save runs, so instead of querying and
+serializing on every request, the snapshot is rebuilt once after each scrape
+that changed the schedule (via the schedule listener) and swapped in
+atomically. It holds the JSON response bodies, already serialized, for the
+full list and for every date, each with a strong ETag derived from its bytes,
+so polling clients are answered with a dictionary lookup or a 304.
+
+Bodies are also stored gzip- and (when the brotli package is installed)
+brotli-compressed, so the compression work happens once per scrape and
+requests only pick a variant by Accept-Encoding.
+"""
+from sqlalchemy.orm import Session
+from app.database import SessionLocal, Schedule
+from app.services.schedule_changes import current_version, schedule_record
+from datetime import datetime
+import gzip
+import hashlib
+import json
+import logging
+import threading
+
+try:
+    import brotli
+except ImportError:  # Optional: gzip only
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESS_SIZE = 256
+
+# Content codings we store, most preferred first
+ENCODINGS = ("br", "gzip") if brotli else ("gzip",)
+
+# (brotli quality, gzip level). The full list is the big body every client
+# pulls, so it gets maximum compression (~1s of brotli for a large schedule,
+# once per scrape); the many small per-date bodies use fast levels.
+BEST_COMPRESSION = (11, 9)
+FAST_COMPRESSION = (5, 6)
+
+def serialize(payload: dict) -> bytes:
+    """JSON bytes, encoded the same way as FastAPI's JSONResponse."""
+    return json.dumps(payload, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+def make_etag(body: bytes) -> str:
+    """Strong ETag for a response body."""
+    return f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Whether an If-None-Match header covers `etag` (weak comparison, as RFC 9110 requires for it)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return any((tag[2:] if tag.startswith("W/") else tag) == etag for tag in tags)
+
+def compress(body: bytes, encoding: str, levels: tuple = BEST_COMPRESSION) -> bytes:
+    """Compress a body (once per snapshot, not per request) at the given (brotli, gzip) levels."""
+    if encoding == "br":
+        return brotli.compress(body, quality=levels[0])
+    # mtime=0 keeps the output identical across rebuilds
+    return gzip.compress(body, compresslevel=levels[1], mtime=0)
+
+def choose_encoding(accept_encoding: str, available) -> str:
+    """
+    Pick the content coding to send.
+
+    Args:
+        accept_encoding: The request's Accept-Encoding header (may be None)
+        available: Codings stored for the body, most preferred first
+
+    Returns:
+        str: One of `available`, or "identity" if the client accepts none of them
+    """
+    if not accept_encoding:
+        return "identity"
+    accepted = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip().lower()] = q
+    wildcard = accepted.get("*", 0.0)
+
+    best, best_q = "identity", 0.0
+    for coding in available:
+        q = accepted.get(coding, wildcard)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+class SnapshotBody:
+    """A pre-serialized response body and its ETag, plus compressed variants."""
+
+    __slots__ = ("body", "etag", "variants")
+
+    def __init__(self, records: list, precompress: bool = True, levels: tuple = BEST_COMPRESSION):
+        self.body = serialize({"count": len(records), "data": records})
+        self.etag = make_etag(self.body)
+        # encoding -> (bytes, ETag); each representation gets its own strong ETag
+        self.variants = {"identity": (self.body, self.etag)}
+        if precompress and len(self.body) >= MIN_COMPRESS_SIZE:
+            for encoding in ENCODINGS:
+                self.variants[encoding] = (compress(self.body, encoding, levels), f'{self.etag[:-1]}-{encoding}"')
+
+    def variant(self, accept_encoding: str):
+        """(encoding, bytes, ETag) of the best representation the client accepts."""
+        encoding = choose_encoding(accept_encoding, [e for e in ENCODINGS if e in self.variants])
+        body, etag = self.variants[encoding]
+        return encoding, body, etag
+
+    def etags(self) -> list:
+        """ETags of every stored representation (they all have the same content)."""
+        return [etag for _, etag in self.variants.values()]
+
+class ScheduleSnapshot:
+    """One version of the schedules table (its change log version); never modified after construction."""
+
+    def __init__(self, version: int, rows: list):
+        self.version = version
+        self.built_at = datetime.utcnow()
+        self.records = tuple(schedule_record(s) for s in rows)
+        self.full = SnapshotBody(list(self.records))
+
+        by_date = {}
+        for s, record in zip(rows, self.records):
+            if s.schedule_date is not None:
+                by_date.setdefault(s.schedule_date, []).append(record)
+        self.by_date = {
+            day: SnapshotBody(records, levels=FAST_COMPRESSION) for day, records in by_date.items()
+        }
+        self.empty = SnapshotBody([])
+
+    def for_date(self, schedule_date) -> SnapshotBody:
+        """Body for one normalized date (empty list if there are no schedules that day)."""
+        return self.by_date.get(schedule_date, self.empty)
+
+    def matching(self, date_fragment: str) -> SnapshotBody:
+        """Body for a partial date match (e.g. "SATURDAY"); serialized on demand and uncompressed, as these are rare."""
+        return SnapshotBody(
+            [record for record in self.records if date_fragment in (record["date"] or "")], precompress=False
+        )
+
+class ScheduleSnapshotStore:
+    """Holds the current snapshot; rebuilt after scrapes, built lazily on first use."""
+
+    def __init__(self):
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def get(self, db: Session = None) -> ScheduleSnapshot:
+        """Current snapshot, built from `db` (or a new session) if there is none yet."""
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self._build(db)
+                snapshot = self._snapshot
+        return snapshot
+
+    def rebuild(self, db: Session = None) -> ScheduleSnapshot:
+        with self._lock:
+            self._build(db)
+            return self._snapshot
+
+    def on_schedules_changed(self, result: dict):
+        """scrape_and_save listener: publish the new schedule."""
+        self.rebuild()
+
+    def _build(self, db: Session = None):
+        own_session = db is None
+        db = db or SessionLocal()
+        try:
+            # Version first: if a scrape commits in between, the rows are newer than the
+            # version, and replaying those changes from the log is harmless
+            version = current_version(db)
+            rows = db.query(Schedule).order_by(Schedule.id).all()
+        finally:
+            if own_session:
+                db.close()
+
+        # Single reference swap: readers see either the old or the new snapshot, never a mix
+        self._snapshot = ScheduleSnapshot(version, rows)
+        logger.info(
+            f"Schedule snapshot v{version} built: {len(rows)} rows, "
+            f"{len(self._snapshot.by_date)} dates, {len(self._snapshot.full.body)} bytes "
+            f"({', '.join(f'{e} {len(b)}' for e, (b, _) in self._snapshot.full.variants.items() if e != 'identity')})"
+        )
+
+schedule_snapshot = ScheduleSnapshotStore()
@@ -1,47 +1,236 @@
+from sqlalchemy import func, insert, select, update
 from sqlalchemy.orm import Session
-from app.database import Schedule
+from app.database import Schedule, SQL_BATCH_SIZE
 from app.scraper.extract_schedule import extract_schedule
+from app.scraper.notification_logic import parse_schedule_date, parse_time_range
+from app.services.schedule_changes import record_changes, record_reset
 import logging
 
 logger = logging.getLogger(__name__)
 
-def scrape_and_save(db: Session) -> dict:
+# Columns that identify a schedule row; everything else is updatable.
+# The normalized date/time columns are derived from the key, so they only
+# differ for rows stored before those columns existed (which get backfilled).
+SCHEDULE_KEY_FIELDS = ("date", "name", "category", "timing")
+SCHEDULE_VALUE_FIELDS = ("room", "schedule_date", "start_minute", "end_minute")
+
+# Rows per executemany batch when bulk writing
+BULK_BATCH_SIZE = 5000
+
+# Callbacks run with the scrape result after changes are committed
+_schedule_listeners = []
+
+def add_schedule_listener(callback):
+    """Register callback(result) to run after a scrape changes the schedules table."""
+    if callback not in _schedule_listeners:
+        _schedule_listeners.append(callback)
+
+def _notify_schedule_listeners(result: dict):
+    for callback in list(_schedule_listeners):
+        try:
+            callback(result)
+        except Exception as e:
+            logger.error(f"Schedule listener {getattr(callback, '__name__', callback)} failed: {str(e)}")
+
+def _record_values(item: dict) -> dict:
+    """Column values for a scraped record, as they are stored in the database."""
+    values = {
+        "date": item.get("date", ""),
+        "name": item.get("name", ""),
+        "timing": item.get("timing", ""),
+        "category": item.get("category", ""),
+        "room": item.get("room", ""),
+        "schedule_date": parse_schedule_date(item.get("date")),
+        "start_minute": None,
+        "end_minute": None
+    }
+    
+    times = parse_time_range(values["timing"])
+    if times:
+        start, end = times
+        values["start_minute"] = start.hour * 60 + start.minute
+        values["end_minute"] = end.hour * 60 + end.minute
+    return values
+
+def _schedule_key(values) -> tuple:
+    if isinstance(values, Schedule):
+        return tuple(getattr(values, field) for field in SCHEDULE_KEY_FIELDS)
+    return tuple(values[field] for field in SCHEDULE_KEY_FIELDS)
+
+def diff_schedules(existing: list, data: list, keep_dates=()) -> dict:
+    """
+    Compare stored schedule rows against freshly scraped records.
+
+    Rows are matched on (date, name, category, timing). A key that occurs
+    several times is matched pairwise, so duplicate entries are preserved.
+
+    Args:
+        existing: Schedule rows currently in the database
+        data: Scraped records from extract_schedule()
+        keep_dates: Dates whose sheets could not be read this time; their
+                    unmatched rows are kept instead of deleted
+
+    Returns:
+        dict: "insert" (list of column dicts), "update" (list of (row, column dict)),
+              "delete" (list of rows) and "unchanged" (count)
+    """
+    stored = {}
+    for row in existing:
+        stored.setdefault(_schedule_key(row), []).append(row)
+
+    to_insert = []
+    to_update = []
+    unchanged = 0
+
+    for item in data:
+        values = _record_values(item)
+        rows = stored.get(_schedule_key(values))
+        if not rows:
+            to_insert.append(values)
+            continue
+
+        row = rows.pop(0)
+        if any(getattr(row, field) != values[field] for field in SCHEDULE_VALUE_FIELDS):
+            to_update.append((row, values))
+        else:
+            unchanged += 1
+
+    to_delete = [row for rows in stored.values() for row in rows if row.date not in keep_dates]
+
+    return {
+        "insert": to_insert,
+        "update": to_update,
+        "delete": to_delete,
+        "unchanged": unchanged
+    }
+
+def bulk_insert_schedules(db: Session, rows: list, batch_size: int = BULK_BATCH_SIZE) -> int:
+    """
+    Insert schedule rows with executemany, bypassing ORM objects and the identity map.
+
+    SQLAlchemy sends each batch as multi-row INSERT ... VALUES statements on
+    both SQLite and PostgreSQL. Column defaults (created_at/updated_at) still apply.
+
+    Args:
+        db: Database session (caller commits)
+        rows: Column dicts as produced by _record_values()
+        batch_size: Rows per executemany call
+
+    Returns:
+        int: Number of rows inserted
+    """
+    for i in range(0, len(rows), batch_size):
+        db.execute(insert(Schedule), rows[i:i + batch_size])
+    return len(rows)
+
+def apply_schedule_diff(db: Session, diff: dict) -> list:
+    """
+    Write a diff from diff_schedules() to the session (caller commits).
+
+    Returns:
+        list: Ids of the inserted rows
+    """
+    delete_ids = [row.id for row in diff["delete"]]
+    for i in range(0, len(delete_ids), SQL_BATCH_SIZE):
+        db.query(Schedule).filter(
+            Schedule.id.in_(delete_ids[i:i + SQL_BATCH_SIZE])
+        ).delete(synchronize_session=False)
+
+    if diff["update"]:
+        # ORM bulk UPDATE by primary key: one executemany, no per-object flush
+        db.execute(update(Schedule), [
+            {"id": row.id, **{field: values[field] for field in SCHEDULE_VALUE_FIELDS}}
+            for row, values in diff["update"]
+        ])
+
+    if not diff["insert"]:
+        return []
+    # New rows get ids above the current maximum (taken after the deletes, as SQLite may reuse freed top ids)
+    last_id = db.execute(select(func.max(Schedule.id))).scalar() or 0
+    bulk_insert_schedules(db, diff["insert"])
+    return list(db.execute(select(Schedule.id).where(Schedule.id > last_id)).scalars())
+
+def replace_schedules(db: Session, data: list) -> int:
+    """Full reload: delete every schedule and bulk insert `data` (caller commits)."""
+    db.query(Schedule).delete(synchronize_session=False)
+    return bulk_insert_schedules(db, [_record_values(item) for item in data])
+
+def scrape_and_save(db: Session, full_reload: bool = False) -> dict:
     """
     Runs the scraper and saves results to database.
-    Returns: dict with status and count
+    Only rows that were added, changed or removed since the last scrape are written,
+    unless full_reload is set, in which case the table is replaced in bulk.
+    Returns: dict with status, count and per-operation change counts
     """
     try:
         logger.info("Starting scraper...")
-        data = extract_schedule()
-        
+        failed_sheets = set()
+        data = extract_schedule(failed_sheets)
+
         if not data:
             logger.warning("No data returned from scraper")
             return {"status": "warning", "message": "No data scraped", "count": 0}
-        
-        # Clear existing schedules (or implement smart update logic)
-        # For simplicity, we'll delete all and re-insert
-        db.query(Schedule).delete()
-        
-        # Insert new schedules
-        for item in data:
-            schedule = Schedule(
-                date=item.get("date", ""),
-                name=item.get("name", ""),
-                timing=item.get("timing", ""),
-                category=item.get("category", ""),
-                room=item.get("room", "")
+
+        if failed_sheets:
+            # A partial scrape must not remove the rows of the sheets it missed
+            logger.warning(
+                f"{len(failed_sheets)} sheet(s) could not be read, keeping their stored rows: "
+                f"{', '.join(sorted(failed_sheets))}"
+            )
+            if full_reload:
+                logger.warning("Full reload skipped because the scrape is incomplete, applying changes instead")
+                full_reload = False
+
+        if full_reload:
+            replace_schedules(db, data)
+            version = record_reset(db)
+            db.commit()
+            logger.info(f"Reloaded {len(data)} schedules into database")
+            result = {
+                "status": "success",
+                "message": f"Scraped and reloaded {len(data)} doctor schedules",
+                "count": len(data),
+                "inserted": len(data),
+                "version": version
+            }
+            _notify_schedule_listeners(result)
+            return result
+
+        diff = diff_schedules(db.query(Schedule).all(), data, failed_sheets)
+        inserted_ids = apply_schedule_diff(db, diff)
+
+        inserted = len(diff["insert"])
+        updated = len(diff["update"])
+        deleted = len(diff["delete"])
+        version = None
+        if inserted or updated or deleted:
+            # Change log for delta sync, committed together with the changes
+            version = record_changes(
+                db,
+                inserted_ids + [row.id for row, _ in diff["update"]],
+                [row.id for row in diff["delete"]]
             )
-            db.add(schedule)
-        
         db.commit()
-        logger.info(f"Saved {len(data)} schedules to database")
-        
-        return {
+        logger.info(
+            f"Saved {len(data)} schedules to database "
+            f"({inserted} inserted, {updated} updated, {deleted} deleted, {diff['unchanged']} unchanged)"
+        )
+
+        result = {
             "status": "success",
             "message": f"Scraped and saved {len(data)} doctor schedules",
-            "count": len(data)
+            "count": len(data),
+            "inserted": inserted,
+            "updated": updated,
+            "deleted": deleted,
+            "unchanged": diff["unchanged"],
+            "failed_sheets": len(failed_sheets),
+            "version": version
         }
-        
+        if inserted or updated or deleted:
+            _notify_schedule_listeners(result)
+        return result
+
     except Exception as e:
         logger.error(f"Scraping failed: {str(e)}")
         db.rollback()
@@ -0,0 +1,148 @@
+"""
+Pool of authenticated SMTP sessions.
+
+Opening a connection, running STARTTLS and logging in costs several round
+trips and a TLS handshake, so sessions are kept open and reused for many
+messages. At most `size` sessions exist at once, which bounds concurrent
+deliveries. Sessions are recycled after `max_messages` messages or `max_idle`
+seconds unused (servers drop idle clients), and a send that finds its reused
+session disconnected reconnects once.
+"""
+from app.config import get_settings
+import logging
+import queue
+import smtplib
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+class SMTPConnectionPool:
+    """Bounded pool of logged-in smtplib.SMTP sessions."""
+
+    def __init__(self, host: str, port: int, user: str = "", password: str = "", size: int = 4,
+                 starttls: bool = True, timeout: float = 30.0, max_messages: int = 100, max_idle: float = 60.0):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.size = max(1, size)
+        self.starttls = starttls
+        self.timeout = timeout
+        self.max_messages = max_messages
+        self.max_idle = max_idle
+        self._idle = queue.LifoQueue()  # [server, messages sent, last used]; LIFO keeps few sessions warm
+        self._slots = threading.BoundedSemaphore(self.size)
+        self.stats = {"connections": 0, "messages": 0, "reconnects": 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, key: str):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def _connect(self) -> smtplib.SMTP:
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.starttls:
+                server.starttls()
+            if self.user:
+                server.login(self.user, self.password)
+        except Exception:
+            self._close(server)
+            raise
+        self._count("connections")
+        return server
+
+    @staticmethod
+    def _close(server: smtplib.SMTP):
+        try:
+            server.quit()
+        except Exception:
+            server.close()
+
+    def _checkout(self) -> list:
+        """Take an idle session (or open one). Caller must hold a slot."""
+        while True:
+            try:
+                entry = self._idle.get_nowait()
+            except queue.Empty:
+                return [self._connect(), 0, time.monotonic()]
+            if time.monotonic() - entry[2] > self.max_idle:
+                self._close(entry[0])
+                continue
+            return entry
+
+    def _checkin(self, entry: list):
+        if entry[1] >= self.max_messages:
+            self._close(entry[0])
+        else:
+            entry[2] = time.monotonic()
+            self._idle.put(entry)
+
+    def send_message(self, msg):
+        """
+        Send an email.message.Message over a pooled session.
+        Blocks while all `size` sessions are busy; raises smtplib errors like SMTP.send_message.
+        """
+        with self._slots:
+            entry = self._checkout()
+            reused = entry[1] > 0
+            try:
+                entry[0].send_message(msg)
+            except (smtplib.SMTPServerDisconnected, ConnectionError) as e:
+                self._close(entry[0])
+                if not reused:
+                    raise
+                # The server dropped a session we kept open: reconnect once
+                logger.info(f"SMTP session dropped ({str(e)}), reconnecting")
+                self._count("reconnects")
+                entry = [self._connect(), 0, time.monotonic()]
+                try:
+                    entry[0].send_message(msg)
+                except Exception:
+                    self._close(entry[0])
+                    raise
+            except Exception:
+                # Unknown session state after an SMTP error: don't reuse it
+                self._close(entry[0])
+                raise
+
+            entry[1] += 1
+            self._count("messages")
+            self._checkin(entry)
+
+    def close(self):
+        """Log out of every idle session."""
+        while True:
+            try:
+                entry = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._close(entry[0])
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_smtp_pool() -> SMTPConnectionPool:
+    """Return the process-wide pool for the configured SMTP server, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = SMTPConnectionPool(
+                    settings.SMTP_HOST,
+                    settings.SMTP_PORT,
+                    settings.SMTP_USER,
+                    settings.SMTP_PASSWORD,
+                    size=settings.SMTP_POOL_SIZE,
+                    starttls=settings.SMTP_STARTTLS,
+                    timeout=settings.SMTP_TIMEOUT,
+                    max_messages=settings.SMTP_MAX_MESSAGES_PER_SESSION,
+                    max_idle=settings.SMTP_MAX_IDLE_SECONDS
+                )
+    return _pool
+
+def close_smtp_pool():
+    if _pool is not None:
+        _pool.close()
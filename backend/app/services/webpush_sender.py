@@ -0,0 +1,170 @@
+"""
+Web push delivery with cached VAPID signing and pooled connections.
+
+pywebpush.webpush() parses the VAPID private key and signs a fresh JWT on
+every call. Here the key is parsed once, and the signed VAPID headers are
+cached per push-service origin (the JWT audience) until shortly before the
+JWT expires. Requests go over one keep-alive session shared by the outbox
+workers, which provide the concurrency.
+
+Subscriptions the push service reports as gone (404/410) are dropped by
+prune_push_subscriptions() instead of being retried on every notification.
+"""
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from pywebpush import WebPusher
+from py_vapid import Vapid
+from urllib.parse import urlparse
+from app.config import get_settings
+from app.database import Subscription
+from app.http_client import create_session
+from app.services.outcomes import SENT, INVALID_TOKEN, RETRYABLE, FAILED
+from app.services.rate_limit import limiters, parse_retry_after
+from app.services.recipient_index import recipient_index
+import json
+import logging
+import requests
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Signed JWTs are valid this long (the spec allows at most 24 hours)
+VAPID_JWT_LIFETIME = 12 * 60 * 60
+# Re-sign this long before expiry so no request carries an expiring token
+VAPID_JWT_REFRESH_MARGIN = 10 * 60
+
+# Seconds a push service should keep an undelivered message
+PUSH_TTL = 60 * 60
+
+class VapidSigner:
+    """Parses the VAPID key once and caches signed headers per push-service origin."""
+
+    def __init__(self, private_key: str, subject: str):
+        self.private_key = private_key
+        # The sub claim must be a mailto: or https: URL
+        self.subject = subject if subject.startswith(("mailto:", "https:")) else f"mailto:{subject}"
+        self._vapid = None
+        self._headers = {}  # origin -> (headers, exp)
+        self._lock = threading.Lock()
+
+    def headers_for(self, endpoint: str) -> dict:
+        """VAPID Authorization headers for a subscription endpoint."""
+        url = urlparse(endpoint)
+        origin = f"{url.scheme}://{url.netloc}"
+        now = int(time.time())
+
+        with self._lock:
+            cached = self._headers.get(origin)
+            if cached and cached[1] - VAPID_JWT_REFRESH_MARGIN > now:
+                return cached[0]
+
+            if self._vapid is None:
+                self._vapid = Vapid.from_string(private_key=self.private_key)
+            exp = now + VAPID_JWT_LIFETIME
+            headers = self._vapid.sign({"sub": self.subject, "aud": origin, "exp": exp})
+            self._headers[origin] = (headers, exp)
+            return headers
+
+_signer = None
+_init_lock = threading.Lock()
+
+# Shared keep-alive session; subscriptions point at a handful of push services
+_session = create_session(settings.OUTBOX_WEBPUSH_CONCURRENCY, pool_connections=8)
+
+def _get_signer() -> VapidSigner:
+    global _signer
+    if _signer is None:
+        with _init_lock:
+            if _signer is None:
+                _signer = VapidSigner(settings.VAPID_PRIVATE_KEY, settings.VAPID_EMAIL)
+    return _signer
+
+def send_webpush(subscription_info: dict, payload: str, timeout: float = 10.0) -> str:
+    """
+    Encrypt and send one push message.
+
+    Args:
+        subscription_info: Browser PushSubscription (endpoint and keys)
+        payload: Message body (JSON text)
+        timeout: Seconds to wait for the push service
+
+    Returns:
+        str: SENT, INVALID_TOKEN (subscription gone: 404/410), RETRYABLE or FAILED
+    """
+    endpoint = subscription_info.get("endpoint", "")
+    try:
+        headers = dict(_get_signer().headers_for(endpoint))
+        limiters["webpush"].acquire()
+        response = WebPusher(subscription_info, requests_session=_session).send(
+            payload,
+            headers,
+            ttl=PUSH_TTL,
+            content_encoding="aes128gcm",
+            timeout=timeout
+        )
+    except (requests.Timeout, requests.ConnectionError) as e:
+        logger.error(f"Web push to {endpoint[:60]} failed: {str(e)}")
+        return RETRYABLE
+    except Exception as e:
+        logger.error(f"Failed to send push notification: {str(e)}")
+        return FAILED
+
+    status = response.status_code
+    if status < 300:
+        return SENT
+    if status in (404, 410):
+        logger.info(f"Push subscription expired ({status}): {endpoint[:60]}")
+        return INVALID_TOKEN
+    if status == 429:
+        limiters["webpush"].pause(parse_retry_after(response.headers.get("Retry-After"), default=30))
+        return RETRYABLE
+    logger.error(f"Web push failed with status {status}: {response.text[:200]}")
+    return RETRYABLE if status >= 500 else FAILED
+
+def prune_push_subscriptions(db: Session, endpoints: dict) -> int:
+    """
+    Drop web push subscriptions the push service reported as expired.
+
+    A subscription is only dropped if it still has the dead endpoint, so a
+    browser that re-subscribed in the meantime is left alone. Subscribers
+    without an email are deactivated.
+
+    Args:
+        db: Database session (committed by this call)
+        endpoints: Subscription id -> endpoint that returned 404/410
+
+    Returns:
+        int: Number of subscriptions dropped
+    """
+    if not endpoints:
+        return 0
+
+    try:
+        subs = db.execute(
+            select(Subscription).where(Subscription.id.in_(list(endpoints)))
+        ).scalars().all()
+        dropped = []
+        for sub in subs:
+            try:
+                endpoint = json.loads(sub.push_subscription or "{}").get("endpoint")
+            except ValueError:
+                endpoint = None
+            if endpoint != endpoints[sub.id]:
+                continue
+            sub.push_subscription = None
+            if not sub.email:
+                sub.is_active = False
+            dropped.append(sub)
+        db.commit()
+    except Exception as e:
+        logger.error(f"Failed to prune push subscriptions: {str(e)}")
+        db.rollback()
+        return 0
+
+    for sub in dropped:
+        recipient_index.set_subscriber(sub)
+    if dropped:
+        logger.info(f"Dropped {len(dropped)} expired push subscription(s)")
+    return len(dropped)
@@ -0,0 +1,81 @@
+"""
+Measure email delivery throughput: a new SMTP session per message vs the session pool.
+
+Runs against the local SMTP stand-in (benchmarks.fake_smtp), whose connect and
+login delays model the TLS handshake and AUTH round trips of a real provider.
+
+Usage (from backend/):
+    python -m benchmarks.bench_email_delivery
+    python -m benchmarks.bench_email_delivery --messages 500 --pool-sizes 1 4 8 --connect-ms 150 --auth-ms 100
+"""
+import argparse
+import smtplib
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.services.notification_service import build_email_message
+from app.services.smtp_pool import SMTPConnectionPool
+from benchmarks import fake_smtp
+
+DOCTORS = [{"name": "Dr. Synthetic", "category": "Regular/Dentist", "starts_in_minutes": 30, "time_range": "09:00 AM to 01:00 PM"}]
+
+def send_per_message(host: str, port: int, messages: list):
+    """The previous path: connect and log in for every message, one at a time."""
+    for msg in messages:
+        with smtplib.SMTP(host, port) as server:
+            server.login("bench", "bench")
+            server.send_message(msg)
+
+def send_pooled(pool: SMTPConnectionPool, messages: list):
+    with ThreadPoolExecutor(max_workers=pool.size) as executor:
+        list(executor.map(pool.send_message, messages))
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--messages", type=int, default=200)
+    arg_parser.add_argument("--pool-sizes", type=int, nargs="+", default=[1, 4, 8])
+    arg_parser.add_argument("--connect-ms", type=float, default=100.0, help="Stand-in handshake delay")
+    arg_parser.add_argument("--auth-ms", type=float, default=50.0, help="Stand-in login delay")
+    arg_parser.add_argument("--message-ms", type=float, default=5.0, help="Stand-in per-message delay")
+    arg_parser.add_argument("--port", type=int, default=2526)
+    args = arg_parser.parse_args()
+
+    server, state = fake_smtp.start_in_background(
+        port=args.port,
+        connect_delay=args.connect_ms / 1000,
+        auth_delay=args.auth_ms / 1000,
+        message_delay=args.message_ms / 1000
+    )
+    messages = [build_email_message(f"user{i}@example.com", DOCTORS) for i in range(args.messages)]
+    for msg in messages:
+        msg.replace_header("From", "bench@example.com")
+
+    print(f"{args.messages} messages, stand-in delays: connect {args.connect_ms}ms, "
+          f"auth {args.auth_ms}ms, message {args.message_ms}ms")
+    print(f"{'mode':<28}{'seconds':>10}{'msgs/sec':>12}{'sessions':>10}")
+
+    # The baseline is slow by design; cap it so the benchmark stays quick
+    baseline = messages[:min(len(messages), 50)]
+    before = state.snapshot()
+    start = time.perf_counter()
+    send_per_message("127.0.0.1", args.port, baseline)
+    elapsed = time.perf_counter() - start
+    sessions = state.snapshot()["connections"] - before["connections"]
+    print(f"{f'session per message ({len(baseline)})':<28}{elapsed:>10.2f}{len(baseline) / elapsed:>12.1f}{sessions:>10}")
+
+    for size in args.pool_sizes:
+        pool = SMTPConnectionPool("127.0.0.1", args.port, "bench", "bench", size=size, starttls=False)
+        before = state.snapshot()
+        start = time.perf_counter()
+        send_pooled(pool, messages)
+        elapsed = time.perf_counter() - start
+        pool.close()
+        sessions = state.snapshot()["connections"] - before["connections"]
+        print(f"{f'pool of {size}':<28}{elapsed:>10.2f}{len(messages) / elapsed:>12.1f}{sessions:>10}")
+
+    server.shutdown()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+"""
+Compare the lxml sheet parser against the legacy pandas.read_html path.
+
+Checks that both produce identical records, then reports parse throughput,
+peak parse memory and the cost of importing each parser's dependencies.
+
+Usage (from backend/):
+    python -m benchmarks.bench_sheet_parser                  # synthetic sheets
+    python -m benchmarks.bench_sheet_parser saved/*.html     # recorded sheet pages
+    python -m benchmarks.bench_sheet_parser --sheets 60 --repeat 5
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from benchmarks.synthetic_sheets import make_sheet_html, sheet_name
+
+def load_fixtures(paths: list, sheets: int) -> list:
+    """Recorded pages use their file name as the sheet name."""
+    if paths:
+        fixtures = []
+        for path in paths:
+            with open(path, encoding="utf-8") as f:
+                fixtures.append((os.path.splitext(os.path.basename(path))[0], f.read()))
+        return fixtures
+    return [(sheet_name(i), make_sheet_html(i)) for i in range(sheets)]
+
+def import_cost(module: str) -> tuple:
+    """Wall time (s) and max RSS (MB) of a fresh interpreter that imports `module`."""
+    code = (
+        "import resource, time; t = time.perf_counter(); "
+        f"import {module}; "
+        "print(time.perf_counter() - t, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)"
+    )
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    seconds, max_rss_kb = out.stdout.split()
+    return float(seconds), int(max_rss_kb) / 1024
+
+def run_parser(parser: str, fixtures: list, repeat: int) -> tuple:
+    """Returns (records from the last run, best wall time, peak traced memory in MB)."""
+    from app.scraper.extract_schedule import parse_sheet
+
+    best = float("inf")
+    records = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        records = []
+        for name, page in fixtures:
+            parsed = parse_sheet(name, page, parser)
+            if parsed:
+                records.extend(parsed[0])
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    for name, page in fixtures:
+        parse_sheet(name, page, parser)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return records, best, peak / (1024 * 1024)
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("fixtures", nargs="*", help="Saved sheet HTML pages (default: synthetic)")
+    arg_parser.add_argument("--sheets", type=int, default=30, help="Number of synthetic sheets")
+    arg_parser.add_argument("--repeat", type=int, default=3, help="Timed runs per parser (best is reported)")
+    args = arg_parser.parse_args()
+
+    fixtures = load_fixtures(args.fixtures, args.sheets)
+    size_kb = sum(len(page) for _, page in fixtures) / 1024
+    print(f"{len(fixtures)} sheets, {size_kb:.0f} KB of HTML\n")
+
+    # Measure imports before this process loads pandas: a forked child
+    # reports the parent's peak RSS until it execs
+    imports = {
+        label: import_cost(module)
+        for label, module in (("pandas + numpy", "pandas"), ("lxml.html", "lxml.html"))
+    }
+
+    results = {}
+    for parser in ("pandas", "lxml"):
+        results[parser] = run_parser(parser, fixtures, args.repeat)
+
+    print(f"{'parser':<8} {'records':>8} {'parse ms':>10} {'sheets/s':>10} {'peak MB':>8}")
+    for parser, (records, best, peak) in results.items():
+        print(f"{parser:<8} {len(records):>8} {best * 1000:>10.1f} {len(fixtures) / best:>10.0f} {peak:>8.2f}")
+
+    print(f"\n{'imports':<28} {'seconds':>8} {'max RSS MB':>11}")
+    for label, (seconds, rss) in imports.items():
+        print(f"{label:<28} {seconds:>8.3f} {rss:>11.1f}")
+
+    pandas_records, lxml_records = results["pandas"][0], results["lxml"][0]
+    if pandas_records == lxml_records:
+        print("\nOutput: identical")
+        return 0
+
+    print("\nOutput: DIFFERENT")
+    for i, (a, b) in enumerate(zip(pandas_records, lxml_records)):
+        if a != b:
+            print(f"  first difference at record {i}:\n    pandas: {a}\n    lxml:   {b}")
+            break
+    else:
+        print(f"  pandas gave {len(pandas_records)} records, lxml gave {len(lxml_records)}")
+    return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+"""
+Check that a partial scrape never deletes the schedule rows of the sheets it missed.
+
+Serves a synthetic health center page, its published workbook and N sheets
+from a local stand-in, scrapes them into a temporary SQLite database with
+scrape_and_save, then makes one sheet fail (HTTP 500) and scrapes again:
+with the sheet cache warm, with it cleared, and as a full reload. Each of
+those must delete nothing. Recovering must change nothing, while a sheet
+that really disappears from the workbook must still have its rows deleted.
+
+Usage (from backend/):
+    python -m benchmarks.check_partial_scrape
+    python -m benchmarks.check_partial_scrape --sheets 30 --port 9299
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+
+from benchmarks import stand_in
+from benchmarks.synthetic_sheets import make_sheet_html, sheet_name
+
+class FakeSheetsState(stand_in.StandInState):
+    """The workbook being served and which of its sheets currently fail."""
+
+    def __init__(self, sheets: int):
+        super().__init__(("pages", "sheets", "failed"))
+        self.sheets = list(range(sheets))
+        self.failing = set()
+
+class FakeSheetsHandler(stand_in.StandInHTTPHandler):
+    def do_GET(self):
+        base_url = f"http://{self.headers.get('Host')}"
+        path = self.path.split("?", 1)[0]
+        if path == "/":
+            self.state.count("pages")
+            self.reply(200, (
+                f'<html><body><iframe src="{base_url}/spreadsheets/d/e/fake/pubhtml?gid=0&amp;single=true">'
+                f"</iframe></body></html>"
+            ).encode("utf-8"), "text/html; charset=utf-8")
+        elif path.endswith("/pubhtml"):
+            self.state.count("pages")
+            # Escaped the way Google's JS router writes its sheet URLs
+            items = "".join(
+                f'items.push({{name: "{sheet_name(i)}", pageUrl: "{base_url}/sheet/{i}", gid: "{1000 + i}"}});'
+                .replace("/", "\\/")
+                for i in self.state.sheets
+            )
+            self.reply(200, f"<script>var items = []; {items}</script>".encode("utf-8"), "text/html; charset=utf-8")
+        elif path.startswith("/sheet/"):
+            index = int(path[len("/sheet/"):])
+            if index in self.state.failing:
+                self.state.count("failed")
+                self.reply(500)
+                return
+            self.state.count("sheets")
+            self.reply(200, make_sheet_html(index).encode("utf-8"), "text/html; charset=utf-8")
+        else:
+            super().do_GET()
+
+def configure_environment(port: int, work_dir: str):
+    """Settings are read on first import of app.config, so this must run before any app import."""
+    defaults = {
+        "DATABASE_URL": f"sqlite:///{os.path.join(work_dir, 'partial.db')}",
+        "SCRAPER_PAGE_URL": f"http://127.0.0.1:{port}/",
+        "SCRAPER_SOURCE": "html",
+        "SCRAPER_SHEET_CACHE": "True",
+        "SCRAPER_REQUEST_TIMEOUT": "5",
+    }
+    for key, value in defaults.items():
+        os.environ.setdefault(key, value)
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--sheets", type=int, default=12, help="Sheets in the synthetic workbook")
+    arg_parser.add_argument("--port", type=int, default=9299)
+    args = arg_parser.parse_args()
+
+    logging.basicConfig(level=logging.CRITICAL)
+    work_dir = tempfile.mkdtemp(prefix="partial-scrape-")
+    configure_environment(args.port, work_dir)
+    server, state = stand_in.start_in_background(
+        stand_in.make_server(
+            stand_in.StandInHTTPServer, FakeSheetsHandler, FakeSheetsState(args.sheets), "127.0.0.1", args.port
+        ),
+        "fake-sheets"
+    )
+    # The scraper writes schedule.json (and the CSV) next to where it runs
+    os.chdir(work_dir)
+
+    from contextlib import redirect_stdout
+    from app.database import Schedule, SessionLocal, init_db
+    from app.scraper.extract_schedule import _sheet_cache
+    from app.services.scraper_service import scrape_and_save
+
+    init_db()
+    db = SessionLocal()
+    missing = sheet_name(1)
+    failures = []
+
+    def scrape(label: str, full_reload: bool = False, **expected) -> dict:
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+            result = scrape_and_save(db, full_reload=full_reload)
+        rows = db.query(Schedule).count()
+        missing_rows = db.query(Schedule).filter(Schedule.date == missing).count()
+        wrong = {key: result.get(key) for key, value in expected.items() if result.get(key) != value}
+        if result["status"] != "success" or wrong:
+            failures.append(label)
+        print(f"{label:<40} {'ok' if label not in failures else 'FAIL':<5} "
+              f"inserted {result.get('inserted', 0):>4}  deleted {result.get('deleted', 0):>4}  "
+              f"rows {rows:>4}  rows for {missing} {missing_rows:>3}"
+              + (f"  expected {expected}, got {wrong}" if wrong else ""))
+        return result
+
+    first = scrape("initial scrape", deleted=0)
+    scrape("unchanged rescrape", inserted=0, updated=0, deleted=0)
+
+    state.failing.add(1)
+    scrape(f"1 of {args.sheets} sheets failing, cache warm", inserted=0, updated=0, deleted=0)
+    _sheet_cache.clear()
+    scrape(f"1 of {args.sheets} sheets failing, cache cold", inserted=0, updated=0, deleted=0, failed_sheets=1)
+    _sheet_cache.clear()
+    scrape(f"1 of {args.sheets} sheets failing, full reload", inserted=0, updated=0, deleted=0, failed_sheets=1)
+
+    state.failing.clear()
+    scrape("sheet recovered", inserted=0, updated=0, deleted=0, failed_sheets=0)
+
+    state.sheets.remove(1)
+    removed = scrape("sheet removed from the workbook", inserted=0, updated=0)
+    if not removed.get("deleted"):
+        failures.append("sheet removed from the workbook")
+        print("  -> expected the removed sheet's rows to be deleted")
+
+    db.close()
+    server.shutdown()
+    print(f"{first['count']} records over {args.sheets} sheets; stand-in: {state.snapshot()}")
+    print("FAILED: " + ", ".join(failures) if failures else "All checks passed")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,170 @@
+"""
+Local stand-in for the FCM HTTP v1 and Instance ID (topic membership) APIs.
+
+Implements just enough of Google's endpoints to run the notification path offline:
+    POST /token                                OAuth2 token exchange (service account JWT grant)
+    POST /v1/projects/<project>/messages:send  token or topic messages
+    POST /iid/v1:batchAdd, /iid/v1:batchRemove topic membership
+    GET  /stats                                counters and topic sizes as JSON
+
+Tokens starting with "dead-" behave like uninstalled apps (UNREGISTERED / NOT_FOUND).
+A topic message counts one delivery per current member, the way FCM fans it out.
+With --error-rate, that share of sends and batchAdd/batchRemove calls fails
+with 500 INTERNAL (retryable).
+
+Usage (from backend/):
+    python -m benchmarks.fake_fcm --port 9099 --write-credentials /tmp/fake-firebase.json
+    python -m benchmarks.fake_fcm --port 9099 --latency-ms 30 --error-rate 0.01
+
+then run the app with
+    FCM_API_URL=http://127.0.0.1:9099 FCM_IID_URL=http://127.0.0.1:9099
+    FIREBASE_CREDENTIALS_PATH=/tmp/fake-firebase.json
+"""
+import argparse
+import json
+import re
+import sys
+import time
+
+from benchmarks import stand_in
+
+SEND_PATH = re.compile(r"^/v1/projects/[^/]+/messages:send$")
+
+class FakeFCMState(stand_in.StandInState):
+    """What the stand-in has received, shared by all handler threads."""
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0):
+        super().__init__(
+            ("token_requests", "token_messages", "topic_messages", "deliveries", "unregistered", "iid_calls"),
+            latency, error_rate
+        )
+        self.topics = {}  # topic -> set of tokens
+
+    def extra_stats(self) -> dict:
+        return {"topics": {topic: len(tokens) for topic, tokens in self.topics.items()}}
+
+class FakeFCMHandler(stand_in.StandInHTTPHandler):
+    def not_found(self):
+        self.send_json(404, {"error": {"code": 404, "status": "NOT_FOUND"}})
+
+    def do_POST(self):
+        body = self.read_body()
+        if self.state.latency:
+            time.sleep(self.state.latency)
+
+        if self.path == "/token":
+            self.state.count("token_requests")
+            self.send_json(200, {"access_token": f"fake-{time.time_ns()}", "expires_in": 3600, "token_type": "Bearer"})
+        elif SEND_PATH.match(self.path):
+            self._handle_send(json.loads(body)["message"])
+        elif self.path in ("/iid/v1:batchAdd", "/iid/v1:batchRemove"):
+            self._handle_batch(self.path.endswith("batchAdd"), json.loads(body))
+        else:
+            self.not_found()
+
+    def _inject_error(self) -> bool:
+        """Fail this request with a 500 if --error-rate says so."""
+        if self.state.inject_error():
+            self.send_json(500, {"error": {"code": 500, "status": "INTERNAL", "message": "Injected failure"}})
+            return True
+        return False
+
+    def _handle_send(self, message: dict):
+        if self._inject_error():
+            return
+
+        if "topic" in message:
+            with self.state.lock:
+                members = len(self.state.topics.get(message["topic"], ()))
+            self.state.count("topic_messages")
+            self.state.count("deliveries", members)
+            self.send_json(200, {"name": f"projects/fake/messages/{time.time_ns()}"})
+            return
+
+        self.state.count("token_messages")
+        if message.get("token", "").startswith("dead-"):
+            self.state.count("unregistered")
+            self.send_json(404, {"error": {
+                "code": 404,
+                "status": "NOT_FOUND",
+                "details": [{"@type": "type.googleapis.com/google.firebase.fcm.v1.FcmError", "errorCode": "UNREGISTERED"}]
+            }})
+            return
+        self.state.count("deliveries")
+        self.send_json(200, {"name": f"projects/fake/messages/{time.time_ns()}"})
+
+    def _handle_batch(self, add: bool, request: dict):
+        self.state.count("iid_calls")
+        if self._inject_error():
+            return
+        topic = request["to"].split("/topics/", 1)[-1]
+        results = []
+        with self.state.lock:
+            members = self.state.topics.setdefault(topic, set())
+            for token in request.get("registration_tokens", []):
+                if token.startswith("dead-"):
+                    results.append({"error": "NOT_FOUND"})
+                    continue
+                if add:
+                    members.add(token)
+                else:
+                    members.discard(token)
+                results.append({})
+        self.send_json(200, {"results": results})
+
+def make_server(host: str = "127.0.0.1", port: int = 9099, latency: float = 0.0, error_rate: float = 0.0):
+    """Create (but do not start) a stand-in server; returns (server, state)."""
+    return stand_in.make_server(
+        stand_in.StandInHTTPServer, FakeFCMHandler, FakeFCMState(latency, error_rate), host, port
+    )
+
+def start_in_background(host: str = "127.0.0.1", port: int = 9099, latency: float = 0.0, error_rate: float = 0.0):
+    """Serve from a daemon thread (for in-process tests and benchmarks); returns (server, state)."""
+    return stand_in.start_in_background(make_server(host, port, latency, error_rate), "fake-fcm")
+
+def write_credentials(path: str, base_url: str):
+    """Write a throwaway service account file whose token_uri points at the stand-in."""
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_key = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption()
+    ).decode("utf-8")
+    with open(path, "w") as f:
+        json.dump({
+            "type": "service_account",
+            "project_id": "iitjhealthcenter",
+            "private_key_id": "fake",
+            "private_key": private_key,
+            "client_email": "fake-fcm@iitjhealthcenter.iam.gserviceaccount.com",
+            "client_id": "0",
+            "token_uri": f"{base_url}/token"
+        }, f)
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--host", default="127.0.0.1")
+    arg_parser.add_argument("--port", type=int, default=9099)
+    arg_parser.add_argument("--latency-ms", type=float, default=0.0, help="Delay added to every request")
+    arg_parser.add_argument("--error-rate", type=float, default=0.0, help="Share of sends answered with 500")
+    arg_parser.add_argument("--write-credentials", metavar="PATH", help="Write a fake service account file for this server")
+    args = arg_parser.parse_args()
+
+    base_url = f"http://{args.host}:{args.port}"
+    if args.write_credentials:
+        write_credentials(args.write_credentials, base_url)
+        print(f"Wrote fake service account credentials to {args.write_credentials}")
+
+    server, _ = make_server(args.host, args.port, args.latency_ms / 1000, args.error_rate)
+    print(f"Fake FCM listening on {base_url} (stats at {base_url}/stats)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
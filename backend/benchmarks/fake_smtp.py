@@ -0,0 +1,143 @@
+"""
+Local SMTP stand-in that accepts and counts mail without delivering it.
+
+Speaks enough ESMTP for smtplib: EHLO/HELO, AUTH PLAIN/LOGIN (any credentials),
+MAIL, RCPT, DATA, RSET, NOOP and QUIT. No STARTTLS, so run the app with
+SMTP_STARTTLS=False. The --connect-ms and --auth-ms delays stand in for the
+TCP/TLS handshake and login round trips of a real provider. With --error-rate,
+that share of messages is rejected after DATA with a transient 454 (451/452
+would also trigger the app's throttling pause).
+
+Usage (from backend/):
+    python -m benchmarks.fake_smtp --port 2525 --connect-ms 150 --auth-ms 100
+    python -m benchmarks.fake_smtp --port 2525 --message-ms 5 --error-rate 0.01
+
+then run the app with
+    SMTP_HOST=127.0.0.1 SMTP_PORT=2525 SMTP_STARTTLS=False SMTP_USER=test SMTP_PASSWORD=test
+"""
+import argparse
+import socketserver
+import sys
+import time
+
+from benchmarks import stand_in
+
+class FakeSMTPState(stand_in.StandInState):
+    """Counters shared by all connection handlers."""
+
+    def __init__(self, connect_delay: float = 0.0, auth_delay: float = 0.0, message_delay: float = 0.0,
+                 error_rate: float = 0.0):
+        super().__init__(("connections", "logins", "messages", "recipients"), error_rate=error_rate)
+        self.connect_delay = connect_delay
+        self.auth_delay = auth_delay
+        self.message_delay = message_delay
+
+class FakeSMTPHandler(socketserver.StreamRequestHandler):
+    state = None  # Set by make_server()
+
+    def reply(self, line: str):
+        self.wfile.write(f"{line}\r\n".encode("utf-8"))
+
+    def read_line(self) -> str:
+        return self.rfile.readline().decode("utf-8", "replace").rstrip("\r\n")
+
+    def handle(self):
+        state = self.state
+        state.count("connections")
+        if state.connect_delay:
+            time.sleep(state.connect_delay)
+        self.reply("220 fake-smtp ESMTP ready")
+
+        recipients = 0
+        while True:
+            line = self.read_line()
+            if not line and self.rfile.closed:
+                return
+            command = line.split(" ", 1)[0].upper()
+
+            if command == "EHLO":
+                self.reply("250-fake-smtp")
+                self.reply("250-AUTH PLAIN LOGIN")
+                self.reply("250 8BITMIME")
+            elif command == "HELO":
+                self.reply("250 fake-smtp")
+            elif command == "AUTH":
+                parts = line.split()
+                if len(parts) >= 2 and parts[1].upper() == "LOGIN":
+                    # Username and password prompts
+                    if len(parts) < 3:
+                        self.reply("334 VXNlcm5hbWU6")
+                        self.read_line()
+                    self.reply("334 UGFzc3dvcmQ6")
+                    self.read_line()
+                elif len(parts) == 2:
+                    self.reply("334 ")
+                    self.read_line()
+                if state.auth_delay:
+                    time.sleep(state.auth_delay)
+                state.count("logins")
+                self.reply("235 2.7.0 Authentication successful")
+            elif command == "MAIL":
+                recipients = 0
+                self.reply("250 2.1.0 OK")
+            elif command == "RCPT":
+                recipients += 1
+                self.reply("250 2.1.5 OK")
+            elif command == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                while True:
+                    data_line = self.rfile.readline()
+                    if not data_line or data_line in (b".\r\n", b".\n"):
+                        break
+                if state.message_delay:
+                    time.sleep(state.message_delay)
+                if state.inject_error():
+                    self.reply("454 4.3.0 Injected failure")
+                    continue
+                state.count("messages")
+                state.count("recipients", recipients)
+                self.reply("250 2.0.0 Queued")
+            elif command in ("RSET", "NOOP"):
+                self.reply("250 2.0.0 OK")
+            elif command == "QUIT":
+                self.reply("221 2.0.0 Bye")
+                return
+            elif not line:
+                return
+            else:
+                self.reply("502 5.5.2 Command not recognized")
+
+def make_server(host: str = "127.0.0.1", port: int = 2525, connect_delay: float = 0.0,
+                auth_delay: float = 0.0, message_delay: float = 0.0, error_rate: float = 0.0):
+    """Create (but do not start) a stand-in server; returns (server, state)."""
+    state = FakeSMTPState(connect_delay, auth_delay, message_delay, error_rate)
+    return stand_in.make_server(stand_in.StandInTCPServer, FakeSMTPHandler, state, host, port)
+
+def start_in_background(host: str = "127.0.0.1", port: int = 2525, connect_delay: float = 0.0,
+                        auth_delay: float = 0.0, message_delay: float = 0.0, error_rate: float = 0.0):
+    """Serve from a daemon thread (for in-process tests and benchmarks); returns (server, state)."""
+    server_and_state = make_server(host, port, connect_delay, auth_delay, message_delay, error_rate)
+    return stand_in.start_in_background(server_and_state, "fake-smtp")
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--host", default="127.0.0.1")
+    arg_parser.add_argument("--port", type=int, default=2525)
+    arg_parser.add_argument("--connect-ms", type=float, default=0.0, help="Delay before the greeting (handshake cost)")
+    arg_parser.add_argument("--auth-ms", type=float, default=0.0, help="Delay per login")
+    arg_parser.add_argument("--message-ms", type=float, default=0.0, help="Delay per message")
+    arg_parser.add_argument("--error-rate", type=float, default=0.0, help="Share of messages rejected after DATA")
+    args = arg_parser.parse_args()
+
+    server, state = make_server(
+        args.host, args.port, args.connect_ms / 1000, args.auth_ms / 1000, args.message_ms / 1000, args.error_rate
+    )
+    print(f"Fake SMTP listening on {args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(state.snapshot())
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
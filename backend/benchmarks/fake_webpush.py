@@ -0,0 +1,95 @@
+"""
+Local stand-in for a browser push service (the endpoint of a Web Push subscription).
+
+    POST /push/<id>   accept an encrypted push message (201 Created)
+    GET  /stats       counters as JSON
+
+Endpoints whose <id> starts with "dead-" behave like unsubscribed browsers
+(410 Gone). With --error-rate, that share of messages fails with 503.
+Messages are not decrypted; only the VAPID Authorization header is checked.
+
+Usage (from backend/):
+    python -m benchmarks.fake_webpush --port 9199 --latency-ms 30 --error-rate 0.01
+
+and point subscriptions at it with make_subscription("http://127.0.0.1:9199", "<id>").
+"""
+import argparse
+import base64
+import os
+import sys
+import time
+
+from benchmarks import stand_in
+
+class FakeWebPushState(stand_in.StandInState):
+    """What the stand-in has received, shared by all handler threads."""
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0):
+        super().__init__(("messages", "gone", "unauthorized", "bytes"), latency, error_rate)
+
+class FakeWebPushHandler(stand_in.StandInHTTPHandler):
+    def do_POST(self):
+        body = self.read_body()
+        if self.state.latency:
+            time.sleep(self.state.latency)
+
+        if not self.path.startswith("/push/"):
+            self.not_found()
+        elif not self.headers.get("Authorization", "").startswith("vapid "):
+            self.state.count("unauthorized")
+            self.reply(401)
+        elif self.path[len("/push/"):].startswith("dead-"):
+            self.state.count("gone")
+            self.reply(410)
+        elif self.state.inject_error():
+            self.reply(503)
+        else:
+            self.state.count("messages")
+            self.state.count("bytes", len(body))
+            self.reply(201)
+
+def make_server(host: str = "127.0.0.1", port: int = 9199, latency: float = 0.0, error_rate: float = 0.0):
+    """Create (but do not start) a stand-in server; returns (server, state)."""
+    return stand_in.make_server(
+        stand_in.StandInHTTPServer, FakeWebPushHandler, FakeWebPushState(latency, error_rate), host, port
+    )
+
+def start_in_background(host: str = "127.0.0.1", port: int = 9199, latency: float = 0.0, error_rate: float = 0.0):
+    """Serve from a daemon thread (for in-process tests and benchmarks); returns (server, state)."""
+    return stand_in.start_in_background(make_server(host, port, latency, error_rate), "fake-webpush")
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+def subscription_keys() -> dict:
+    """A valid browser key pair ("p256dh" and "auth"), so messages can be encrypted."""
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+
+    public_key = ec.generate_private_key(ec.SECP256R1()).public_key().public_bytes(
+        serialization.Encoding.X962, serialization.PublicFormat.UncompressedPoint
+    )
+    return {"p256dh": _b64(public_key), "auth": _b64(os.urandom(16))}
+
+def make_subscription(base_url: str, subscription_id: str, keys: dict = None) -> dict:
+    """A PushSubscription JSON object whose endpoint is on the stand-in."""
+    return {"endpoint": f"{base_url}/push/{subscription_id}", "keys": keys or subscription_keys()}
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--host", default="127.0.0.1")
+    arg_parser.add_argument("--port", type=int, default=9199)
+    arg_parser.add_argument("--latency-ms", type=float, default=0.0, help="Delay added to every request")
+    arg_parser.add_argument("--error-rate", type=float, default=0.0, help="Share of messages answered with 503")
+    args = arg_parser.parse_args()
+
+    server, _ = make_server(args.host, args.port, args.latency_ms / 1000, args.error_rate)
+    print(f"Fake push service listening on http://{args.host}:{args.port} (stats at /stats)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
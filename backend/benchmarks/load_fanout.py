@@ -0,0 +1,250 @@
+"""
+End-to-end notification fan-out load test against local stand-ins.
+
+Starts the FCM (with OAuth token exchange), SMTP and Web Push stand-ins as
+separate processes, points the app at them through Settings (environment
+variables), seeds a fresh database with subscribers, FCM devices and a doctor
+starting soon, then runs check_and_notify and the outbox workers until the
+queue is drained. Reports per-channel sends/sec, p50/p99 delivery latency
+(enqueue to sent) and the peak memory of the app process.
+
+Rate limits default to unlimited here so the numbers show the fan-out path
+itself; export RATE_LIMIT_*_PER_SECOND (or any other setting) to override.
+
+Usage (from backend/):
+    python -m benchmarks.load_fanout
+    python -m benchmarks.load_fanout --recipients 10000 --latency-ms 50 --error-rate 0.02
+    python -m benchmarks.load_fanout --channels fcm --recipients 100000
+"""
+import argparse
+import json
+import logging
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from benchmarks import fake_fcm, fake_webpush
+
+CHANNELS = ("email", "webpush", "fcm")
+BATCH_SIZE = 5000
+
+def configure_environment(args, work_dir: str):
+    """Settings are read on first import of app.config, so this must run before any app import."""
+    credentials_path = os.path.join(work_dir, "fake-firebase.json")
+    fake_fcm.write_credentials(credentials_path, f"http://127.0.0.1:{args.fcm_port}")
+    defaults = {
+        "DATABASE_URL": args.database_url or f"sqlite:///{os.path.join(work_dir, 'load.db')}",
+        "FIREBASE_CREDENTIALS_PATH": credentials_path,
+        "FCM_API_URL": f"http://127.0.0.1:{args.fcm_port}",
+        "FCM_IID_URL": f"http://127.0.0.1:{args.fcm_port}",
+        "SMTP_HOST": "127.0.0.1",
+        "SMTP_PORT": str(args.smtp_port),
+        "SMTP_STARTTLS": "False",
+        "SMTP_USER": "load",
+        "SMTP_PASSWORD": "load",
+        "SMTP_FROM": "load@example.com",
+        "OUTBOX_POLL_SECONDS": "0.2",
+        "OUTBOX_RETRY_BASE_SECONDS": "1",
+        "OUTBOX_RETRY_MAX_SECONDS": "5",
+        "RATE_LIMIT_EMAIL_PER_SECOND": "0",
+        "RATE_LIMIT_WEBPUSH_PER_SECOND": "0",
+        "RATE_LIMIT_FCM_PER_SECOND": "0",
+        "NOTIFICATION_PLANNER": "False",
+    }
+    for key, value in defaults.items():
+        os.environ.setdefault(key, value)
+
+def start_stand_ins(args) -> list:
+    """Run each stand-in in its own process, so it neither shares our GIL nor counts toward our memory."""
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    commands = [
+        (args.fcm_port, ["benchmarks.fake_fcm", "--port", str(args.fcm_port),
+                         "--latency-ms", str(args.latency_ms), "--error-rate", str(args.error_rate)]),
+        (args.smtp_port, ["benchmarks.fake_smtp", "--port", str(args.smtp_port),
+                          "--message-ms", str(args.smtp_message_ms), "--error-rate", str(args.error_rate)]),
+        (args.push_port, ["benchmarks.fake_webpush", "--port", str(args.push_port),
+                          "--latency-ms", str(args.latency_ms), "--error-rate", str(args.error_rate)]),
+    ]
+    processes = []
+    for port, command in commands:
+        processes.append(subprocess.Popen(
+            [sys.executable, "-m", *command], cwd=backend_dir, stdout=subprocess.DEVNULL
+        ))
+        wait_for_port(port)
+    return processes
+
+def wait_for_port(port: int, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Stand-in on port {port} did not start")
+            time.sleep(0.05)
+
+def seed(db, args) -> list:
+    """Insert subscribers, FCM devices and the doctors starting soon; returns the doctor names."""
+    from sqlalchemy import insert
+    from app.database import DoctorSubscription, FCMToken, Schedule, Subscription
+
+    now = datetime.now()
+    start_minute = min(now.hour * 60 + now.minute + args.lead_minutes, 24 * 60 - 1)
+    timing = f"{datetime(2000, 1, 1, start_minute // 60, start_minute % 60):%I:%M %p} to 11:59 PM"
+    doctors = [f"Dr. Load {i}" for i in range(args.doctors)]
+    db.execute(insert(Schedule), [
+        {
+            "date": now.strftime("%d/%m/%Y %A").upper(),
+            "name": name,
+            "timing": timing,
+            "category": "Regular/Dentist",
+            "room": "Room 1",
+            "schedule_date": now.date(),
+            "start_minute": start_minute,
+            "end_minute": 24 * 60 - 1,
+        }
+        for name in doctors
+    ])
+
+    # One browser key pair for everyone: encryption still runs per message
+    keys = fake_webpush.subscription_keys()
+    push_url = f"http://127.0.0.1:{args.push_port}"
+    dead_every = int(1 / args.dead_rate) if args.dead_rate else 0
+
+    def name(i: int) -> str:
+        return f"dead-{i}" if dead_every and i % dead_every == 0 else str(i)
+
+    for start in range(0, args.recipients, BATCH_SIZE):
+        ids = range(start, min(start + BATCH_SIZE, args.recipients))
+        if "email" in args.channels or "webpush" in args.channels:
+            db.execute(insert(Subscription), [
+                {
+                    "email": f"user{i}@example.com" if "email" in args.channels else None,
+                    "push_subscription": json.dumps(fake_webpush.make_subscription(push_url, name(i), keys))
+                    if "webpush" in args.channels else None,
+                    "is_active": True,
+                }
+                for i in ids
+            ])
+        if "fcm" in args.channels:
+            db.execute(insert(FCMToken), [
+                {"device_id": f"device-{i}", "fcm_token": f"{name(i)}-token"} for i in ids
+            ])
+            db.execute(insert(DoctorSubscription), [
+                {"device_id": f"device-{i}", "doctor_name": doctors[i % len(doctors)]} for i in ids
+            ])
+    db.commit()
+    return doctors
+
+def percentile(values: list, q: float) -> float:
+    """Nearest-rank percentile of sorted values."""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, int(round(q / 100 * len(values))) - 1))]
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def report(db, started: datetime, elapsed: float):
+    from app.database import NotificationDelivery
+
+    rows = db.query(
+        NotificationDelivery.channel, NotificationDelivery.status,
+        NotificationDelivery.created_at, NotificationDelivery.sent_at
+    ).filter(NotificationDelivery.created_at >= started).all()
+
+    channels = {}
+    for channel, status, created_at, sent_at in rows:
+        stats = channels.setdefault(channel, {"sent": 0, "dead": 0, "other": 0, "latencies": [], "last": None})
+        if status == "sent":
+            stats["sent"] += 1
+            stats["latencies"].append((sent_at - created_at).total_seconds() * 1000)
+            stats["last"] = max(stats["last"] or sent_at, sent_at)
+        elif status == "dead":
+            stats["dead"] += 1
+        else:
+            stats["other"] += 1
+
+    print(f"{'channel':<10}{'sent':>10}{'dead':>8}{'left':>8}{'sends/sec':>12}{'p50 ms':>10}{'p99 ms':>10}")
+    for channel, stats in sorted(channels.items()):
+        latencies = sorted(stats["latencies"])
+        duration = (stats["last"] - started).total_seconds() if stats["last"] else 0
+        rate = stats["sent"] / duration if duration else 0
+        print(f"{channel:<10}{stats['sent']:>10}{stats['dead']:>8}{stats['other']:>8}{rate:>12.1f}"
+              f"{percentile(latencies, 50):>10.0f}{percentile(latencies, 99):>10.0f}")
+
+    total_sent = sum(stats["sent"] for stats in channels.values())
+    print(f"{'all':<10}{total_sent:>10}{'':>16}{total_sent / elapsed:>12.1f}")
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--recipients", type=int, default=100000, help="Subscribers and FCM devices each")
+    arg_parser.add_argument("--doctors", type=int, default=1, help="Doctors starting soon (devices are split among them)")
+    arg_parser.add_argument("--channels", nargs="+", choices=CHANNELS, default=list(CHANNELS))
+    arg_parser.add_argument("--lead-minutes", type=int, default=30, help="How soon the doctors start")
+    arg_parser.add_argument("--latency-ms", type=float, default=20.0, help="FCM and push service response delay")
+    arg_parser.add_argument("--smtp-message-ms", type=float, default=5.0, help="SMTP per-message delay")
+    arg_parser.add_argument("--error-rate", type=float, default=0.0, help="Share of sends failing transiently")
+    arg_parser.add_argument("--dead-rate", type=float, default=0.01, help="Share of dead tokens and subscriptions")
+    arg_parser.add_argument("--timeout", type=float, default=1800.0, help="Give up after this many seconds")
+    arg_parser.add_argument("--database-url", help="Default: a temporary SQLite file")
+    arg_parser.add_argument("--fcm-port", type=int, default=9099)
+    arg_parser.add_argument("--smtp-port", type=int, default=2525)
+    arg_parser.add_argument("--push-port", type=int, default=9199)
+    args = arg_parser.parse_args()
+
+    # Injected failures are expected; the stand-in stats count them
+    logging.basicConfig(level=logging.CRITICAL)
+    work_dir = tempfile.mkdtemp(prefix="load-fanout-")
+    configure_environment(args, work_dir)
+    processes = start_stand_ins(args)
+
+    from app.database import SessionLocal, init_db
+    from app.services.delivery_ledger import queue_metrics
+    from app.services.notification_service import check_and_notify
+    from app.services.outbox import outbox
+
+    try:
+        init_db()
+        db = SessionLocal()
+        start = time.perf_counter()
+        doctors = seed(db, args)
+        print(f"Seeded {args.recipients} recipients per channel ({', '.join(args.channels)}), "
+              f"{len(doctors)} doctor(s) in {time.perf_counter() - start:.1f}s; "
+              f"peak RSS {peak_rss_mb():.0f} MB")
+
+        outbox.start()
+        started = datetime.utcnow() - timedelta(seconds=1)
+        start = time.perf_counter()
+        check_and_notify(db)
+        print(f"check_and_notify queued {queue_metrics(db)['depth']} messages in {time.perf_counter() - start:.1f}s")
+
+        deadline = start + args.timeout
+        while queue_metrics(db)["depth"] and time.perf_counter() < deadline:
+            time.sleep(0.5)
+        elapsed = time.perf_counter() - start
+        outbox.stop()
+
+        print(f"Drained in {elapsed:.1f}s" if not queue_metrics(db)["depth"] else f"Timed out after {elapsed:.1f}s")
+        report(db, started, elapsed)
+        print(f"Peak RSS {peak_rss_mb():.0f} MB")
+
+        import requests
+        for name, port in (("fcm", args.fcm_port), ("webpush", args.push_port)):
+            print(f"{name} stand-in: {requests.get(f'http://127.0.0.1:{port}/stats', timeout=5).json()}")
+        db.close()
+    finally:
+        for process in processes:
+            process.terminate()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
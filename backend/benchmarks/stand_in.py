@@ -0,0 +1,94 @@
+"""
+Shared scaffolding for the local stand-in servers (fake_fcm, fake_webpush, fake_smtp).
+
+Each stand-in only defines its protocol handler and counters; the threaded
+servers, the shared counter state, the keep-alive JSON handler base and the
+make/start helpers live here.
+"""
+import json
+import random
+import socketserver
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class StandInState:
+    """Counters and knobs shared by all handler threads of one stand-in."""
+
+    def __init__(self, counters: tuple, latency: float = 0.0, error_rate: float = 0.0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.lock = threading.Lock()
+        self.stats = dict.fromkeys(counters, 0)
+        self.stats["injected_errors"] = 0
+
+    def count(self, key: str, amount: int = 1):
+        with self.lock:
+            self.stats[key] += amount
+
+    def inject_error(self) -> bool:
+        """Whether this request should fail, per error_rate (counted as injected_errors)."""
+        if self.error_rate and random.random() < self.error_rate:
+            self.count("injected_errors")
+            return True
+        return False
+
+    def extra_stats(self) -> dict:
+        """Stand-in specific additions to snapshot() (called under the lock)."""
+        return {}
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {**self.stats, **self.extra_stats()}
+
+class StandInHTTPHandler(BaseHTTPRequestHandler):
+    """Keep-alive HTTP handler base: quiet logging, body/JSON helpers and GET /stats."""
+
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the real services
+    state = None  # Set by make_server()
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status: int, body: bytes = b"", content_type: str = "text/plain"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, status: int, payload: dict):
+        self.reply(status, json.dumps(payload).encode("utf-8"), "application/json")
+
+    def read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def not_found(self):
+        self.reply(404)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self.send_json(200, self.state.snapshot())
+        else:
+            self.not_found()
+
+class _StandInServerMixin:
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 1024  # listen() backlog, so bursts of new connections are not reset
+
+class StandInHTTPServer(_StandInServerMixin, ThreadingHTTPServer):
+    pass
+
+class StandInTCPServer(_StandInServerMixin, socketserver.ThreadingTCPServer):
+    pass
+
+def make_server(server_class, handler_class, state: StandInState, host: str, port: int):
+    """Create (but do not start) a stand-in server whose handlers share `state`; returns (server, state)."""
+    handler = type(f"Bound{handler_class.__name__}", (handler_class,), {"state": state})
+    return server_class((host, port), handler), state
+
+def start_in_background(server_and_state: tuple, name: str):
+    """Serve from a daemon thread (for in-process tests and benchmarks); returns (server, state)."""
+    server, state = server_and_state
+    threading.Thread(target=server.serve_forever, name=name, daemon=True).start()
+    return server, state
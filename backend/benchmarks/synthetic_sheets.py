@@ -0,0 +1,75 @@
+"""
+Synthetic Google Sheets pages shaped like the published health center schedule.
+
+Used by the benchmarks when no recorded sheet pages are given.
+"""
+import random
+
+DAYS = ["MONDAY", "TUESDAY", "WEDNESDAY", "THURSDAY", "FRIDAY", "SATURDAY", "SUNDAY"]
+SPECIALITIES = ["ENT", "Dermatology", "Orthopaedics", "Gynaecology", "Psychiatry"]
+
+def sheet_name(index: int) -> str:
+    """Sheet titles look like '31/01/2026 SATURDAY'."""
+    return f"{1 + index % 28:02d}/{1 + (index // 28) % 12:02d}/2026 {DAYS[index % 7]}"
+
+def _row(number: int, cells: list) -> str:
+    return (
+        f'<tr style="height: 20px"><th id="0R{number}" style="height: 20px;" class="row-headers-background">'
+        f'<div class="row-header-wrapper" style="line-height: 20px">{number}</div></th>'
+        + "".join(cells)
+        + "</tr>"
+    )
+
+def make_sheet_html(index: int, doctors: int = 8, seed: int = 0) -> str:
+    """
+    Build one published sheet with a regular and a visiting doctors block.
+
+    Includes the quirks seen in real pages: a letter header row, merged title
+    cells, a hidden column, <br> inside cells, rowspans and empty filler rows.
+    """
+    rng = random.Random(seed * 100003 + index)
+    letters = "ABCDEFGHIJK"
+    head = (
+        '<thead><tr><th class="row-header freezebar-origin-ltr"></th>'
+        + "".join(f'<th id="0C{i}" style="width:100px;" class="column-headers-background">{c}</th>' for i, c in enumerate(letters))
+        + "</tr></thead>"
+    )
+    rows = [
+        _row(1, [
+            '<td class="s0" dir="ltr" colspan="4">REGULAR DOCTORS/ DENTIST</td>',
+            '<td class="s0" dir="ltr" colspan="5">VISITING SPECIALISTS DOCTORS</td>',
+            '<td class="s1"></td>',
+            '<td class="s1" style="display:none;">hidden</td>',
+        ]),
+        _row(2, [f'<td class="s2">{text}</td>' for text in [
+            "S.NO", "DOCTOR'S NAME", "ROOM", "TIMING",
+            "S.NO", "DOCTOR'S NAME", "SPECIALITY", "ROOM", "TIMING", "",
+        ]]),
+    ]
+    for r in range(doctors):
+        start = rng.choice(["08:00 AM", "09:30 AM", "10:00 AM", "02:00 PM", "04:30 PM"])
+        end = rng.choice(["01:00 PM", "01:30 PM", "05:00 PM", "07:00 PM"])
+        regular = [str(r + 1), f"Dr. Regular {index}-{r}", f"Room {rng.randint(1, 12)}", f"{start} to {end}"]
+        if r % 3 == 2:
+            regular = ["", "", "", ""]
+        if r % 2 == 0:
+            visiting = [
+                str(r // 2 + 1),
+                f"Dr. Visiting {index}-{r}<br>(MBBS, MD)",
+                rng.choice(SPECIALITIES),
+                "OPD",
+                f"{start}-{end}",
+            ]
+        else:
+            visiting = ["", "", "", "", ""]
+        cells = [f'<td class="s3" dir="ltr">{text}</td>' for text in regular + visiting]
+        cells.append('<td class="s3"></td>')
+        rows.append(_row(3 + r, cells))
+    for filler in range(3):
+        rows.append(_row(3 + doctors + filler, ['<td class="s4"></td>'] * 10))
+    return (
+        '<html><head><meta charset="utf-8"><style>.s0{font-weight:bold}.s1{color:#000}</style></head>'
+        f'<body><div id="sheets-viewport"><div id="{index}" style="position:relative;">'
+        '<div class="ritz grid-container" dir="ltr"><table class="waffle" cellspacing="0" cellpadding="0">'
+        f'{head}<tbody>{"".join(rows)}</tbody></table></div></div></div></body></html>'
+    )